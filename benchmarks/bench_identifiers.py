@@ -0,0 +1,79 @@
+"""
+Compares calculate_identifier with the batch variant calculate_identifiers of
+:class:`~pycoshark.mongomodels.CodeEntityState` and :class:`~pycoshark.mongomodels.CodeGroupState`.
+
+Usage: python benchmarks/bench_identifiers.py [--size N]
+"""
+
+import argparse
+
+from bson import ObjectId
+
+from common import measure, print_results
+from pycoshark.mongomodels import CodeEntityState, CodeGroupState
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the batch identifier hashing")
+    parser.add_argument("--size", help="Number of identifiers", default=1000000, type=int)
+    parser.add_argument("--repeat", help="Number of repetitions of each measurement", default=3, type=int)
+    args = parser.parse_args()
+
+    # the entities of a commit and file are consecutive; plugins usually share the id objects of a commit and file,
+    # while ids that are read from the database are distinct objects
+    commit_ids = [ObjectId() for _ in range(10)]
+    file_ids = [ObjectId() for _ in range(100)]
+    layouts = {
+        "shared ids": lambda oid: oid,
+        "decoded ids": lambda oid: ObjectId(oid.binary),
+    }
+    for layout, copy_id in layouts.items():
+        entities = [
+            (
+                "org.example.package%i.Class%i.method%i()" % (i % 50, i % 1000, i),
+                copy_id(commit_ids[i * 10 // args.size]),
+                copy_id(file_ids[(i // 30) % 100]),
+            )
+            for i in range(args.size)
+        ]
+        groups = [(long_name, commit_id) for long_name, commit_id, _ in entities]
+        benchmark_identifiers(layout, entities, groups, args.repeat)
+
+
+def benchmark_identifiers(layout, entities, groups, repeat):
+    assert CodeEntityState.calculate_identifiers(entities) == [
+        CodeEntityState.calculate_identifier(*entity) for entity in entities
+    ]
+    assert CodeGroupState.calculate_identifiers(groups) == [
+        CodeGroupState.calculate_identifier(*group) for group in groups
+    ]
+
+    results = {
+        "CodeEntityState.calculate_identifier": measure(
+            lambda: [CodeEntityState.calculate_identifier(*entity) for entity in entities], repeat
+        ),
+        "CodeEntityState.calculate_identifiers": measure(
+            lambda: CodeEntityState.calculate_identifiers(entities), repeat
+        ),
+    }
+    print_results(
+        "hashing %i code entity states (%s)" % (len(entities), layout),
+        results,
+        baseline="CodeEntityState.calculate_identifier",
+    )
+
+    results = {
+        "CodeGroupState.calculate_identifier": measure(
+            lambda: [CodeGroupState.calculate_identifier(*group) for group in groups], repeat
+        ),
+        "CodeGroupState.calculate_identifiers": measure(lambda: CodeGroupState.calculate_identifiers(groups), repeat),
+    }
+    print_results(
+        "hashing %i code group states (%s)" % (len(groups), layout),
+        results,
+        baseline="CodeGroupState.calculate_identifier",
+    )
+
+
+if __name__ == "__main__":
+    main()
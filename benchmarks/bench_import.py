@@ -0,0 +1,79 @@
+"""
+Measures the import time of pycoSHARK with ``python -X importtime`` in fresh interpreters, e.g., to check that the
+startup of plugins that only use the argument parser does not load heavy dependencies.
+
+Usage: python benchmarks/bench_import.py [--repeat N] [--output results.json]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+STATEMENTS = {
+    "import pycoshark.mongomodels": "import pycoshark.mongomodels",
+    "import pycoshark.utils": "import pycoshark.utils",
+    "argument parser": (
+        "from pycoshark.utils import get_base_argparser, create_mongodb_uri_string; "
+        "get_base_argparser('benchmark', '1.0').parse_args([])"
+    ),
+}
+
+# dependencies that must not be loaded by the statements
+LAZY_MODULES = ("networkx", "textdistance", "numpy")
+
+
+def measure_import(statement):
+    """
+    Runs a statement in a fresh interpreter with -X importtime.
+
+    :return: tuple of the total import time in seconds, the cumulative import times of the modules that are imported
+    by the top-level imports in seconds, and the lazily loaded modules that were imported
+    """
+    check = "import sys; print(','.join(m for m in %r if m in sys.modules))" % (LAZY_MODULES,)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "%s; %s" % (statement, check)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0
+    second_level = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # nested imports are indented by two spaces per level
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        if level == 0:
+            total += int(cumulative) / 1e6
+        elif level == 1:
+            second_level[name.strip()] = second_level.get(name.strip(), 0) + int(cumulative) / 1e6
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    return total, second_level, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the import time of pycoSHARK")
+    parser.add_argument("--repeat", help="Number of interpreters per statement", default=5, type=int)
+    parser.add_argument("--top", help="Number of the slowest nested imports that are shown", default=5, type=int)
+    parser.add_argument("--output", help="Path of a JSON file for the results", default=None)
+    args = parser.parse_args()
+
+    results = {}
+    for title, statement in STATEMENTS.items():
+        runs = [measure_import(statement) for _ in range(args.repeat)]
+        total, imports, loaded = min(runs, key=lambda run: run[0])
+        results[title] = {"seconds": total, "imports": imports, "lazy_modules_loaded": loaded}
+        print("%-30s %8.4f s  lazy modules loaded: %s" % (title, total, ", ".join(loaded) or "none"))
+        for name, seconds in sorted(imports.items(), key=lambda item: -item[1])[: args.top]:
+            print("    %-40s %8.4f s" % (name, seconds))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print("results written to %s" % args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Compares iterating over mongoengine documents with the fast read path of
+:meth:`~pycoshark.mongomodels.SmartSHARKQuerySet.records`.
+
+Usage: python benchmarks/bench_records.py [--mock] [--size N]
+"""
+
+import datetime
+
+from bson import ObjectId
+
+from common import connect_benchmark_db, get_benchmark_argparser, measure, print_results
+from pycoshark.mongomodels import Commit
+
+
+def seed_commits(size):
+    vcs_system_id = ObjectId()
+    now = datetime.datetime(2020, 1, 1)
+    collection = Commit._get_collection()
+    collection.drop()
+    commits = []
+    for i in range(size):
+        commits.append(
+            {
+                "vcs_system_ids": [vcs_system_id],
+                "revision_hash": "%040x" % i,
+                "parents": ["%040x" % (i - 1)] if i else [],
+                "author_id": ObjectId(),
+                "author_date": now,
+                "committer_id": ObjectId(),
+                "committer_date": now,
+                "message": "commit message %i" % i,
+                "labels": {"adjustedszz_bugfix": i % 7 == 0},
+            }
+        )
+        if len(commits) == 10000:
+            collection.insert_many(commits)
+            commits = []
+    if commits:
+        collection.insert_many(commits)
+    return vcs_system_id
+
+
+def main():
+    args = get_benchmark_argparser("Benchmark of the fast read path").parse_args()
+    connect_benchmark_db(args)
+    vcs_system_id = seed_commits(args.size)
+    fields = ("id", "revision_hash", "parents", "committer_date")
+
+    def documents():
+        for c in Commit.objects(vcs_system_ids=vcs_system_id):
+            c.revision_hash
+
+    def documents_only():
+        for c in Commit.objects(vcs_system_ids=vcs_system_id).only(*fields):
+            c.revision_hash
+
+    def records():
+        for c in Commit.objects(vcs_system_ids=vcs_system_id).records():
+            c.revision_hash
+
+    def records_only():
+        for c in Commit.objects(vcs_system_ids=vcs_system_id).records(*fields):
+            c.revision_hash
+
+    results = {
+        "documents": measure(documents, args.repeat),
+        "records": measure(records, args.repeat),
+        "documents with only()": measure(documents_only, args.repeat),
+        "records with fields": measure(records_only, args.repeat),
+    }
+    print_results("iterating over %i commits" % args.size, results, baseline="documents")
+    Commit._get_collection().drop()
+
+
+if __name__ == "__main__":
+    main()
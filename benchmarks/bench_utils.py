@@ -0,0 +1,209 @@
+"""
+Benchmarks of the data access helpers of :mod:`pycoshark.utils` on synthetic projects of several sizes.
+
+For each helper, the best wall time, the number of database commands, and the peak memory of the Python allocations
+are measured. The number of commands is only available with a mongod, because mongomock does not emit command events.
+The results are printed and written as JSON, such that runs can be compared.
+
+Usage: python benchmarks/bench_utils.py [--mock] [--sizes 100,1000] [--output results.json]
+"""
+
+import contextlib
+import datetime
+import io
+import json
+import platform
+import time
+import tracemalloc
+
+# the profiling listener must be registered before the database is connected
+from pycoshark import profiling
+
+from common import connect_benchmark_db, get_benchmark_argparser
+from pycoshark import utils
+from pycoshark.cache import clear_reference_caches
+from pycoshark.mongomodels import Issue, Project
+from pycoshark.synthetic import DatasetGenerator
+
+COPY_DB_SUFFIX = "_copy"
+# personal data is not copied by copy_projects and not deleted by delete_projects
+PERSONAL_COLLECTIONS = ("people", "identity")
+
+
+def seed_project(name, commits, seed):
+    """
+    Creates a synthetic project, see :class:`~pycoshark.synthetic.DatasetGenerator`.
+
+    :return: dict with the ids and names that are needed by the benchmarks
+    """
+    generator = DatasetGenerator(seed=seed)
+    project = generator.generate_project(name, commits=commits)
+    generator.flush()
+    return {
+        "project_name": name,
+        "vcs_system_id": project["vcs_system_id"],
+        "rename_commit": project["rename_revision_hashes"][0],
+        # issues without resolution are checked through their events
+        "issue": Issue.objects(id__in=project["issue_ids"], resolution=None).first(),
+    }
+
+
+def count_documents(db):
+    """
+    :return: dict with the names of the collections without personal data as keys and their numbers of documents as
+    values
+    """
+    return {
+        name: db[name].count_documents({})
+        for name in sorted(db.list_collection_names())
+        if name not in PERSONAL_COLLECTIONS
+    }
+
+
+def check_copy(source_db, target_db):
+    """
+    Checks that all documents of the source database were copied, such that the copy is not timed as no-op.
+    """
+    source, target = count_documents(source_db), count_documents(target_db)
+    missing = {name: (count, target.get(name, 0)) for name, count in source.items() if target.get(name, 0) != count}
+    if missing:
+        raise RuntimeError("copy_projects did not copy all documents (source, copy): %s" % missing)
+
+
+def check_deleted(db):
+    """
+    Checks that all documents of the project were deleted, such that the deletion is not timed as no-op.
+    """
+    remaining = {name: count for name, count in count_documents(db).items() if count}
+    if remaining:
+        raise RuntimeError("delete_projects did not delete all documents: %s" % remaining)
+
+
+def benchmark(func, repeat, setup=None, check=None):
+    """
+    Runs func repeat times and measures the best wall time, the commands of the last run, and the peak memory. The
+    reference caches are cleared before each run, such that every run starts cold. If check is given, it is called
+    after each run and should raise if the run did not do its work.
+
+    :return: dict with the results
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            if setup is not None:
+                setup()
+            clear_reference_caches()
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        if check is not None:
+            check()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        if setup is not None:
+            setup()
+        clear_reference_caches()
+    with contextlib.redirect_stdout(io.StringIO()), profiling.profile() as profile:
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    if check is not None:
+        check()
+    totals = profile.totals()
+    return {
+        "seconds": best,
+        "commands": totals.commands,
+        "documents": totals.documents,
+        "peak_memory_bytes": peak,
+    }
+
+
+def connection_kwargs(args, prefix):
+    return {
+        prefix + "user": args.db_user,
+        prefix + "password": args.db_password,
+        prefix + "hostname": args.db_hostname,
+        prefix + "port": args.db_port,
+        prefix + "authentication_db": args.db_authentication,
+        prefix + "ssl": args.ssl,
+    }
+
+
+def main():
+    parser = get_benchmark_argparser("Benchmarks of the data access helpers of pycoshark.utils")
+    parser.add_argument(
+        "--sizes", help="Comma separated list of the numbers of commits per project", default="100,1000,5000"
+    )
+    parser.add_argument("--seed", help="Seed of the synthetic data", default=42, type=int)
+    parser.add_argument("--output", help="Path of the JSON file with the results", default="bench_utils.json")
+    args = parser.parse_args()
+    connect_benchmark_db(args)
+    db = Project._get_db()
+    client = db.client
+    copy_db = args.db_database + COPY_DB_SUFFIX
+
+    runs = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        client.drop_database(args.db_database)
+        name = "bench%i" % size
+        seed_start = time.perf_counter()
+        seeded = seed_project(name, size, args.seed)
+        print("seeded project %s with %i commits in %.1fs" % (name, size, time.perf_counter() - seed_start))
+
+        def drop_copy():
+            client.drop_database(copy_db)
+
+        def copy_project():
+            utils.copy_projects(
+                projects=[name],
+                source_dbname=args.db_database,
+                target_dbname=copy_db,
+                **connection_kwargs(args, "source_"),
+                **connection_kwargs(args, "target_"),
+            )
+
+        results = {
+            "get_commit_graph": benchmark(lambda: utils.get_commit_graph(seeded["vcs_system_id"]), args.repeat),
+            "git_tag_filter": benchmark(lambda: utils.git_tag_filter(name), args.repeat),
+            "heuristic_renames": benchmark(
+                lambda: utils.heuristic_renames(seeded["vcs_system_id"], seeded["rename_commit"]), args.repeat
+            ),
+            "jira_is_resolved_and_fixed": benchmark(
+                lambda: utils.jira_is_resolved_and_fixed(seeded["issue"]), args.repeat
+            ),
+            "copy_projects": benchmark(
+                copy_project, args.repeat, setup=drop_copy, check=lambda: check_copy(db, client[copy_db])
+            ),
+            "delete_projects": benchmark(
+                lambda: utils.delete_projects(projects=[name], db_name=copy_db, **connection_kwargs(args, "db_")),
+                args.repeat,
+                setup=lambda: (drop_copy(), copy_project()),
+                check=lambda: check_deleted(client[copy_db]),
+            ),
+        }
+        print("project with %i commits" % size)
+        for helper, result in results.items():
+            commands = "-" if args.mock else "%i" % result["commands"]
+            print(
+                "  %-30s %10.4f s %10s commands %10.2f MB peak"
+                % (helper, result["seconds"], commands, result["peak_memory_bytes"] / 1024 / 1024)
+            )
+        runs.append({"commits": size, "results": results})
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "mock": args.mock,
+                "python": platform.python_version(),
+                "timestamp": datetime.datetime.now().isoformat(),
+                "runs": runs,
+            },
+            f,
+            indent=2,
+        )
+    print("results written to %s" % args.output)
+
+
+if __name__ == "__main__":
+    main()
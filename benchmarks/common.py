@@ -0,0 +1,75 @@
+"""
+Shared helpers for the benchmarks in this directory.
+
+The benchmarks run against the database given by the usual database arguments of
+:func:`~pycoshark.utils.get_base_argparser`. With --mock, they run against an in-process mongomock database instead,
+which is useful to compare the client side costs without a running mongod.
+"""
+
+import time
+
+from mongoengine import connect, disconnect
+
+from pycoshark import utils
+from pycoshark.utils import create_mongodb_uri_string, get_base_argparser
+
+BENCHMARK_DB = "smartshark_benchmark"
+
+
+def get_benchmark_argparser(description):
+    parser = get_base_argparser(description, "benchmark")
+    parser.set_defaults(db_database=BENCHMARK_DB)
+    parser.add_argument("--mock", help="Use an in-process mongomock database", default=False, action="store_true")
+    parser.add_argument("--size", help="Number of documents that are generated", default=100000, type=int)
+    parser.add_argument("--repeat", help="Number of repetitions of each measurement", default=3, type=int)
+    return parser
+
+
+def connect_benchmark_db(args):
+    """
+    Connects mongoengine to the benchmark database.
+    """
+    disconnect()
+    if args.mock:
+        import mongomock
+        from mongomock.gridfs import enable_gridfs_integration
+        from mongomock.store import ServerStore
+
+        store = ServerStore()
+
+        class SharedMongoClient(mongomock.MongoClient):
+            # all clients see the same data, like clients of the same mongod
+            def __init__(self, *client_args, **client_kwargs):
+                client_kwargs["_store"] = store
+                super().__init__(*client_args, **client_kwargs)
+
+        # helpers that connect with pymongo directly, e.g., copy_projects, use the same in-process database
+        utils.MongoClient = SharedMongoClient
+        enable_gridfs_integration()
+        connect(args.db_database, mongo_client_class=SharedMongoClient)
+    else:
+        uri = create_mongodb_uri_string(
+            args.db_user, args.db_password, args.db_hostname, args.db_port, args.db_authentication, args.ssl
+        )
+        connect(args.db_database, host=uri)
+
+
+def measure(func, repeat=3):
+    """
+    :return: the best wall time of func in seconds over repeat runs
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def print_results(title, results, baseline=None):
+    print(title)
+    for name, seconds in results.items():
+        line = "  %-40s %10.4f s" % (name, seconds)
+        if baseline is not None and seconds > 0:
+            line += "  (%.1fx)" % (results[baseline] / seconds)
+        print(line)
@@ -0,0 +1,457 @@
+"""
+Asynchronous variants of the data access helpers in :mod:`pycoshark.utils`.
+
+The helpers in this module do not use the global connection state of mongoengine. Instead, they get an asynchronous
+database, e.g., from a client created with :func:`create_async_mongo_client`, and issue their queries concurrently.
+Thus, multiple analyses can share one event loop::
+
+    client = create_async_mongo_client(uri)
+    db = client["smartshark"]
+    graphs = await asyncio.gather(*[get_commit_graph(db, vcs_system_id) for vcs_system_id in vcs_system_ids])
+
+The helpers work with the asynchronous client of pymongo (pymongo>=4.9) and with motor. Since they only use the
+common subset of both APIs, drivers that mimic them for local testing (e.g., mongomock-motor) work as well.
+"""
+
+import asyncio
+import collections
+
+from pymongo.errors import BulkWriteError
+
+from pycoshark.mongomodels import Commit, File, FileAction, IssueEvent, Project, Tag, VCSSystem
+from pycoshark.utils import (
+    _MANUAL_CORRECTIONS,
+    _jira_events_resolved_and_fixed,
+    _jira_issue_state,
+    _select_renames,
+    _sort_and_unique_versions,
+    _tag_version,
+    get_default_batch_size,
+)
+
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient as AsyncMongoClient
+    except ImportError:
+        AsyncMongoClient = None
+
+# collections that reference other collections for copying and deleting projects, i.e., the collection and the field
+# that contains the id of the referenced document; the names are the same as in copy_projects and delete_projects.
+# Systems are referenced by a single id in older databases and by a list of ids in the current models, both fields
+# are given as tuple of the field with the single id and the field with the list
+_REFERENCES = {
+    "project": [
+        ("vcs_system", "project_id"),
+        ("issue_system", "project_id"),
+        ("mailing_list", "project_id"),
+        ("mailing_system", "project_id"),
+        ("pull_request_system", "project_id"),
+    ],
+    "vcs_system": [
+        ("branch", ("vcs_system_id", "vcs_system_ids")),
+        ("tag", ("vcs_system_id", "vcs_system_ids")),
+        ("file", ("vcs_system_id", "vcs_system_ids")),
+        ("commit", ("vcs_system_id", "vcs_system_ids")),
+        ("travis_build", ("vcs_system_id", "vcs_system_ids")),
+    ],
+    "commit": [
+        ("clone_instance", "commit_id"),
+        ("code_entity_state", "commit_id"),
+        ("code_group_state", "commit_id"),
+        ("commit_changes", "old_commit_id"),
+        ("file_action", "commit_id"),
+        ("refactoring", "commit_id"),
+    ],
+    "file_action": [("hunk", "file_action_id")],
+    "travis_build": [("travis_job", "build_id")],
+    "issue_system": [("issue", ("issue_system_id", "issue_system_ids"))],
+    "issue": [("issue_comment", "issue_id"), ("event", "issue_id"), ("issue_event", "issue_id")],
+    "mailing_list": [("message", ("mailing_list_id", "mailing_system_ids"))],
+    "mailing_system": [("message", ("mailing_list_id", "mailing_system_ids"))],
+    "pull_request_system": [("pull_request", ("pull_request_system_id", "pull_request_system_ids"))],
+    "pull_request": [
+        ("pull_request_comment", "pull_request_id"),
+        ("pull_request_commit", "pull_request_id"),
+        ("pull_request_event", "pull_request_id"),
+        ("pull_request_file", "pull_request_id"),
+        ("pull_request_review", "pull_request_id"),
+    ],
+    "pull_request_review": [("pull_request_review_comment", "pull_request_review_id")],
+}
+
+_INSERT_CHUNK_SIZE = 1000
+
+
+def create_async_mongo_client(uri, **client_options):
+    """
+    Creates an asynchronous MongoDB client. Uses the asynchronous client of pymongo, if available, and motor otherwise.
+    The client must be created and used within the same event loop.
+
+    :param uri: MongoDB URI, e.g., created with :func:`~pycoshark.utils.create_mongodb_uri_string`
+    :param client_options: further keyword arguments that are passed to the client
+    :return: the client
+    """
+    if AsyncMongoClient is None:
+        raise ImportError("asynchronous access requires pymongo>=4.9 or motor")
+    return AsyncMongoClient(uri, **client_options)
+
+
+def _find(collection, condition, projection=None):
+    cursor = collection.find(condition, projection)
+    batch_size = get_default_batch_size()
+    if batch_size:
+        cursor = cursor.batch_size(batch_size)
+    return cursor
+
+
+async def _find_all(collection, condition, projection=None):
+    return await _find(collection, condition, projection).to_list(length=None)
+
+
+async def get_commit_graph(db, vcs_system_id, silent=True):
+    """Load NetworkX digraph structure from commits of this VCS.
+    The commits are loaded with a single query and the parents are resolved in memory.
+    :param db: asynchronous database
+    :param vcs_system_id id of the vcs system for which the graph is created
+    :param silent determines whether there is an output to stdout in case of a missing parent commit
+    """
+    import networkx as nx
+
+    commits = await _find_all(
+        db[Commit._get_collection_name()], {"vcs_system_ids": vcs_system_id}, Commit.get_projection("graph")
+    )
+
+    g = nx.DiGraph()
+    for c in commits:
+        g.add_node(c["revision_hash"])
+
+    for c in commits:
+        for p in c.get("parents") or []:
+            if p in g:
+                g.add_edge(p, c["revision_hash"])
+            elif not silent:
+                print("parent of a commit is missing (commit id: {} - revision_hash: {})".format(c["_id"], p))
+    return g
+
+
+async def git_tag_filter(
+    db, project_name, discard_patch=False, correct_broken_tags=True, date_tolerance=3, max_steps=2
+):
+    """
+    Asynchronous variant of :func:`~pycoshark.utils.git_tag_filter`. The commits and tags of the project are loaded
+    concurrently with one query each, all further lookups are done in memory.
+    :param db: asynchronous database
+    :param project_name: name of the project
+    :param discard_patch: only keep major releases, i.e., discard patch releases
+    :param correct_broken_tags Corrects the date of broken tags by looking at the parent commits.
+    :param date_tolerance time difference that is considered as "same" while looking for a parent in minutes
+    :param max_steps depth of prior parent commits that are considered when looking for parents
+    :return: List of dicts with the filtered tags, see :func:`~pycoshark.utils.git_tag_filter`
+    """
+    project = await db[Project._get_collection_name()].find_one({"name": project_name}, {"_id": 1})
+    if project is None:
+        raise Project.DoesNotExist("project %s does not exist" % project_name)
+    vcs_system = await db[VCSSystem._get_collection_name()].find_one({"project_id": project["_id"]}, {"_id": 1})
+    if vcs_system is None:
+        raise VCSSystem.DoesNotExist("project %s has no vcs system" % project_name)
+
+    commits, tags = await asyncio.gather(
+        _find_all(
+            db[Commit._get_collection_name()],
+            {"vcs_system_ids": vcs_system["_id"]},
+            Commit.get_projection("dates"),
+        ),
+        _find_all(db[Tag._get_collection_name()], {"vcs_system_id": vcs_system["_id"]}, {"name": 1, "commit_id": 1}),
+    )
+    commits_by_id = {c["_id"]: c for c in commits}
+    commits_by_hash = {c["revision_hash"]: c for c in commits}
+
+    def get_tag_commit(tag):
+        if tag["commit_id"] not in commits_by_id:
+            raise Commit.DoesNotExist("commit %s of tag %s does not exist" % (tag["commit_id"], tag["name"]))
+        return commits_by_id[tag["commit_id"]]
+
+    if correct_broken_tags:
+        tag_dates = {}
+        for tag in tags:
+            tag_dates.setdefault(tag["commit_id"], get_tag_commit(tag).get("committer_date"))
+        tag_dates = collections.Counter(tag_dates.values())
+
+    initial_versions = []
+    for tag in tags:
+        if tag["name"].startswith("J_"):
+            continue
+        tag_commit = get_tag_commit(tag)
+        corrected_commit = None
+        if correct_broken_tags:
+            if tag["name"] in _MANUAL_CORRECTIONS:
+                # the commits of the vcs system are loaded, revision hashes are not unique across vcs systems
+                corrected_commit = commits_by_hash.get(_MANUAL_CORRECTIONS[tag["name"]])
+                if corrected_commit is None:
+                    raise Commit.DoesNotExist(
+                        "corrected commit %s of tag %s does not exist" % (_MANUAL_CORRECTIONS[tag["name"]], tag["name"])
+                    )
+            elif tag_dates[tag_commit.get("committer_date")] > 1:
+                corrected_commit = _find_corrected_commit(tag_commit, commits_by_hash, date_tolerance, max_steps)
+                if corrected_commit is None:
+                    continue
+
+        final_version = _tag_version(project_name, tag["name"])
+        if final_version:
+            fversion = {"version": final_version, "original": tag["name"], "revision": tag_commit["revision_hash"]}
+            if corrected_commit is not None:
+                fversion["corrected_revision"] = corrected_commit["revision_hash"]
+            initial_versions.append(fversion)
+
+    return _sort_and_unique_versions(initial_versions, discard_patch)
+
+
+def _find_corrected_commit(tag_commit, commits_by_hash, date_tolerance, max_steps):
+    """
+    Breadth first search for a parent of a broken tag that is older than the tolerated date. As in
+    :func:`~pycoshark.utils.git_tag_filter`, all parents of a step are checked and missing parents raise an error.
+    """
+    from dateutil.relativedelta import relativedelta
+
+    tolerated_date = tag_commit["committer_date"] - relativedelta(minutes=date_tolerance)
+    corrected_commit = None
+    parents = {0: set(tag_commit.get("parents") or [])}
+    for steps in range(max_steps):
+        for parent in parents.get(steps, ()):
+            parent_commit = commits_by_hash.get(parent)
+            if parent_commit is None:
+                raise Commit.DoesNotExist("parent commit %s does not exist" % parent)
+            if parent_commit["committer_date"] < tolerated_date:
+                corrected_commit = parent_commit
+            else:
+                parents.setdefault(steps + 1, set()).update(parent_commit.get("parents") or [])
+        if corrected_commit is not None:
+            return corrected_commit
+    return None
+
+
+async def heuristic_renames(db, vcs_system_id, revision_hash):
+    """
+    Asynchronous variant of :func:`~pycoshark.utils.heuristic_renames`. The files of all renames are loaded with a
+    single query.
+    :param db: asynchronous database
+    :param vcs_system_id vcs system of the commit
+    :param revision_hash revision has of the commit for which the renames are determined
+    :return Tuple of renames and added files, see :func:`~pycoshark.utils.heuristic_renames`
+    """
+    commit = await db[Commit._get_collection_name()].find_one(
+        {"vcs_system_ids": vcs_system_id, "revision_hash": revision_hash}, {"_id": 1}
+    )
+    if commit is None:
+        raise Commit.DoesNotExist("commit %s does not exist" % revision_hash)
+    file_actions = await _find_all(
+        db[FileAction._get_collection_name()],
+        {"commit_id": commit["_id"], "mode": "R"},
+        {"file_id": 1, "old_file_id": 1},
+    )
+    file_ids = {fa["file_id"] for fa in file_actions} | {fa["old_file_id"] for fa in file_actions}
+    files = await _find_all(db[File._get_collection_name()], {"_id": {"$in": list(file_ids)}}, {"path": 1})
+    paths = {f["_id"]: f["path"] for f in files}
+
+    renames = {}
+    for fa in file_actions:
+        if fa["file_id"] not in paths or fa["old_file_id"] not in paths:
+            raise File.DoesNotExist("file of file action %s does not exist" % fa["_id"])
+        renames.setdefault(paths[fa["old_file_id"]], []).append(paths[fa["file_id"]])
+    return _select_renames(renames)
+
+
+async def jira_is_resolved_and_fixed(db, issue):
+    """
+    Asynchronous variant of :func:`~pycoshark.utils.jira_is_resolved_and_fixed`.
+    :param db: asynchronous database
+    :param issue: the issue as dict with at least the fields _id, resolution, and status
+    :return: true if there was a time when the issue was closed and the status was resolved as fixed (or similar),
+    false otherwise
+    """
+    state = _jira_issue_state(issue.get("resolution"), issue.get("status"))
+    if state is not None:
+        return state
+
+    events = await (
+        _find(db[IssueEvent._get_collection_name()], {"issue_id": issue["_id"]}, {"status": 1, "new_value": 1})
+        .sort("created_at", 1)
+        .to_list(length=None)
+    )
+    return _jira_events_resolved_and_fixed((e.get("status"), e.get("new_value")) for e in events)
+
+
+def _reference_condition(field, ids):
+    """
+    :return: condition for the documents whose field references one of the ids, see _REFERENCES
+    """
+    if isinstance(field, tuple):
+        return {"$or": [{name: {"$in": ids}} for name in field]}
+    return {field: {"$in": ids}}
+
+
+def _referenced_collections(collection):
+    """
+    :return: all collections that directly or indirectly reference the collection
+    """
+    result = set()
+    for child, _ in _REFERENCES.get(collection, []):
+        result.add(child)
+        result |= _referenced_collections(child)
+    return result
+
+
+async def copy_projects(source_db, target_db, projects, collections=None, batch_size=100, concurrency=8):
+    """
+    Asynchronous variant of :func:`~pycoshark.utils.copy_projects`. The projects and the collections that reference
+    the same documents are copied concurrently.
+
+    :param source_db: asynchronous source database
+    :param target_db: asynchronous target database
+    :param projects: List of projects that should be copied (required)
+    :param collections: List of collections that should be copied. Default:  None (which means that all collections
+    are copied)
+    :param batch_size: number of referenced ids per query. Default: 100
+    :param concurrency: maximum number of concurrent queries. Default: 8
+    """
+    if collections is None:
+        collections = _referenced_collections("project") | {"project", "repository_data"}
+    collections = set(collections)
+
+    for collection in collections - {"repository_data"}:
+        for name, index_info in (await source_db[collection].index_information()).items():
+            keys = index_info.pop("key")
+            index_info.pop("ns", None)
+            index_info.pop("v", None)
+            await target_db[collection].create_index(list(keys), name=name, **index_info)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    await asyncio.gather(
+        *[
+            _copy_batch(source_db, target_db, "project", {"name": name}, collections, batch_size, semaphore)
+            for name in projects
+        ]
+    )
+
+
+async def _copy_batch(source_db, target_db, collection, condition, collections, batch_size, semaphore):
+    """
+    Copies the documents of a collection that match the condition and then all documents that reference them.
+    """
+    if collection in collections or collection == "vcs_system":
+        projection = None
+    else:
+        projection = {"_id": 1}
+
+    ids = []
+    async with semaphore:
+        documents = []
+        async for document in _find(source_db[collection], condition, projection):
+            ids.append(document["_id"])
+            if collection == "vcs_system" and "repository_data" in collections and document.get("repository_file"):
+                await _copy_repository_data(source_db, target_db, document["repository_file"])
+            if collection in collections:
+                documents.append(document)
+                if len(documents) >= _INSERT_CHUNK_SIZE:
+                    await _insert_documents(target_db[collection], documents)
+                    documents = []
+        if documents:
+            await _insert_documents(target_db[collection], documents)
+
+    await _copy_references(source_db, target_db, collection, ids, collections, batch_size, semaphore)
+
+
+async def _copy_references(source_db, target_db, collection, ids, collections, batch_size, semaphore):
+    tasks = []
+    for child, field in _REFERENCES.get(collection, []):
+        if child not in collections and collections.isdisjoint(_referenced_collections(child)):
+            continue
+        for i in range(0, len(ids), batch_size):
+            condition = _reference_condition(field, ids[i : i + batch_size])
+            tasks.append(_copy_batch(source_db, target_db, child, condition, collections, batch_size, semaphore))
+    await asyncio.gather(*tasks)
+
+
+async def _insert_documents(collection, documents):
+    try:
+        await collection.insert_many(documents, ordered=False)
+    except BulkWriteError:
+        pass
+
+
+async def _copy_repository_data(source_db, target_db, file_id):
+    """
+    Copies a file of the GridFS bucket repository_data.
+    """
+    if await target_db["repository_data.files"].find_one({"_id": file_id}, {"_id": 1}) is not None:
+        return
+    await _insert_documents(
+        target_db["repository_data.chunks"],
+        await _find_all(source_db["repository_data.chunks"], {"files_id": file_id}),
+    )
+    await _insert_documents(
+        target_db["repository_data.files"],
+        await _find_all(source_db["repository_data.files"], {"_id": file_id}),
+    )
+
+
+async def delete_projects(db, projects, batch_size=100, concurrency=8):
+    """
+    Asynchronous variant of :func:`~pycoshark.utils.delete_projects`. The projects and the collections that reference
+    the same documents are deleted concurrently.
+
+    :param db: asynchronous database
+    :param projects: List of projects that should be deleted (required)
+    :param batch_size: number of referenced ids per query. Default: 100
+    :param concurrency: maximum number of concurrent queries. Default: 8
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    await asyncio.gather(*[_delete_batch(db, "project", {"name": name}, batch_size, semaphore) for name in projects])
+
+
+async def _delete_batch(db, collection, condition, batch_size, semaphore, list_field=None, owner_ids=()):
+    """
+    Deletes all documents that reference the documents of a collection that match the condition and then the
+    documents themselves. If list_field is given, documents that also belong to other systems than owner_ids, e.g.,
+    commits that are shared between forks, are kept and only the owner_ids are removed from their list_field.
+    """
+    projection = {"_id": 1, "repository_file": 1} if collection == "vcs_system" else {"_id": 1}
+    if list_field is not None:
+        projection[list_field] = 1
+    async with semaphore:
+        documents = await _find_all(db[collection], condition, projection)
+    shared_ids = []
+    if list_field is not None:
+        owner_ids = set(owner_ids)
+        shared_ids = [d["_id"] for d in documents if set(d.get(list_field) or []) - owner_ids]
+        documents = [d for d in documents if not set(d.get(list_field) or []) - owner_ids]
+    ids = [document["_id"] for document in documents]
+
+    tasks = []
+    for child, field in _REFERENCES.get(collection, []):
+        child_list_field = field[1] if isinstance(field, tuple) else None
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i : i + batch_size]
+            tasks.append(
+                _delete_batch(
+                    db, child, _reference_condition(field, batch), batch_size, semaphore, child_list_field, batch
+                )
+            )
+    await asyncio.gather(*tasks)
+
+    async with semaphore:
+        for document in documents:
+            if document.get("repository_file"):
+                await db["repository_data.chunks"].delete_many({"files_id": document["repository_file"]})
+                await db["repository_data.files"].delete_one({"_id": document["repository_file"]})
+        if list_field is None:
+            await db[collection].delete_many(condition)
+            return
+        if shared_ids:
+            await db[collection].update_many(
+                {"_id": {"$in": shared_ids}}, {"$pull": {list_field: {"$in": list(owner_ids)}}}
+            )
+        for i in range(0, len(ids), _INSERT_CHUNK_SIZE):
+            await db[collection].delete_many({"_id": {"$in": ids[i : i + _INSERT_CHUNK_SIZE]}})
@@ -0,0 +1,410 @@
+"""
+Line-origin index for blame queries, i.e., which commit last touched a line of a file as of a commit, e.g., to find
+the inducing commits of bug fixes with the SZZ algorithm without running git blame.
+
+The index replays the hunks of the file actions of a vcs system in topological order of the commits. For each file and
+each commit that changed the file, it keeps the origins of the lines as runs of consecutive lines that were introduced
+by the same commit. The index can be saved as checkpoint and updated with new commits later::
+
+    index = LineOriginIndex.load("blame.pickle") if os.path.exists("blame.pickle") else LineOriginIndex(vcs_system_id)
+    index.update(checkpoint_path="blame.pickle")
+    commit_id, line = index.blame(file_id, revision_hash, 42)
+"""
+
+import bisect
+import collections
+import os
+import pickle
+
+from array import array
+
+from pycoshark.fields import decompress_text
+from pycoshark.mongomodels import Commit, FileAction, Hunk
+
+LineRun = collections.namedtuple("LineRun", ["start", "end", "commit_id", "origin_start"])
+LineRun.__doc__ = """
+Run of consecutive lines of a file that were introduced by the same commit, see :meth:`LineOriginIndex.runs`.
+
+:property start: first line of the run in the file
+:property end: last line of the run in the file
+:property commit_id: id of the commit that introduced the lines, None if the origin is unknown
+:property origin_start: line number of the first line of the run in the commit that introduced it
+"""
+
+# commit position of lines whose origin is unknown, e.g., because the history is incomplete
+_UNKNOWN = -1
+
+# version of a file that was changed while its previous version was unknown, i.e., its number of lines is unknown
+_INCOMPLETE = ()
+
+
+def _new_runs():
+    return array("i"), array("i"), array("i")
+
+
+def _append_run(runs, new_line, commit, origin):
+    starts, commits, origins = runs
+    # the previous run is extended implicitly if the line continues it
+    if commits and commits[-1] == commit and origins[-1] + new_line - starts[-1] == origin:
+        return
+    starts.append(new_line)
+    commits.append(commit)
+    origins.append(origin)
+
+
+def _copy_lines(version, first, last, new_line, runs):
+    """
+    Copies the origins of the lines first to last of a version into the runs, starting at new_line.
+
+    :return: the next line of the runs
+    """
+    length = version[3] if version is not None else 0
+    if version is not None and first <= length:
+        starts, commits, origins, _ = version
+        k = bisect.bisect_right(starts, first) - 1
+        while first <= last and first <= length:
+            end = starts[k + 1] - 1 if k + 1 < len(starts) else length
+            count = min(last, end) - first + 1
+            _append_run(runs, new_line, commits[k], origins[k] + first - starts[k])
+            new_line += count
+            first += count
+            k += 1
+    if first <= last:
+        # lines that are not part of the known version of the file
+        _append_run(runs, new_line, _UNKNOWN, first)
+        new_line += last - first + 1
+    return new_line
+
+
+def apply_hunks(version, hunks, commit):
+    """
+    Applies the hunks of a file action to a version of a file.
+
+    :param version: tuple (starts, commits, origins, length) of the version before the change, None if the file did
+    not exist
+    :param hunks: dicts with the old_start, old_lines, and content of the hunks in the database format
+    :param commit: position of the commit of the file action
+    :return: tuple (starts, commits, origins, length) of the version after the change
+    :raises ValueError: if the version is None but the hunks change existing lines, because the lines after the last
+    hunk would be lost
+    """
+    if version is None and any(hunk["old_start"] > 0 or hunk["old_lines"] > 0 for hunk in hunks):
+        raise ValueError("the hunks change a file whose previous version is unknown")
+    runs = _new_runs()
+    old_line = 1
+    new_line = 1
+    for hunk in sorted(hunks, key=lambda h: h["old_start"]):
+        # hunks without old lines start after old_start
+        first = hunk["old_start"] if hunk["old_lines"] > 0 else hunk["old_start"] + 1
+        if first > old_line:
+            new_line = _copy_lines(version, old_line, first - 1, new_line, runs)
+            old_line = first
+        lines = decompress_text(hunk["content"]).split("\n")
+        if lines[-1] == "":
+            # the content ends with a line break
+            lines.pop()
+        for line in lines:
+            if line.startswith("+"):
+                _append_run(runs, new_line, commit, new_line)
+                new_line += 1
+            elif line.startswith("-"):
+                old_line += 1
+            elif not line.startswith("\\"):
+                # context lines, including empty lines whose leading space was stripped, as in diff.parse_hunk
+                new_line = _copy_lines(version, old_line, old_line, new_line, runs)
+                old_line += 1
+    if version is not None and old_line <= version[3]:
+        new_line = _copy_lines(version, old_line, version[3], new_line, runs)
+    return runs + (new_line - 1,)
+
+
+class LineOriginIndex(object):
+    """
+    In-memory index of the line origins of the files of a vcs system.
+
+    The versions of a file are stored for the commits that changed the file. The version of a file as of any other
+    commit is the version of the closest first-parent ancestor that changed the file. For this, the commits are split
+    into first-parent chains and the versions of each file are stored per chain. If a merge commit has file actions
+    for the file against all parents, the file action against the first parent is replayed. If it has no file action
+    against a parent, the file equals the version of that parent and the origins of its lines are kept.
+
+    If a file is changed while its previous version is unknown, e.g., because the history is incomplete, the number of
+    its lines is unknown. Such files are listed in incomplete_file_ids and blame queries for them raise a ValueError
+    until the file is added again.
+
+    :param vcs_system_id: id of the vcs system
+    :property incomplete_file_ids: set of the ids of the files that were changed while their previous version was
+    unknown
+    """
+
+    def __init__(self, vcs_system_id):
+        self.vcs_system_id = vcs_system_id
+        self.revision_hashes = []
+        self.commit_ids = []
+        self._positions = {}
+        self._id_positions = {}
+        # chain and position within the chain of each commit
+        self._chains = array("i")
+        self._chain_positions = array("i")
+        # parent commit of the first commit and last commit of each chain
+        self._chain_parents = array("i")
+        self._chain_tails = array("i")
+        # file id -> chain -> (positions of the commits that changed the file, versions of the file)
+        self._versions = {}
+        self.incomplete_file_ids = set()
+
+    def __len__(self):
+        return len(self.revision_hashes)
+
+    def __contains__(self, commit):
+        return commit in self._positions or commit in self._id_positions
+
+    def save(self, path):
+        """
+        Writes the index to a checkpoint file. The file is replaced atomically.
+
+        :param path: path of the checkpoint file
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads an index from a checkpoint file that was written with :meth:`save`.
+
+        :param path: path of the checkpoint file
+        :return: the index
+        """
+        index = cls.__new__(cls)
+        with open(path, "rb") as f:
+            index.__dict__.update(pickle.load(f))
+        return index
+
+    def _position(self, commit):
+        position = self._positions.get(commit, self._id_positions.get(commit))
+        if position is None:
+            raise KeyError("commit %s is not in the index" % commit)
+        return position
+
+    def _add_commit(self, revision_hash, commit_id, parents):
+        position = len(self.revision_hashes)
+        self.revision_hashes.append(revision_hash)
+        self.commit_ids.append(commit_id)
+        self._positions[revision_hash] = position
+        self._id_positions[commit_id] = position
+        first_parent = parents[0] if parents else _UNKNOWN
+        if first_parent == _UNKNOWN or self._chain_tails[self._chains[first_parent]] != first_parent:
+            self._chains.append(len(self._chain_tails))
+            self._chain_positions.append(0)
+            self._chain_parents.append(first_parent)
+            self._chain_tails.append(position)
+        else:
+            chain = self._chains[first_parent]
+            self._chains.append(chain)
+            self._chain_positions.append(self._chain_positions[first_parent] + 1)
+            self._chain_tails[chain] = position
+        return position
+
+    def _set_version(self, file_id, position, version):
+        chain = self._chains[position]
+        positions, versions = self._versions.setdefault(file_id, {}).setdefault(chain, (array("i"), []))
+        positions.append(self._chain_positions[position])
+        versions.append(version)
+
+    def _has_version(self, file_id, position):
+        chain = self._chains[position]
+        positions = self._versions.get(file_id, {}).get(chain, ((),))[0]
+        return bool(positions) and positions[-1] == self._chain_positions[position]
+
+    def _resolve(self, file_id, position):
+        """
+        :return: the version of the file as of the commit at the position, None if the file does not exist
+        """
+        chains = self._versions.get(file_id)
+        while chains is not None and position != _UNKNOWN:
+            chain = self._chains[position]
+            if chain in chains:
+                positions, versions = chains[chain]
+                k = bisect.bisect_right(positions, self._chain_positions[position]) - 1
+                if k >= 0:
+                    return versions[k]
+            position = self._chain_parents[chain]
+        return None
+
+    def _apply_commit(self, position, parents, file_actions, hunks):
+        by_file = collections.defaultdict(dict)
+        for file_action in file_actions:
+            parent = self._positions.get(file_action.get("parent_revision_hash"))
+            if parent not in parents:
+                parent = parents[0] if parents else _UNKNOWN
+            by_file[file_action["file_id"]].setdefault(parent, file_action)
+
+        deleted = set()
+        for file_id, actions in by_file.items():
+            unchanged = [p for p in parents if p not in actions and self._resolve(file_id, p) is not None]
+            if len(parents) > 1 and unchanged:
+                self._set_version(file_id, position, self._resolve(file_id, unchanged[0]))
+                continue
+            parent = next(p for p in parents + [_UNKNOWN] if p in actions)
+            file_action = actions[parent]
+            if file_action["mode"] == "D":
+                self._set_version(file_id, position, None)
+                continue
+            base_file_id = file_action.get("old_file_id") or file_id
+            if file_action["mode"] == "R" and base_file_id != file_id:
+                deleted.add(base_file_id)
+            base = self._resolve(base_file_id, parent) if file_action["mode"] != "A" else None
+            try:
+                if base is _INCOMPLETE:
+                    raise ValueError("the previous version is incomplete")
+                version = apply_hunks(base, hunks.get(file_action["_id"], []), position)
+            except ValueError:
+                version = _INCOMPLETE
+                self.incomplete_file_ids.add(file_id)
+            self._set_version(file_id, position, version)
+
+        for file_id in deleted - set(by_file):
+            if not self._has_version(file_id, position):
+                self._set_version(file_id, position, None)
+
+    def update(self, commit_chunk_size=1000, checkpoint_path=None, checkpoint_interval=10000, silent=True):
+        """
+        Adds the commits of the vcs system that are not yet in the index. The commits are processed in topological
+        order and their file actions and hunks are loaded in chunks of commits.
+
+        :param commit_chunk_size: number of commits whose file actions and hunks are loaded at once. Default: 1000
+        :param checkpoint_path: path of a checkpoint file that is written regularly and at the end, see
+        :meth:`save`. Default: None (no checkpoints)
+        :param checkpoint_interval: number of commits between checkpoints. Default: 10000
+        :param silent: if False, the progress is printed. Default: True
+        :return: number of added commits
+        """
+        commits = {
+            c["revision_hash"]: c
+            for c in Commit.objects(vcs_system_ids=self.vcs_system_id)
+            .only("id", "revision_hash", "parents")
+            .as_pymongo()
+            if c["revision_hash"] not in self._positions
+        }
+
+        # topological order of the new commits, parents that are unknown are ignored
+        children = collections.defaultdict(list)
+        waiting = {}
+        for revision_hash, commit in commits.items():
+            new_parents = [p for p in commit.get("parents", []) if p in commits]
+            waiting[revision_hash] = len(new_parents)
+            for parent in new_parents:
+                children[parent].append(revision_hash)
+        ready = collections.deque(h for h, count in waiting.items() if count == 0)
+        order = []
+        while ready:
+            revision_hash = ready.popleft()
+            order.append(revision_hash)
+            for child in children[revision_hash]:
+                waiting[child] -= 1
+                if waiting[child] == 0:
+                    ready.append(child)
+        if len(order) != len(commits):
+            raise ValueError("the commits of vcs system %s contain a cycle" % self.vcs_system_id)
+
+        added = 0
+        for chunk_start in range(0, len(order), commit_chunk_size):
+            chunk = [commits[h] for h in order[chunk_start : chunk_start + commit_chunk_size]]
+            file_actions = collections.defaultdict(list)
+            for file_action in (
+                FileAction.objects(commit_id__in=[c["_id"] for c in chunk])
+                .only("id", "commit_id", "file_id", "old_file_id", "mode", "parent_revision_hash")
+                .as_pymongo()
+            ):
+                file_actions[file_action["commit_id"]].append(file_action)
+            hunks = collections.defaultdict(list)
+            file_action_ids = [fa["_id"] for actions in file_actions.values() for fa in actions]
+            for hunk in (
+                Hunk.objects(file_action_id__in=file_action_ids)
+                .only("file_action_id", "old_start", "old_lines", "content")
+                .as_pymongo()
+            ):
+                hunks[hunk["file_action_id"]].append(hunk)
+
+            for commit in chunk:
+                parents = [self._positions[p] for p in commit.get("parents", []) if p in self._positions]
+                position = self._add_commit(commit["revision_hash"], commit["_id"], parents)
+                self._apply_commit(position, parents, file_actions[commit["_id"]], hunks)
+                added += 1
+                if checkpoint_path is not None and added % checkpoint_interval == 0:
+                    self.save(checkpoint_path)
+            if not silent:
+                print("added %i of %i commits to the line origin index" % (added, len(order)))
+
+        if checkpoint_path is not None:
+            self.save(checkpoint_path)
+        if not silent and self.incomplete_file_ids:
+            print("%i files were changed while their previous version was unknown" % len(self.incomplete_file_ids))
+        return added
+
+    def _resolve_complete(self, file_id, commit):
+        version = self._resolve(file_id, self._position(commit))
+        if version is _INCOMPLETE:
+            raise ValueError("the lines of file %s as of commit %s are unknown" % (file_id, commit))
+        return version
+
+    def runs(self, file_id, commit):
+        """
+        Returns the line origins of a file as of a commit as runs of consecutive lines.
+
+        :param file_id: id of the file
+        :param commit: revision hash or id of the commit
+        :return: list of :class:`LineRun`, None if the file does not exist as of the commit
+        :raises ValueError: if the lines of the file are unknown as of the commit, see incomplete_file_ids
+        """
+        version = self._resolve_complete(file_id, commit)
+        if version is None:
+            return None
+        starts, commits, origins, length = version
+        return [
+            LineRun(
+                starts[k],
+                starts[k + 1] - 1 if k + 1 < len(starts) else length,
+                self.commit_ids[commits[k]] if commits[k] != _UNKNOWN else None,
+                origins[k],
+            )
+            for k in range(len(starts))
+        ]
+
+    def blame(self, file_id, commit, line):
+        """
+        Returns the commit that last touched a line of a file as of a commit.
+
+        :param file_id: id of the file
+        :param commit: revision hash or id of the commit
+        :param line: line number in the file as of the commit, starting at 1
+        :return: tuple of the id of the commit that introduced the line (None if the origin is unknown) and the line
+        number in that commit, None if the file or line does not exist as of the commit
+        :raises ValueError: if the lines of the file are unknown as of the commit, see incomplete_file_ids
+        """
+        return self.blame_lines(file_id, commit, [line])[line]
+
+    def blame_lines(self, file_id, commit, lines):
+        """
+        Returns the commits that last touched lines of a file as of a commit, see :meth:`blame`.
+
+        :param file_id: id of the file
+        :param commit: revision hash or id of the commit
+        :param lines: line numbers in the file as of the commit, starting at 1
+        :return: dict with the result of :meth:`blame` for each line
+        :raises ValueError: if the lines of the file are unknown as of the commit, see incomplete_file_ids
+        """
+        version = self._resolve_complete(file_id, commit)
+        result = {}
+        for line in lines:
+            if version is None or not 1 <= line <= version[3]:
+                result[line] = None
+                continue
+            starts, commits, origins, _ = version
+            k = bisect.bisect_right(starts, line) - 1
+            origin_commit = self.commit_ids[commits[k]] if commits[k] != _UNKNOWN else None
+            result[line] = (origin_commit, origins[k] + line - starts[k])
+        return result
@@ -0,0 +1,118 @@
+"""
+Buffered bulk writers for collections with many documents per project.
+"""
+
+import bson
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from pycoshark.mongomodels import CodeEntityState, CodeGroupState
+
+# fields from which the s_key of the documents is calculated
+_IDENTIFIER_FIELDS = {
+    CodeEntityState: ("long_name", "commit_id", "file_id"),
+    CodeGroupState: ("long_name", "commit_id"),
+}
+
+
+class BulkStateWriter(object):
+    """
+    Buffered writer that upserts :class:`~pycoshark.mongomodels.CodeEntityState` or
+    :class:`~pycoshark.mongomodels.CodeGroupState` documents with unordered bulk writes.
+
+    The documents are buffered until the number of documents or their size in bytes exceeds a threshold. On flush, the
+    s_key of all buffered documents is calculated, documents with the same s_key are deduplicated (the last document
+    wins), and the documents are upserted by their s_key. The writer should be used as context manager to ensure that
+    the last documents are flushed::
+
+        with BulkStateWriter(CodeEntityState) as writer:
+            for entity in entities:
+                writer.add({"long_name": entity.name, "commit_id": commit_id, "file_id": file_id, "metrics": metrics})
+        print(writer.stats)
+
+    :param document_class: CodeEntityState or CodeGroupState
+    :param flush_count: number of buffered documents that triggers a flush. Default: 1000
+    :param flush_bytes: size of the buffered documents in bytes that triggers a flush. Default: 16 MB
+    """
+
+    def __init__(self, document_class, flush_count=1000, flush_bytes=16 * 1024 * 1024):
+        if document_class not in _IDENTIFIER_FIELDS:
+            raise ValueError(
+                "bulk writes are only supported for %s" % ", ".join(c.__name__ for c in _IDENTIFIER_FIELDS)
+            )
+        self.document_class = document_class
+        self.flush_count = flush_count
+        self.flush_bytes = flush_bytes
+        self.stats = {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0, "flushes": 0}
+        self._identifier_fields = _IDENTIFIER_FIELDS[document_class]
+        self._buffer = []
+        self._buffer_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, document):
+        """
+        Adds a document to the buffer and flushes the buffer if a threshold is exceeded.
+
+        :param document: a document of the document class or a dict with the names of the fields in the database
+        :raises ValueError: if a field of the identifier is missing
+        """
+        if isinstance(document, self.document_class):
+            document = document.to_mongo().to_dict()
+        else:
+            document = dict(document)
+        missing = [field for field in self._identifier_fields if document.get(field) is None]
+        if missing:
+            raise ValueError("document has no %s: %s" % (", ".join(missing), document))
+        document.pop("_id", None)
+        document.pop("s_key", None)
+        self._buffer.append(document)
+        self._buffer_bytes += len(bson.encode(document))
+        if len(self._buffer) >= self.flush_count or self._buffer_bytes >= self.flush_bytes:
+            self.flush()
+
+    def flush(self):
+        """
+        Upserts all buffered documents. If the bulk write fails, the documents whose write failed are kept in the
+        buffer and the applied ones are counted and removed, such that flush can be retried.
+        """
+        if not self._buffer:
+            return
+        buffer = self._buffer
+
+        s_keys = self.document_class.calculate_identifiers(
+            [tuple(document[f] for f in self._identifier_fields) for document in buffer]
+        )
+        documents = {}
+        for s_key, document in zip(s_keys, buffer):
+            if s_key in documents:
+                self.stats["skipped"] += 1
+            document["s_key"] = s_key
+            documents[s_key] = document
+
+        requests = [
+            UpdateOne({"s_key": s_key}, {"$set": document}, upsert=True) for s_key, document in documents.items()
+        ]
+        self.stats["flushes"] += 1
+        try:
+            result = self.document_class._get_collection().bulk_write(requests, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            self._buffer = [document for i, document in enumerate(documents.values()) if i in failed]
+            self._buffer_bytes = sum(len(bson.encode(document)) for document in self._buffer)
+            self._update_stats(e.details)
+            raise
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._update_stats(result)
+
+    def _update_stats(self, result):
+        self.stats["inserted"] += result["nUpserted"]
+        self.stats["updated"] += result["nModified"]
+        self.stats["unchanged"] += result["nMatched"] - result["nModified"]
@@ -0,0 +1,300 @@
+"""
+Bounded LRU caches for lookups of immutable reference documents, e.g., files, commits, projects, and vcs systems.
+
+The caches are shared within a process and must be invalidated explicitly if the cached documents change, e.g., with
+:func:`invalidate_reference_caches`. :func:`~pycoshark.utils.reset_connection_cache` clears all caches.
+"""
+
+import collections
+import threading
+
+from pycoshark.mongomodels import Commit, File, Issue, People
+
+DEFAULT_MAXSIZE = 10000
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class ReferenceCache(object):
+    """
+    Bounded LRU cache for documents that are looked up by a key field.
+
+    :param document_class: class of the cached documents
+    :param key_field: name of the field by which the documents are looked up. Default: 'id'
+    :param query: additional filter for all lookups, e.g., {'vcs_system_ids': vcs_system_id}. Default: None
+    :param only: names of the fields that are loaded. Default: None (all fields)
+    :param maxsize: maximal number of cached documents. Default: 10000
+    """
+
+    def __init__(self, document_class, key_field="id", query=None, only=None, maxsize=DEFAULT_MAXSIZE):
+        self.document_class = document_class
+        self.key_field = key_field
+        self.query = dict(query or {})
+        self.only = tuple(only) if only else None
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._documents = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self):
+        """
+        :return: dict with the number of hits, misses, and cached documents
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._documents), "maxsize": self.maxsize}
+
+    def _queryset(self, **query):
+        queryset = self.document_class.objects(**self.query, **query)
+        if self.only:
+            queryset = queryset.only(*set(self.only) | {self.key_field})
+        return queryset
+
+    def _put(self, key, document):
+        self._documents[key] = document
+        self._documents.move_to_end(key)
+        while len(self._documents) > self.maxsize:
+            self._documents.popitem(last=False)
+
+    def get(self, key):
+        """
+        Returns the document with the key.
+
+        :param key: the key
+        :return: the document
+        :raises DoesNotExist: if there is no document with the key
+        """
+        with self._lock:
+            if key in self._documents:
+                self.hits += 1
+                self._documents.move_to_end(key)
+                return self._documents[key]
+            self.misses += 1
+        document = self._queryset(**{self.key_field: key}).get()
+        with self._lock:
+            self._put(key, document)
+        return document
+
+    def get_many(self, keys):
+        """
+        Returns the documents with the keys. All documents that are not cached are fetched with a single query.
+
+        :param keys: iterable of keys
+        :return: dict with the keys as keys and the documents as values; keys without document are missing
+        :raises MultipleObjectsReturned: if there are several documents with the same key
+        """
+        result = {}
+        # insertion ordered set of the keys that are not cached
+        missing = {}
+        with self._lock:
+            for key in keys:
+                if key in result:
+                    continue
+                if key in self._documents:
+                    self.hits += 1
+                    self._documents.move_to_end(key)
+                    result[key] = self._documents[key]
+                elif key not in missing:
+                    self.misses += 1
+                    missing[key] = None
+        if missing:
+            fetched = {}
+            for document in self._queryset(**{"%s__in" % self.key_field: list(missing)}):
+                key = getattr(document, self.key_field)
+                if key in fetched:
+                    raise self.document_class.MultipleObjectsReturned(
+                        "several %s documents with %s %s" % (self.document_class.__name__, self.key_field, key)
+                    )
+                fetched[key] = document
+            with self._lock:
+                for key, document in fetched.items():
+                    result[key] = document
+                    self._put(key, document)
+        return result
+
+    def invalidate(self, keys=None):
+        """
+        Removes documents from the cache.
+
+        :param keys: iterable of keys. Default: None (all documents)
+        """
+        with self._lock:
+            if keys is None:
+                self._documents.clear()
+            else:
+                for key in keys:
+                    self._documents.pop(key, None)
+
+
+def get_reference_cache(document_class, key_field="id", only=None, maxsize=DEFAULT_MAXSIZE, **query):
+    """
+    Returns the shared cache for lookups of a document class by a key field. The cache is created on first use.
+
+    :param document_class: class of the cached documents
+    :param key_field: name of the field by which the documents are looked up. Default: 'id'
+    :param only: names of the fields that are loaded. Default: None (all fields)
+    :param maxsize: maximal number of cached documents, only used if the cache is created. Default: 10000
+    :param query: additional filter for all lookups, e.g., vcs_system_ids=vcs_system_id
+    :return: :class:`ReferenceCache`
+    """
+    key = (document_class, key_field, tuple(sorted(only or ())), tuple(sorted(query.items())))
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ReferenceCache(document_class, key_field, query=query, only=only, maxsize=maxsize)
+        return _caches[key]
+
+
+def get_reference_cache_stats():
+    """
+    :return: list of dicts with the document class, key field, query, and stats of all shared caches
+    """
+    with _caches_lock:
+        return [
+            dict(document=cache.document_class.__name__, key_field=cache.key_field, query=cache.query, **cache.stats)
+            for cache in _caches.values()
+        ]
+
+
+def invalidate_reference_caches(document_class=None, keys=None):
+    """
+    Removes documents from the shared caches.
+
+    :param document_class: only invalidate the caches of this document class. Default: None (all caches)
+    :param keys: iterable of keys that are removed. Default: None (all documents)
+    """
+    if keys is not None:
+        keys = list(keys)
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        if document_class is None or cache.document_class is document_class:
+            cache.invalidate(keys)
+
+
+def clear_reference_caches():
+    """
+    Removes all shared caches.
+    """
+    with _caches_lock:
+        _caches.clear()
+
+
+# target collections of foreign keys that are referenced with the same name in several models
+PREFETCH_TARGETS = {
+    "author_id": People,
+    "committer_id": People,
+    "creator_id": People,
+    "assignee_id": People,
+    "reporter_id": People,
+    "tagger_id": People,
+    "from_id": People,
+    "to_ids": People,
+    "cc_ids": People,
+    "linked_user_ids": People,
+    "requested_reviewer_ids": People,
+    "file_id": File,
+    "old_file_id": File,
+    "commit_id": Commit,
+    "merge_commit_id": Commit,
+    "triggering_commit_id": Commit,
+    "old_commit_id": Commit,
+    "new_commit_id": Commit,
+    "issue_id": Issue,
+    "parent_issue_id": Issue,
+    "linked_issue_ids": Issue,
+    "fixed_issue_ids": Issue,
+    "szz_issue_ids": Issue,
+}
+
+
+# attribute names of fields for which the default naming does not work, e.g., because from is a keyword
+_PREFETCH_ATTRIBUTES = {"from_id": "sender", "to_ids": "to", "cc_ids": "cc"}
+
+
+def prefetch_attribute_name(field_name):
+    """
+    Returns the name of the attribute to which :func:`prefetch` attaches the referenced documents of a field, i.e.,
+    author_id becomes author and linked_issue_ids becomes linked_issues. The references of messages are attached as
+    sender, to, and cc.
+
+    :param field_name: name of the field
+    :return: name of the attribute
+    """
+    if field_name in _PREFETCH_ATTRIBUTES:
+        return _PREFETCH_ATTRIBUTES[field_name]
+    if field_name.endswith("_ids"):
+        return field_name[:-4] + "s"
+    if field_name.endswith("_id"):
+        return field_name[:-3]
+    return field_name + "_document"
+
+
+def prefetch(queryset, *field_names, targets=None, only=None, batch_size=1000):
+    """
+    Iterates over a queryset and resolves the documents referenced by ObjectId fields with one $in query per target
+    collection and batch, similar to select_related in other ORMs. The referenced documents are attached as attributes,
+    see :func:`prefetch_attribute_name`, e.g., ``commit.author`` for ``author_id``. References that cannot be resolved
+    are attached as None, or left out for list fields. Documents that are referenced in several batches are only
+    fetched once::
+
+        for commit in prefetch(Commit.objects(vcs_system_ids=vcs_system_id), "author_id", "committer_id"):
+            print(commit.author.name, commit.committer.name)
+
+    :param queryset: the queryset
+    :param field_names: names of the ObjectId fields or lists of ObjectIds
+    :param targets: dict with the document classes of fields that are not in PREFETCH_TARGETS. Default: None
+    :param only: dict with the names of the fields that are loaded per document class, e.g., {People: ('name',)}.
+    Default: None (all fields)
+    :param batch_size: number of documents of the queryset for which the references are resolved at once. Default: 1000
+    :return: generator of the documents of the queryset
+    """
+    document_class = queryset._document
+    targets = dict(PREFETCH_TARGETS, **(targets or {}))
+    only = only or {}
+    fields_by_target = collections.OrderedDict()
+    for field_name in field_names:
+        if field_name not in document_class._fields:
+            raise ValueError("%s has no field %s" % (document_class.__name__, field_name))
+        if field_name not in targets:
+            raise ValueError("target of %s is unknown, please specify it with targets" % field_name)
+        if prefetch_attribute_name(field_name) in document_class._fields:
+            raise ValueError(
+                "%s already has a field %s" % (document_class.__name__, prefetch_attribute_name(field_name))
+            )
+        fields_by_target.setdefault(targets[field_name], []).append(field_name)
+    caches = {
+        target: ReferenceCache(target, only=only.get(target), maxsize=max(DEFAULT_MAXSIZE, 2 * batch_size))
+        for target in fields_by_target
+    }
+
+    batch = []
+    for document in queryset:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield from _attach_references(batch, fields_by_target, caches)
+            batch = []
+    if batch:
+        yield from _attach_references(batch, fields_by_target, caches)
+
+
+def _attach_references(batch, fields_by_target, caches):
+    for target, field_names in fields_by_target.items():
+        ids = []
+        for document in batch:
+            for field_name in field_names:
+                value = getattr(document, field_name)
+                if isinstance(value, list):
+                    ids.extend(value)
+                elif value is not None:
+                    ids.append(value)
+        found = caches[target].get_many(ids)
+        for document in batch:
+            for field_name in field_names:
+                value = getattr(document, field_name)
+                if isinstance(value, list):
+                    referenced = [found[i] for i in value if i in found]
+                else:
+                    referenced = found.get(value)
+                object.__setattr__(document, prefetch_attribute_name(field_name), referenced)
+    return batch
@@ -0,0 +1,201 @@
+"""
+Parsing of the unified diff content of hunks into arrays of the added and deleted lines, e.g., for the analysis of
+lines_verified and churn metrics.
+
+The parsed hunks keep a reference to the content and only store the line numbers and the offsets of the lines in the
+content, i.e., the lines are not copied unless their text is requested. Parsed hunks are memoized by the id of the
+hunk::
+
+    for file_action_id, hunks in parse_commit_hunks(commit_id).items():
+        for parsed in hunks:
+            print(parsed.added_lines, parsed.deleted_lines, parsed.deleted_text(0))
+"""
+
+import collections
+import re
+import threading
+
+from array import array
+
+from pycoshark.fields import decompress_text
+from pycoshark.mongomodels import FileAction, Hunk
+
+DEFAULT_MAXSIZE = 10000
+
+# lines that are not context lines, "\ No newline at end of file" does not belong to the old or new file
+_CHANGE_LINE = re.compile(r"^[-+\\]", re.MULTILINE)
+
+_parsed_hunks = collections.OrderedDict()
+_parsed_hunks_lock = threading.Lock()
+_maxsize = DEFAULT_MAXSIZE
+
+
+class ParsedHunk(object):
+    """
+    Added and deleted lines of a hunk.
+
+    :property content: the content of the hunk
+    :property added_lines: array of the line numbers of the added lines in the new file
+    :property deleted_lines: array of the line numbers of the deleted lines in the old file
+    :property added_offsets: array with the start and end offset of each added line in the content, without the
+    leading '+' and the line break
+    :property deleted_offsets: array with the start and end offset of each deleted line in the content, without the
+    leading '-' and the line break
+    """
+
+    __slots__ = ("content", "added_lines", "deleted_lines", "added_offsets", "deleted_offsets")
+
+    def __init__(self, content, added_lines, deleted_lines, added_offsets, deleted_offsets):
+        self.content = content
+        self.added_lines = added_lines
+        self.deleted_lines = deleted_lines
+        self.added_offsets = added_offsets
+        self.deleted_offsets = deleted_offsets
+
+    def __repr__(self):
+        return "<ParsedHunk added_lines:%s deleted_lines:%s>" % (list(self.added_lines), list(self.deleted_lines))
+
+    @property
+    def churn(self):
+        """
+        :return: tuple of the numbers of added and deleted lines
+        """
+        return len(self.added_lines), len(self.deleted_lines)
+
+    def added_text(self, i):
+        """
+        :param i: index of the added line
+        :return: the text of the added line
+        """
+        return self.content[self.added_offsets[2 * i] : self.added_offsets[2 * i + 1]]
+
+    def deleted_text(self, i):
+        """
+        :param i: index of the deleted line
+        :return: the text of the deleted line
+        """
+        return self.content[self.deleted_offsets[2 * i] : self.deleted_offsets[2 * i + 1]]
+
+
+def parse_hunk(content, old_start, new_start):
+    """
+    Parses the content of a hunk.
+
+    :param content: the content of the hunk as string or compressed value
+    :param old_start: old_start of the hunk
+    :param new_start: new_start of the hunk
+    :return: :class:`ParsedHunk`
+    """
+    content = decompress_text(content) or ""
+    added_lines, deleted_lines = array("i"), array("i")
+    added_offsets, deleted_offsets = array("i"), array("i")
+    old_line, new_line = old_start, new_start
+    position = 0
+    for match in _CHANGE_LINE.finditer(content):
+        start = match.start()
+        # context lines since the last change belong to the old and the new file
+        context = content.count("\n", position, start)
+        old_line += context
+        new_line += context
+        end = content.find("\n", start)
+        if end == -1:
+            end = len(content)
+        marker = content[start]
+        if marker == "+":
+            added_lines.append(new_line)
+            added_offsets.append(start + 1)
+            added_offsets.append(end)
+            new_line += 1
+        elif marker == "-":
+            deleted_lines.append(old_line)
+            deleted_offsets.append(start + 1)
+            deleted_offsets.append(end)
+            old_line += 1
+        position = end + 1
+    return ParsedHunk(content, added_lines, deleted_lines, added_offsets, deleted_offsets)
+
+
+def _get_cached(hunk_id):
+    with _parsed_hunks_lock:
+        parsed = _parsed_hunks.get(hunk_id)
+        if parsed is not None:
+            _parsed_hunks.move_to_end(hunk_id)
+        return parsed
+
+
+def _put_cached(hunk_id, parsed):
+    with _parsed_hunks_lock:
+        _parsed_hunks[hunk_id] = parsed
+        _parsed_hunks.move_to_end(hunk_id)
+        while len(_parsed_hunks) > _maxsize:
+            _parsed_hunks.popitem(last=False)
+
+
+def set_parsed_hunks_maxsize(maxsize):
+    """
+    Sets the maximal number of memoized parsed hunks.
+
+    :param maxsize: the maximal number. Default: 10000
+    """
+    global _maxsize
+    with _parsed_hunks_lock:
+        _maxsize = maxsize
+        while len(_parsed_hunks) > _maxsize:
+            _parsed_hunks.popitem(last=False)
+
+
+def clear_parsed_hunks():
+    """
+    Removes all memoized parsed hunks.
+    """
+    with _parsed_hunks_lock:
+        _parsed_hunks.clear()
+
+
+def get_parsed_hunk(hunk):
+    """
+    Parses a hunk, the result is memoized by the id of the hunk.
+
+    :param hunk: :class:`~pycoshark.mongomodels.Hunk` or dict in the database format with the content, old_start, and
+    new_start
+    :return: :class:`ParsedHunk`
+    """
+    if isinstance(hunk, dict):
+        hunk_id, content, old_start, new_start = hunk["_id"], hunk["content"], hunk["old_start"], hunk["new_start"]
+    else:
+        hunk_id, content, old_start, new_start = hunk.id, hunk.content, hunk.old_start, hunk.new_start
+    parsed = _get_cached(hunk_id)
+    if parsed is None:
+        parsed = parse_hunk(content, old_start, new_start)
+        _put_cached(hunk_id, parsed)
+    return parsed
+
+
+def parse_commit_hunks(commit_id, file_action_ids=None):
+    """
+    Parses all hunks of a commit. The content is only loaded for the hunks that are not memoized.
+
+    :param commit_id: id of the commit
+    :param file_action_ids: ids of the file actions of the commit. Default: None (loaded from the database)
+    :return: dict with the file action ids as keys and lists of :class:`ParsedHunk` sorted by new_start as values
+    """
+    if file_action_ids is None:
+        file_action_ids = [fa["_id"] for fa in FileAction.objects(commit_id=commit_id).only("id").as_pymongo()]
+    hunks = list(
+        Hunk.objects(file_action_id__in=file_action_ids).only("id", "file_action_id", "new_start").as_pymongo()
+    )
+    parsed_hunks = {}
+    for hunk in hunks:
+        parsed = _get_cached(hunk["_id"])
+        if parsed is not None:
+            parsed_hunks[hunk["_id"]] = parsed
+    missing = [hunk["_id"] for hunk in hunks if hunk["_id"] not in parsed_hunks]
+    if missing:
+        for hunk in Hunk.objects(id__in=missing).only("id", "content", "old_start", "new_start").as_pymongo():
+            parsed_hunks[hunk["_id"]] = parse_hunk(hunk["content"], hunk["old_start"], hunk["new_start"])
+            _put_cached(hunk["_id"], parsed_hunks[hunk["_id"]])
+
+    result = collections.defaultdict(list)
+    for hunk in sorted(hunks, key=lambda h: h["new_start"]):
+        result[hunk["file_action_id"]].append(parsed_hunks[hunk["_id"]])
+    return dict(result)
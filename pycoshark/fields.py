@@ -0,0 +1,204 @@
+"""
+Custom mongoengine fields of pycoSHARK.
+"""
+
+import zlib
+
+import bson
+from bson import Binary
+from bson.raw_bson import RawBSONDocument
+from mongoengine import DictField, ListField, StringField
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# the first byte of compressed values marks the compression algorithm
+ZLIB_MARKER = b"\x01"
+ZSTD_MARKER = b"\x02"
+
+
+def compress_text(value, algorithm="zlib", level=None):
+    """
+    Compresses a string.
+
+    :param value: the string
+    :param algorithm: 'zlib' or 'zstd' (requires the zstandard package). Default: 'zlib'
+    :param level: compression level. Default: None (default level of the algorithm)
+    :return: the compressed value including the marker byte
+    """
+    data = value.encode("utf-8")
+    if algorithm == "zlib":
+        return ZLIB_MARKER + zlib.compress(data, -1 if level is None else level)
+    if algorithm == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package")
+        return ZSTD_MARKER + zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    raise ValueError("unknown compression algorithm: %s" % algorithm)
+
+
+def decompress_text(value):
+    """
+    Decompresses a value that was compressed with :func:`compress_text`. Strings are returned unchanged, i.e., legacy
+    values that were stored without compression are read transparently.
+
+    :param value: compressed value or string
+    :return: the string
+    """
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    marker, data = value[:1], value[1:]
+    if marker == ZLIB_MARKER:
+        return zlib.decompress(data).decode("utf-8")
+    if marker == ZSTD_MARKER:
+        if zstandard is None:
+            raise ImportError("zstd decompression requires the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    raise ValueError("unknown compression marker: %r" % marker)
+
+
+class CompressedStringField(StringField):
+    """
+    A unicode string field that is stored compressed as binary value with a leading marker byte that identifies the
+    compression algorithm.
+
+    Values are only decompressed on first access of the attribute and documents that are loaded and saved without
+    accessing the attribute keep the compressed value as is. Legacy documents, in which the value is stored as plain
+    string, are read transparently. Strings that are shorter than min_length_to_compress are stored as plain string.
+    Note that compressed values cannot be used in string queries, e.g., equality or regular expressions.
+
+    :param algorithm: 'zlib' or 'zstd' (requires the zstandard package). Default: 'zlib'
+    :param level: compression level. Default: None (default level of the algorithm)
+    :param min_length_to_compress: minimal length of strings that are compressed. Default: 128
+    """
+
+    def __init__(self, algorithm="zlib", level=None, min_length_to_compress=128, **kwargs):
+        self.algorithm = algorithm
+        self.level = level
+        self.min_length_to_compress = min_length_to_compress
+        super().__init__(**kwargs)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance._data.get(self.name)
+        if isinstance(value, bytes):
+            value = decompress_text(value)
+            instance._data[self.name] = value
+        return value
+
+    def to_python(self, value):
+        if isinstance(value, Binary):
+            return bytes(value)
+        return value
+
+    def to_mongo(self, value):
+        if isinstance(value, bytes):
+            return Binary(value)
+        if isinstance(value, str) and len(value) >= self.min_length_to_compress:
+            return Binary(compress_text(value, self.algorithm, self.level))
+        return value
+
+    def validate(self, value):
+        # compressed values were already validated before they were stored
+        if not isinstance(value, bytes):
+            super().validate(value)
+
+
+def inflate_raw_bson(value):
+    """
+    Decodes :class:`~bson.raw_bson.RawBSONDocument` values, also within lists, into dicts.
+
+    :param value: the value
+    :return: the decoded value
+    """
+    if isinstance(value, RawBSONDocument):
+        return bson.decode(value.raw)
+    if isinstance(value, list):
+        return [inflate_raw_bson(item) for item in value]
+    return value
+
+
+class _Undecoded(object):
+    """
+    Holds a value as it was read from the database until the value is accessed for the first time. Documents wrap the
+    values of lazy fields when they are created from the database.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class _LazyDecodingMixin(object):
+    """
+    Defers the conversion of the value that was read from the database to the first access of the attribute. Together
+    with :meth:`~pycoshark.mongomodels.SmartSHARKQuerySet.raw_bson`, the value is kept as raw BSON until then.
+    """
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance._data.get(self.name)
+        if isinstance(value, _Undecoded):
+            instance._data[self.name] = super().to_python(inflate_raw_bson(value.value))
+        return super().__get__(instance, owner)
+
+    def to_python(self, value):
+        if isinstance(value, _Undecoded):
+            return value
+        return super().to_python(value)
+
+    def to_mongo(self, value, use_db_field=True, fields=None):
+        if isinstance(value, _Undecoded):
+            return value.value
+        return super().to_mongo(value, use_db_field=use_db_field, fields=fields)
+
+    def validate(self, value):
+        # values that were not accessed are the unchanged values from the database
+        if not isinstance(value, _Undecoded):
+            super().validate(value)
+
+    def is_decoded(self, instance):
+        """
+        :param instance: a document
+        :return: True if the value of the field was already decoded for the document
+        """
+        return not isinstance(instance._data.get(self.name), _Undecoded)
+
+    def peek(self, instance, key, default=None):
+        """
+        Returns a single entry of the value without decoding the whole value, e.g.,
+        ``CodeEntityState.metrics.peek(state, "LOC")``. If the value was already decoded, the decoded value is used.
+
+        :param instance: a document
+        :param key: the key of a dict or the index of a list
+        :param default: value that is returned if there is no such entry. Default: None
+        :return: the entry
+        """
+        value = instance._data.get(self.name)
+        if isinstance(value, _Undecoded):
+            value = value.value
+        else:
+            value = self.__get__(instance, type(instance))
+        try:
+            return inflate_raw_bson(value[key])
+        except (KeyError, IndexError, TypeError):
+            return default
+
+
+class LazyDictField(_LazyDecodingMixin, DictField):
+    """
+    A :class:`~mongoengine.fields.DictField` that is only converted on first access of the attribute. Documents that
+    are loaded and saved without accessing the attribute keep the value from the database as is.
+    """
+
+
+class LazyListField(_LazyDecodingMixin, ListField):
+    """
+    A :class:`~mongoengine.fields.ListField` that is only converted on first access of the attribute. Documents that
+    are loaded and saved without accessing the attribute keep the value from the database as is.
+    """
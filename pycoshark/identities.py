@@ -0,0 +1,339 @@
+"""
+Merging of :class:`~pycoshark.mongomodels.People` into :class:`~pycoshark.mongomodels.Identity` documents.
+
+Instead of comparing all people pairwise, the people are grouped into blocks by blocking keys, e.g., the local part of
+the email address or the tokens of the name, and only people within the same block are compared. Matches are merged
+with a union-find structure.
+"""
+
+import collections
+import itertools
+import re
+import unicodedata
+
+from bson import ObjectId
+from pymongo import DeleteOne, InsertOne, UpdateOne
+from textdistance import levenshtein
+
+from pycoshark.mongomodels import Identity, People
+
+# local parts of email addresses that are shared by many unrelated people
+GENERIC_LOCAL_PARTS = frozenset(
+    ["admin", "bot", "build", "dev", "info", "jenkins", "jira", "mail", "no-reply", "noreply", "root", "user"]
+)
+
+# names that are used by many unrelated people
+GENERIC_NAMES = frozenset(["", "unknown", "none", "null", "root", "admin", "jenkins", "jira"])
+
+
+def normalize_name(name):
+    """
+    Normalizes a name for comparisons, i.e., removes accents, punctuation, and whitespace differences and lowercases
+    the name. The order of the tokens is kept.
+
+    :param name: the name
+    :return: the normalized name
+    """
+    if not name:
+        return ""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(re.findall(r"[a-z0-9]+", name.lower()))
+
+
+def email_local_part(email):
+    """
+    Returns the normalized local part of an email address, i.e., the part before the @ without subaddresses (+tag)
+    and separators.
+
+    :param email: the email address
+    :return: the normalized local part
+    """
+    if not email:
+        return ""
+    local = email.lower().split("@", 1)[0].split("+", 1)[0]
+    return re.sub(r"[^a-z0-9]", "", local)
+
+
+def blocking_keys(name, email, username=None):
+    """
+    Returns the blocking keys of a person. Only people that share at least one blocking key are compared.
+
+    :param name: the name of the person
+    :param email: the email address of the person
+    :param username: the username of the person. Default: None
+    :return: set of blocking keys
+    """
+    keys = set()
+    local = email_local_part(email)
+    if len(local) >= 3 and local not in GENERIC_LOCAL_PARTS:
+        keys.add("email:" + local)
+    if username:
+        user = re.sub(r"[^a-z0-9]", "", username.lower())
+        if len(user) >= 3 and user not in GENERIC_LOCAL_PARTS:
+            keys.add("email:" + user)
+    normalized = normalize_name(name)
+    if normalized not in GENERIC_NAMES:
+        tokens = normalized.split()
+        keys.add("name:" + " ".join(sorted(tokens)))
+        keys.add("email:" + "".join(tokens))
+        for token in tokens:
+            if len(token) >= 3:
+                keys.add("token:" + token)
+    return keys
+
+
+class UnionFind(object):
+    """
+    Union-find structure with path compression and union by size.
+    """
+
+    def __init__(self):
+        self.parents = {}
+        self.sizes = {}
+
+    def add(self, item):
+        """
+        Adds an item as its own set, if it is not already known.
+
+        :param item: the item
+        """
+        if item not in self.parents:
+            self.parents[item] = item
+            self.sizes[item] = 1
+
+    def find(self, item):
+        """
+        :param item: the item
+        :return: the representative of the set of the item
+        """
+        self.add(item)
+        root = item
+        while self.parents[root] != root:
+            root = self.parents[root]
+        while self.parents[item] != root:
+            self.parents[item], item = root, self.parents[item]
+        return root
+
+    def union(self, first, second):
+        """
+        Merges the sets of two items.
+
+        :param first: the first item
+        :param second: the second item
+        :return: True if the sets were merged, False if the items were already in the same set
+        """
+        first = self.find(first)
+        second = self.find(second)
+        if first == second:
+            return False
+        if self.sizes[first] < self.sizes[second]:
+            first, second = second, first
+        self.parents[second] = first
+        self.sizes[first] += self.sizes.pop(second)
+        return True
+
+    def groups(self):
+        """
+        :return: list of lists with the items of each set
+        """
+        groups = collections.defaultdict(list)
+        for item in self.parents:
+            groups[self.find(item)].append(item)
+        return list(groups.values())
+
+
+class _Person(object):
+    __slots__ = ("id", "name", "email", "local", "domain", "username")
+
+    def __init__(self, document):
+        self.id = document["_id"]
+        self.name = normalize_name(document.get("name"))
+        self.email = (document.get("email") or "").lower().strip()
+        self.local = email_local_part(self.email)
+        self.domain = self.email.split("@", 1)[1] if "@" in self.email else ""
+        self.username = (document.get("username") or "").lower().strip()
+
+
+def _similar_names(first, second, threshold):
+    if first.name == second.name:
+        return True
+    if abs(len(first.name) - len(second.name)) > (1 - threshold) * max(len(first.name), len(second.name)):
+        return False
+    return levenshtein.normalized_similarity(first.name, second.name) >= threshold
+
+
+def _is_match(first, second, threshold):
+    """
+    Decides if two people of the same block are the same person.
+    """
+    if first.email and first.email == second.email:
+        return True
+    named = first.name not in GENERIC_NAMES and second.name not in GENERIC_NAMES
+    if named and first.name == second.name and " " in first.name:
+        return True
+    if len(first.local) >= 4 and first.local == second.local and first.local not in GENERIC_LOCAL_PARTS:
+        # local parts like support@ are shared by unrelated people at different domains
+        if (first.domain and first.domain == second.domain) or (named and _similar_names(first, second, threshold)):
+            return True
+    if first.username and len(first.username) >= 4 and first.username in (second.username, second.local):
+        return True
+    if second.username and len(second.username) >= 4 and second.username == first.local:
+        return True
+    if named and " " in first.name and " " in second.name:
+        return _similar_names(first, second, threshold)
+    return False
+
+
+class IdentityIndex(object):
+    """
+    In-memory index from people to identities.
+
+    :param groups: iterable of tuples with the id of an identity and the ids of its people
+    """
+
+    def __init__(self, groups=()):
+        self._identities = {}
+        self._people = {}
+        for identity_id, people in groups:
+            people = list(people)
+            self._people[identity_id] = people
+            for person_id in people:
+                self._identities[person_id] = identity_id
+
+    @classmethod
+    def load(cls):
+        """
+        Loads the index from the identity collection.
+
+        :return: :class:`IdentityIndex`
+        """
+        return cls((d["_id"], d.get("people", [])) for d in Identity.objects.as_pymongo())
+
+    def __len__(self):
+        return len(self._people)
+
+    def __contains__(self, person_id):
+        return person_id in self._identities
+
+    def identity_of(self, person_id):
+        """
+        :param person_id: id of a person
+        :return: id of the identity of the person or None
+        """
+        return self._identities.get(person_id)
+
+    def people_of(self, person_id):
+        """
+        :param person_id: id of a person
+        :return: ids of all people with the same identity as the person, including the person
+        """
+        identity_id = self._identities.get(person_id)
+        if identity_id is None:
+            return [person_id]
+        return list(self._people[identity_id])
+
+    def same_identity(self, first, second):
+        """
+        :param first: id of a person
+        :param second: id of a person
+        :return: True if both people have the same identity
+        """
+        return first == second or (
+            self._identities.get(first) is not None and self._identities.get(first) == self._identities.get(second)
+        )
+
+
+def merge_identities(threshold=0.9, max_block_size=200, write=True, batch_size=1000, silent=True):
+    """
+    Merges all people into identities. Existing identities are kept and extended, i.e., people that share an identity
+    are never split. People without matches get an identity of their own.
+
+    Two people of the same block are the same person if they have the same email address, the same name with at least
+    two tokens, the same email local part and either the same domain or similar names, a username that equals the
+    username or email local part of the other, or if the normalized Levenshtein similarity of their names is at least
+    the threshold. Blocks with more than max_block_size people, e.g., of common first names, are skipped. Existing
+    identities are only deleted if their people were merged into another identity.
+
+    :param threshold: minimal similarity of the names. Default: 0.9
+    :param max_block_size: maximal number of people in a block that are compared. Default: 200
+    :param write: if True, the identities are written to the identity collection with bulk writes. Default: True
+    :param batch_size: number of write operations per bulk write. Default: 1000
+    :param silent: if False, the number of compared pairs and identities is printed. Default: True
+    :return: :class:`IdentityIndex` with the merged identities
+    """
+    people = {}
+    blocks = collections.defaultdict(list)
+    for document in People.objects.only("name", "email", "username").as_pymongo():
+        person = _Person(document)
+        people[person.id] = person
+        for key in blocking_keys(person.name, person.email, person.username):
+            blocks[key].append(person)
+
+    union_find = UnionFind()
+    for person_id in people:
+        union_find.add(person_id)
+
+    existing = {}
+    for document in Identity.objects.as_pymongo():
+        existing[document["_id"]] = document.get("people", [])
+        for first, second in zip(document.get("people", []), document.get("people", [])[1:]):
+            union_find.union(first, second)
+
+    comparisons = 0
+    for block in blocks.values():
+        if len(block) < 2 or len(block) > max_block_size:
+            continue
+        for first, second in itertools.combinations(block, 2):
+            if union_find.find(first.id) == union_find.find(second.id):
+                continue
+            comparisons += 1
+            if _is_match(first, second, threshold):
+                union_find.union(first.id, second.id)
+
+    groups = _assign_identity_ids(union_find.groups(), existing)
+    if not silent:
+        print("compared %i pairs of %i people, found %i identities" % (comparisons, len(people), len(groups)))
+    if write:
+        _write_identities(groups, existing, batch_size)
+    return IdentityIndex(groups)
+
+
+def _assign_identity_ids(groups, existing):
+    """
+    Keeps the id of an existing identity for each group, if there is one. Groups without existing identity get a new
+    id.
+    """
+    identity_of = {}
+    for identity_id, people in existing.items():
+        for person_id in people:
+            identity_of.setdefault(person_id, identity_id)
+    result = []
+    for people in groups:
+        identity_ids = sorted({identity_of[p] for p in people if p in identity_of})
+        result.append((identity_ids[0] if identity_ids else ObjectId(), people))
+    return result
+
+
+def _write_identities(groups, existing, batch_size):
+    collection = Identity._get_collection()
+    requests = []
+    kept = set()
+    grouped = set()
+    for identity_id, people in groups:
+        grouped.update(people)
+        if identity_id not in existing:
+            requests.append(InsertOne({"_id": identity_id, "people": people}))
+        else:
+            kept.add(identity_id)
+            if set(existing[identity_id]) != set(people):
+                requests.append(UpdateOne({"_id": identity_id}, {"$set": {"people": people}}))
+    # identities whose people were merged into another identity are replaced, identities of people that are not in
+    # the people collection anymore are left as they are
+    requests.extend(
+        DeleteOne({"_id": identity_id})
+        for identity_id, people in existing.items()
+        if identity_id not in kept and any(person_id in grouped for person_id in people)
+    )
+    for i in range(0, len(requests), batch_size):
+        collection.bulk_write(requests[i : i + batch_size], ordered=False)
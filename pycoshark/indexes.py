@@ -0,0 +1,148 @@
+"""
+Provisioning of the indexes of all smartSHARK collections.
+
+Besides the indexes that are declared in the meta data of the models, a curated set of compound indexes for frequent
+queries is created. The indexes of different collections are built in parallel. Usage::
+
+    $ python -m pycoshark.indexes -DB smartshark --dry-run
+    $ python -m pycoshark.indexes -DB smartshark --workers 8
+"""
+
+import collections
+import contextvars
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pymongo import IndexModel
+
+import pycoshark
+from pycoshark.mongomodels import BaseSystem, Commit, FileAction, IssueEvent, get_document_classes
+from pycoshark.utils import create_mongodb_uri_string, get_base_argparser, get_mongo_client
+
+# compound indexes for frequent queries that are not declared in the models
+COMPOUND_INDEXES = {
+    # get_last_system_id
+    BaseSystem: [[("url", 1), ("collection_date", -1)]],
+    # heuristic_renames
+    FileAction: [[("commit_id", 1), ("mode", 1)]],
+    # get_commit_graph, heuristic_renames
+    Commit: [[("vcs_system_ids", 1), ("revision_hash", 1)]],
+    # jira_is_resolved_and_fixed
+    IssueEvent: [[("issue_id", 1), ("created_at", 1)]],
+}
+
+IndexSpec = collections.namedtuple("IndexSpec", ["collection", "keys", "options", "origin"])
+IndexSpec.__doc__ = """
+An index that is provisioned.
+
+:property collection: name of the collection
+:property keys: list of tuples with the field names and directions
+:property options: dict with the options of the index, e.g., unique
+:property origin: 'declared' for indexes of the models, 'compound' for indexes from COMPOUND_INDEXES
+"""
+
+
+def get_index_specs(document_classes=None):
+    """
+    Returns the declared and compound indexes of document classes.
+
+    :param document_classes: the document classes. Default: None (all document classes)
+    :return: OrderedDict with the collection names as keys and lists of :class:`IndexSpec` as values
+    """
+    if document_classes is None:
+        document_classes = get_document_classes()
+    specs = collections.OrderedDict()
+    for document_class in document_classes:
+        collection = document_class._get_collection_name()
+        collection_specs = specs.setdefault(collection, [])
+        for spec in document_class._meta.get("index_specs", []):
+            options = {k: v for k, v in spec.items() if k != "fields"}
+            collection_specs.append(IndexSpec(collection, list(spec["fields"]), options, "declared"))
+        for base, compound_indexes in COMPOUND_INDEXES.items():
+            if issubclass(document_class, base):
+                for keys in compound_indexes:
+                    collection_specs.append(IndexSpec(collection, keys, {}, "compound"))
+    return specs
+
+
+def provision_indexes(db, document_classes=None, workers=4, dry_run=False, silent=False):
+    """
+    Creates all missing declared and compound indexes. The missing indexes of each collection are built together in
+    a single command and the collections are processed in parallel.
+
+    :param db: pymongo database
+    :param document_classes: the document classes. Default: None (all document classes)
+    :param workers: number of collections that are processed in parallel. Default: 4
+    :param dry_run: if True, the indexes are only listed. Default: False
+    :param silent: if False, the indexes and the progress are printed. Default: False
+    :return: list of the :class:`IndexSpec` of the missing indexes
+    """
+    missing = collections.OrderedDict()
+    for collection, specs in get_index_specs(document_classes).items():
+        existing = {tuple(tuple(key) for key in info["key"]) for info in db[collection].index_information().values()}
+        for spec in specs:
+            if tuple(spec.keys) in existing:
+                state = "exists"
+            else:
+                state = "missing"
+                existing.add(tuple(spec.keys))
+                missing.setdefault(collection, []).append(spec)
+            if not silent and dry_run:
+                print("%-8s %-9s %s: %s %s" % (state, spec.origin, collection, _format_keys(spec.keys), spec.options))
+
+    missing_specs = [spec for specs in missing.values() for spec in specs]
+    if dry_run or not missing:
+        if not silent:
+            print("%i indexes missing in %i collections" % (len(missing_specs), len(missing)))
+        return missing_specs
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(contextvars.copy_context().run, _create_indexes, db, collection, specs): collection
+            for collection, specs in missing.items()
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            collection = futures[future]
+            seconds = future.result()
+            if not silent:
+                print(
+                    "[%i/%i] created %i indexes on %s in %.1fs"
+                    % (i, len(missing), len(missing[collection]), collection, seconds)
+                )
+    return missing_specs
+
+
+def _create_indexes(db, collection, specs):
+    start = time.perf_counter()
+    db[collection].create_indexes([IndexModel(spec.keys, background=True, **spec.options) for spec in specs])
+    return time.perf_counter() - start
+
+
+def _format_keys(keys):
+    return ", ".join("%s:%s" % (field, direction) for field, direction in keys)
+
+
+def main(argv=None):
+    parser = get_base_argparser(
+        "Creates the declared and compound indexes of all smartSHARK collections.", pycoshark.__version__
+    )
+    parser.add_argument("--dry-run", help="Only list the indexes", default=False, action="store_true")
+    parser.add_argument("--workers", help="Number of collections that are indexed in parallel", default=4, type=int)
+    parser.add_argument(
+        "--collections", help="Comma separated list of collections that are indexed (default: all)", default=None
+    )
+    args = parser.parse_args(argv)
+
+    document_classes = get_document_classes()
+    if args.collections:
+        selected = set(args.collections.split(","))
+        document_classes = [c for c in document_classes if c._get_collection_name() in selected]
+    uri = create_mongodb_uri_string(
+        args.db_user, args.db_password, args.db_hostname, args.db_port, args.db_authentication, args.ssl
+    )
+    db = get_mongo_client(uri)[args.db_database]
+    provision_indexes(db, document_classes, workers=args.workers, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
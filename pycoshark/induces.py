@@ -0,0 +1,199 @@
+"""
+Inverted index over :attr:`~pycoshark.mongomodels.FileAction.induces`, which is materialized in the
+:class:`~pycoshark.mongomodels.InducingLink` collection.
+
+The induces lists are stored in the inducing file actions, hence finding the inducing file actions of a bug fix or the
+links with a label requires a scan of all file actions. The inverted index contains one document per entry of the
+induces lists and is updated incrementally, i.e., only the links of file actions whose induces list changed since the
+last update are written again::
+
+    update_inducing_links(vcs_system_id=vcs_system_id)
+    inducing = get_inducing_links(change_file_action_ids=[fix_file_action_id], labels=["JLMIV+R"])
+"""
+
+import collections
+import hashlib
+
+import bson
+
+from pymongo import DeleteMany, InsertOne
+
+from pycoshark.mongomodels import Commit, FileAction, InducingLink
+
+
+def _induces_hash(induces):
+    return hashlib.sha1(bson.encode({"induces": induces})).hexdigest()
+
+
+def _chunks(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def _update_scope(file_action_query, link_query, batch_size):
+    """
+    Updates the links of the file actions that match a query. A file action is only skipped if its links have the
+    hash of its current induces list and all of them exist, such that the links of a file action whose update was
+    interrupted are written again.
+
+    :return: tuple of the numbers of inserted links, deleted links, and unchanged file actions
+    """
+    # hashes and numbers of the links of the indexed file actions
+    indexed = {}
+    for link in InducingLink._get_collection().find(link_query, {"inducing_file_action_id": 1, "induces_hash": 1}):
+        hashes = indexed.setdefault(link["inducing_file_action_id"], collections.Counter())
+        hashes[link.get("induces_hash")] += 1
+    file_action_query = dict(file_action_query, **{"induces.0": {"$exists": True}})
+    changed = []
+    unchanged = 0
+    for file_action in FileAction._get_collection().find(
+        file_action_query, {"commit_id": 1, "file_id": 1, "induces": 1}
+    ):
+        induces_hash = _induces_hash(file_action["induces"])
+        links = sum(1 for entry in file_action["induces"] if entry.get("change_file_action_id") is not None)
+        if indexed.pop(file_action["_id"], None) == ({induces_hash: links} if links else None):
+            unchanged += 1
+        else:
+            changed.append((file_action, induces_hash))
+
+    # the commits of the changing file actions are resolved at once
+    change_commit_ids = {}
+    change_file_action_ids = {
+        entry.get("change_file_action_id") for file_action, _ in changed for entry in file_action["induces"]
+    }
+    change_file_action_ids.discard(None)
+    for chunk in _chunks(change_file_action_ids, batch_size):
+        for change in FileAction._get_collection().find({"_id": {"$in": chunk}}, {"commit_id": 1}):
+            change_commit_ids[change["_id"]] = change["commit_id"]
+
+    # links of changed file actions and of file actions whose induces list is now empty are replaced
+    stale_ids = [file_action["_id"] for file_action, _ in changed] + list(indexed)
+    requests = [DeleteMany({"inducing_file_action_id": {"$in": chunk}}) for chunk in _chunks(stale_ids, batch_size)]
+    inserted = 0
+    for file_action, induces_hash in changed:
+        for entry in file_action["induces"]:
+            if entry.get("change_file_action_id") is None:
+                continue
+            link = {
+                "inducing_file_action_id": file_action["_id"],
+                "inducing_commit_id": file_action["commit_id"],
+                "inducing_file_id": file_action.get("file_id"),
+                "change_file_action_id": entry["change_file_action_id"],
+                "change_commit_id": change_commit_ids.get(entry["change_file_action_id"]),
+                "label": entry.get("label"),
+                "induces_hash": induces_hash,
+            }
+            if entry.get("szz_type") is not None:
+                link["szz_type"] = entry["szz_type"]
+            requests.append(InsertOne(link))
+            inserted += 1
+
+    deleted = 0
+    for chunk in _chunks(requests, batch_size):
+        # deletes must be applied before the inserts
+        result = InducingLink._get_collection().bulk_write(chunk, ordered=True)
+        deleted += result.deleted_count
+    return inserted, deleted, unchanged
+
+
+def update_inducing_links(vcs_system_id=None, commit_ids=None, commit_chunk_size=1000, batch_size=1000, silent=True):
+    """
+    Updates the inverted index of the induces lists of file actions. Only the links of file actions whose induces list
+    changed since the last update are replaced.
+
+    :param vcs_system_id: id of the vcs system whose file actions are updated. Default: None
+    :param commit_ids: ids of the inducing commits whose file actions are updated. Default: None (all commits of the
+    vcs system, or all file actions if no vcs system is given)
+    :param commit_chunk_size: number of commits that are updated at once. Default: 1000
+    :param batch_size: number of write operations per bulk write. Default: 1000
+    :param silent: if False, the progress is printed. Default: True
+    :return: dict with the numbers of inserted links, deleted links, and unchanged file actions
+    """
+    if commit_ids is None and vcs_system_id is not None:
+        commit_ids = [c["_id"] for c in Commit.objects(vcs_system_ids=vcs_system_id).only("id").as_pymongo()]
+
+    if commit_ids is None:
+        scopes = [({}, {})]
+    else:
+        scopes = (
+            ({"commit_id": {"$in": chunk}}, {"inducing_commit_id": {"$in": chunk}})
+            for chunk in _chunks(commit_ids, commit_chunk_size)
+        )
+
+    stats = {"inserted": 0, "deleted": 0, "unchanged": 0}
+    for file_action_query, link_query in scopes:
+        inserted, deleted, unchanged = _update_scope(file_action_query, link_query, batch_size)
+        stats["inserted"] += inserted
+        stats["deleted"] += deleted
+        stats["unchanged"] += unchanged
+        if not silent:
+            print(
+                "inducing links: %i inserted, %i deleted, %i file actions unchanged"
+                % (stats["inserted"], stats["deleted"], stats["unchanged"])
+            )
+    return stats
+
+
+def _query_links(field, ids, labels, batch_size):
+    result = collections.defaultdict(list)
+    query = {}
+    if labels is not None:
+        query["label"] = {"$in": list(labels)}
+    for chunk in _chunks(ids, batch_size):
+        for link in InducingLink.objects(**{field + "__in": chunk}, __raw__=query):
+            result[getattr(link, field)].append(link)
+    return result
+
+
+def get_inducing_links(
+    inducing_file_action_ids=None,
+    inducing_commit_ids=None,
+    change_file_action_ids=None,
+    change_commit_ids=None,
+    labels=None,
+    batch_size=1000,
+):
+    """
+    Returns the links of several file actions or commits at once, e.g., the inducing file actions of bug fixes or the
+    fixes that point at inducing commits. Exactly one of the id lists must be given.
+
+    :param inducing_file_action_ids: ids of inducing file actions. Default: None
+    :param inducing_commit_ids: ids of inducing commits. Default: None
+    :param change_file_action_ids: ids of changing file actions, e.g., of bug fixes. Default: None
+    :param change_commit_ids: ids of changing commits. Default: None
+    :param labels: only links with these labels are returned. Default: None (all labels)
+    :param batch_size: number of ids per query. Default: 1000
+    :return: dict with the given ids as keys and lists of :class:`~pycoshark.mongomodels.InducingLink` as values, ids
+    without links are missing
+    """
+    given = {
+        field: ids
+        for field, ids in (
+            ("inducing_file_action_id", inducing_file_action_ids),
+            ("inducing_commit_id", inducing_commit_ids),
+            ("change_file_action_id", change_file_action_ids),
+            ("change_commit_id", change_commit_ids),
+        )
+        if ids is not None
+    }
+    if len(given) != 1:
+        raise ValueError("exactly one of the id lists must be given")
+    field, ids = given.popitem()
+    return dict(_query_links(field, ids, labels, batch_size))
+
+
+def get_links_by_label(label, inducing_commit_ids=None, batch_size=1000):
+    """
+    Returns the links with a label.
+
+    :param label: the label
+    :param inducing_commit_ids: only links of these inducing commits are returned. Default: None (all links)
+    :param batch_size: number of ids per query. Default: 1000
+    :return: generator of :class:`~pycoshark.mongomodels.InducingLink`
+    """
+    if inducing_commit_ids is None:
+        yield from InducingLink.objects(label=label)
+        return
+    for chunk in _chunks(inducing_commit_ids, batch_size):
+        yield from InducingLink.objects(label=label, inducing_commit_id__in=chunk)
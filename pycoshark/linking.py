@@ -0,0 +1,209 @@
+"""
+Linking of commits to issues by the issue keys in the commit messages, e.g., ZOOKEEPER-123.
+
+All issue keys of the issue systems of a project are compiled into one Aho-Corasick automaton, such that each commit
+message is scanned once, regardless of the number of issues. The commits are streamed in batches and the
+linked_issue_ids are written with bulk updates::
+
+    stats = link_commits_to_issues(vcs_system_id, collect_matches=True)
+    for match in stats["matches"]:
+        print(match.commit_id, match.external_id, match.start, match.end)
+"""
+
+import collections
+
+from pymongo import UpdateOne
+
+from pycoshark.mongomodels import Commit, Issue, IssueSystem, VCSSystem
+
+IssueMatch = collections.namedtuple("IssueMatch", ["commit_id", "issue_id", "external_id", "start", "end"])
+IssueMatch.__doc__ = """
+Occurrence of an issue key in a commit message, see :func:`iter_issue_matches`.
+
+:property commit_id: id of the commit
+:property issue_id: id of the issue
+:property external_id: external_id of the issue
+:property start: offset of the first character of the key in the message
+:property end: offset after the last character of the key in the message
+"""
+
+# only ASCII letters are folded, such that the offsets in the folded text are the offsets in the original text
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+class KeywordAutomaton(object):
+    """
+    Aho-Corasick automaton that finds all occurrences of a set of keywords in a text in a single pass.
+
+    Occurrences that are part of a longer word are ignored, e.g., ZOOKEEPER-12 is not found in ZOOKEEPER-123.
+
+    :param keywords: dict with the keywords as keys and arbitrary values, e.g., the ids of the issues
+    :param ignore_case: if True, ASCII letters are matched case insensitive. Default: True
+    """
+
+    def __init__(self, keywords, ignore_case=True):
+        self.ignore_case = ignore_case
+        # goto function, failure function, and the keywords that end in each state
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        self._values = {}
+        for keyword, value in keywords.items():
+            folded = self._fold(keyword)
+            if not folded:
+                continue
+            self._values.setdefault(folded, []).append((keyword, value))
+            state = 0
+            for char in folded:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] = (folded,)
+
+        # failure links in breadth-first order
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def __len__(self):
+        return len(self._values)
+
+    def _fold(self, text):
+        return text.translate(_ASCII_LOWER) if self.ignore_case else text
+
+    def find(self, text):
+        """
+        Finds all occurrences of the keywords in a text.
+
+        :param text: the text
+        :return: list of tuples (start, end, keyword, value) in the order of the end offsets
+        """
+        matches = []
+        if not text:
+            return matches
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for position, char in enumerate(self._fold(text)):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for folded in output[state]:
+                start = position + 1 - len(folded)
+                end = position + 1
+                if (start > 0 and text[start - 1].isalnum()) or (end < len(text) and text[end].isalnum()):
+                    continue
+                for keyword, value in self._values[folded]:
+                    matches.append((start, end, keyword, value))
+        return matches
+
+
+def build_issue_automaton(project_id=None, issue_system_ids=None, ignore_case=True):
+    """
+    Builds the automaton of the issue keys, i.e., the external_id of the issues, of issue systems.
+
+    :param project_id: id of the project whose issue systems are used. Default: None
+    :param issue_system_ids: ids of the issue systems. Default: None (all issue systems of the project)
+    :param ignore_case: if True, the keys are matched case insensitive. Default: True
+    :return: :class:`KeywordAutomaton` with the issue ids as values
+    """
+    if issue_system_ids is None:
+        if project_id is None:
+            raise ValueError("either the project or the issue systems must be given")
+        issue_system_ids = [s["_id"] for s in IssueSystem.objects(project_id=project_id).only("id").as_pymongo()]
+    keys = {}
+    for issue in Issue.objects(issue_system_ids__in=list(issue_system_ids)).only("id", "external_id").as_pymongo():
+        if issue.get("external_id"):
+            # if several issue systems use the same key, the first issue wins
+            keys.setdefault(issue["external_id"], issue["_id"])
+    return KeywordAutomaton(keys, ignore_case=ignore_case)
+
+
+def iter_issue_matches(vcs_system_id, automaton, batch_size=1000):
+    """
+    Streams the commits of a vcs system and finds the issue keys in their messages.
+
+    :param vcs_system_id: id of the vcs system
+    :param automaton: automaton of the issue keys, see :func:`build_issue_automaton`
+    :param batch_size: number of commits that are read at once. Default: 1000
+    :return: generator of tuples of the commit as dict with the id, message, and linked_issue_ids and the list of
+    :class:`IssueMatch` of the commit
+    """
+    commits = (
+        Commit.objects(vcs_system_ids=vcs_system_id)
+        .only("id", "message", "linked_issue_ids")
+        .batch_size(batch_size)
+        .as_pymongo()
+    )
+    for commit in commits:
+        yield commit, [
+            IssueMatch(commit["_id"], issue_id, external_id, start, end)
+            for start, end, external_id, issue_id in automaton.find(commit.get("message"))
+        ]
+
+
+def link_commits_to_issues(
+    vcs_system_id,
+    issue_system_ids=None,
+    automaton=None,
+    batch_size=1000,
+    write=True,
+    collect_matches=False,
+    silent=True,
+):
+    """
+    Sets the linked_issue_ids of the commits of a vcs system to the issues whose keys occur in the commit messages.
+    Only commits whose linked issues change are updated.
+
+    :param vcs_system_id: id of the vcs system
+    :param issue_system_ids: ids of the issue systems. Default: None (all issue systems of the project of the vcs
+    system)
+    :param automaton: automaton of the issue keys. Default: None (built with :func:`build_issue_automaton`)
+    :param batch_size: number of commits that are read and updated at once. Default: 1000
+    :param write: if False, the commits are not updated. Default: True
+    :param collect_matches: if True, the matches are returned, e.g., for auditing. Default: False
+    :param silent: if False, the progress is printed. Default: True
+    :return: dict with the numbers of commits, linked commits, and updated commits, and the list of
+    :class:`IssueMatch` as matches if collect_matches is True
+    """
+    if automaton is None:
+        project_id = VCSSystem.objects(id=vcs_system_id).only("project_id").get().project_id
+        automaton = build_issue_automaton(project_id=project_id, issue_system_ids=issue_system_ids)
+
+    collection = Commit._get_collection()
+    stats = {"commits": 0, "linked": 0, "updated": 0}
+    if collect_matches:
+        stats["matches"] = []
+    requests = []
+    for commit, matches in iter_issue_matches(vcs_system_id, automaton, batch_size):
+        stats["commits"] += 1
+        issue_ids = list(dict.fromkeys(match.issue_id for match in matches))
+        if issue_ids:
+            stats["linked"] += 1
+        if collect_matches:
+            stats["matches"].extend(matches)
+        if set(issue_ids) != set(commit.get("linked_issue_ids") or []):
+            stats["updated"] += 1
+            if write:
+                requests.append(UpdateOne({"_id": commit["_id"]}, {"$set": {"linked_issue_ids": issue_ids}}))
+        if len(requests) >= batch_size:
+            collection.bulk_write(requests, ordered=False)
+            requests = []
+        if not silent and stats["commits"] % 10000 == 0:
+            print("linked %i of %i commits" % (stats["linked"], stats["commits"]))
+    if requests:
+        collection.bulk_write(requests, ordered=False)
+    if not silent:
+        print("linked %i of %i commits, updated %i commits" % (stats["linked"], stats["commits"], stats["updated"]))
+    return stats
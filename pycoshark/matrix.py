@@ -0,0 +1,137 @@
+"""
+Extraction of metrics into NumPy arrays, e.g., to build the training data of defect prediction models.
+
+This module requires NumPy.
+"""
+
+import collections
+import math
+import numbers
+
+import numpy as np
+
+from pycoshark.mongomodels import CodeEntityState, CodeGroupState, Commit, StaticWarning
+
+# fields that identify the rows of the matrix
+INDEX_FIELDS = {
+    CodeEntityState: ("commit_id", "file_id", "long_name"),
+    CodeGroupState: ("commit_id", "long_name"),
+    StaticWarning: ("commit_id", "file_id"),
+}
+
+MetricsMatrix = collections.namedtuple("MetricsMatrix", ["values", "metric_names", "index_fields", "index"])
+MetricsMatrix.__doc__ = """
+Result of :func:`extract_metrics_matrix`.
+
+:property values: float array with one row per document and one column per metric, missing and non-numeric metrics
+are NaN
+:property metric_names: names of the metrics in the order of the columns
+:property index_fields: names of the fields that identify the rows
+:property index: list with one tuple of the index fields per row
+"""
+
+
+def extract_metrics_matrix(
+    vcs_system_id,
+    commit_ids=None,
+    document_class=CodeEntityState,
+    metric_names=None,
+    query=None,
+    commit_chunk_size=1000,
+    batch_size=10000,
+    dtype=np.float64,
+):
+    """
+    Extracts the metrics of code entity states, code group states, or static warnings of a set of commits into a
+    preallocated float array. The documents are streamed in batches and each batch is copied into the array at once.
+    Only int, float, and bool values are copied, missing and non-numeric values, e.g., None or strings, are NaN.
+
+    :param vcs_system_id: id of the vcs system
+    :param commit_ids: ids of the commits. Default: None (all commits of the vcs system)
+    :param document_class: CodeEntityState, CodeGroupState, or StaticWarning. Default: CodeEntityState
+    :param metric_names: names of the metrics in the order of the columns. Default: None (all metrics of the
+    documents in sorted order)
+    :param query: additional filter for the documents, e.g., {'ce_type': 'file'}, which is combined with the commits.
+    Default: None
+    :param commit_chunk_size: number of commits per query. Default: 1000
+    :param batch_size: number of documents that are copied into the array at once. Default: 10000
+    :param dtype: float type of the array. Default: numpy.float64
+    :return: :class:`MetricsMatrix`
+    """
+    if document_class not in INDEX_FIELDS:
+        raise ValueError("metrics can only be extracted for %s" % ", ".join(c.__name__ for c in INDEX_FIELDS))
+    if commit_ids is None:
+        commit_ids = [c["_id"] for c in Commit.objects(vcs_system_ids=vcs_system_id).only("id").as_pymongo()]
+    commit_ids = list(commit_ids)
+    collection = document_class._get_collection()
+    conditions = []
+    for i in range(0, len(commit_ids), commit_chunk_size):
+        condition = {"commit_id": {"$in": commit_ids[i : i + commit_chunk_size]}}
+        if query:
+            # the query may filter the commit_id as well, which must not replace the chunk
+            condition = {"$and": [condition, query]}
+        conditions.append(condition)
+
+    if metric_names is None:
+        metric_names = set()
+        for condition in conditions:
+            metric_names.update(_metric_names(collection, condition))
+        metric_names = sorted(metric_names)
+    metric_names = list(metric_names)
+
+    rows = sum(collection.count_documents(condition) for condition in conditions)
+    values = np.full((rows, len(metric_names)), np.nan, dtype=dtype)
+    index_fields = INDEX_FIELDS[document_class]
+    index = []
+
+    projection = {field: 1 for field in index_fields}
+    projection["metrics"] = 1
+    projection["_id"] = 0
+    start = 0
+    batch = []
+    for condition in conditions:
+        for document in collection.find(condition, projection, batch_size=batch_size):
+            index.append(tuple(document.get(field) for field in index_fields))
+            metrics = document.get("metrics") or {}
+            batch.append([_numeric(metrics.get(name)) for name in metric_names])
+            if len(batch) == batch_size:
+                values = _copy_batch(values, start, batch, dtype)
+                start += len(batch)
+                batch = []
+    if batch:
+        values = _copy_batch(values, start, batch, dtype)
+        start += len(batch)
+
+    # documents may have been deleted after counting them
+    return MetricsMatrix(values[:start], metric_names, index_fields, index)
+
+
+def _metric_names(collection, condition):
+    pipeline = [
+        {"$match": condition},
+        {"$project": {"metrics": {"$objectToArray": {"$ifNull": ["$metrics", {}]}}}},
+        {"$unwind": "$metrics"},
+        {"$group": {"_id": "$metrics.k"}},
+    ]
+    return [result["_id"] for result in collection.aggregate(pipeline, allowDiskUse=True)]
+
+
+def _numeric(value):
+    """
+    Non-numeric metric values, e.g., None, strings, or lists, are missing values and become NaN.
+    """
+    return value if isinstance(value, numbers.Real) else None
+
+
+def _copy_batch(values, start, batch, dtype):
+    """
+    Copies a batch of rows into the array. None values become NaN. The array is grown if documents were added after
+    counting them.
+    """
+    end = start + len(batch)
+    if end > values.shape[0]:
+        grown = np.full((max(end, math.ceil(values.shape[0] * 1.5)), values.shape[1]), np.nan, dtype=dtype)
+        grown[: values.shape[0]] = values
+        values = grown
+    values[start:end] = np.array(batch, dtype=dtype)
+    return values
@@ -15,11 +15,112 @@ from mongoengine import (
     FloatField,
     EmbeddedDocumentListField,
 )
+from mongoengine.queryset.queryset import QuerySet
+from bson.raw_bson import RawBSONDocument
+from pycoshark.fields import (
+    CompressedStringField,
+    LazyDictField,
+    LazyListField,
+    _Undecoded,
+    decompress_text,
+    inflate_raw_bson,
+)
+import collections
 import hashlib
 from typing import TYPE_CHECKING, Any
 
-if TYPE_CHECKING:
-    from mongoengine.queryset.queryset import QuerySet
+_record_classes = {}
+_lazy_db_fields = {}
+
+# initial value of the last seen ids in calculate_identifiers, which is never equal to an id
+_UNSET = object()
+
+
+def _record_class(document, fields):
+    """
+    Returns the record class for a document and a tuple of field names. The record classes are namedtuples that are
+    created once per document and fields.
+    """
+    key = (document, fields)
+    if key not in _record_classes:
+        defaults = []
+        for name in fields:
+            default = document._fields[name].default
+            defaults.append(default() if callable(default) else default)
+        record_class = collections.namedtuple("%sRecord" % document.__name__, fields)
+        record_class.__new__.__defaults__ = tuple(defaults)
+        _record_classes[key] = record_class
+    return _record_classes[key]
+
+
+class SmartSHARKQuerySet(QuerySet):
+    """QuerySet that is used by all documents of this project.
+
+    Adds a fast read path that skips the creation of :class:`mongoengine.Document` objects and named projection
+    presets. The presets of a document are available as methods, e.g., ``Commit.objects.graph()`` or
+    ``Commit.objects(vcs_system_ids=vcs_system_id).light()``.
+    """
+
+    def preset(self, name):
+        """Restricts the loaded fields to a named projection preset of the document.
+
+        :param name: name of the preset, see :meth:`TypedDocument.register_projection_preset`
+        :return: the queryset with the projection of the preset
+        """
+        only, exclude = self._document.get_projection_preset(name)
+        if only:
+            return self.only(*only)
+        return self.exclude(*exclude)
+
+    def raw_bson(self):
+        """Reads the documents as raw BSON.
+
+        Only the top level of the documents is decoded when the documents are created. The values of
+        :class:`~pycoshark.fields.LazyDictField` and :class:`~pycoshark.fields.LazyListField` fields stay raw BSON until
+        they are accessed, all other values are decoded as usual. This is useful for scans that filter on metadata and
+        only access the large payloads of a few documents.
+
+        :return: the queryset that reads raw BSON
+        """
+        queryset = self.clone()
+        queryset._collection_obj = self._collection.with_options(
+            codec_options=self._collection.codec_options.with_options(document_class=RawBSONDocument)
+        )
+        return queryset
+
+    def __getattr__(self, name):
+        if not name.startswith("_") and name in getattr(self._document, "projection_presets", {}):
+            return lambda: self.preset(name)
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+    def records(self, *fields):
+        """Iterates over the query results as lightweight read-only records instead of documents.
+
+        The records are namedtuples with the same attribute names as the document. Only the requested fields are
+        fetched from the database and the values are not validated or converted, e.g., embedded documents are dicts.
+        Missing values are replaced with the default of the field and compressed strings are decompressed. Since the
+        records do not track changes, they cannot be saved.
+
+        :param fields: names of the fields of the records. Default: all fields of the document
+        :return: generator of records
+        """
+        if not fields:
+            fields = tuple(self._document._fields_ordered)
+        record_class = _record_class(self._document, fields)
+        make = record_class._make
+        db_fields = list(
+            zip([self._document._fields[name].db_field for name in fields], record_class.__new__.__defaults__)
+        )
+        compressed = [
+            index
+            for index, name in enumerate(fields)
+            if isinstance(self._document._fields[name], CompressedStringField)
+        ]
+        for raw in self.only(*fields).as_pymongo():
+            values = [raw.get(db_field, default) for db_field, default in db_fields]
+            for index in compressed:
+                values[index] = decompress_text(values[index])
+            yield make(values)
 
 
 class TypedDocument(Document):
@@ -28,13 +129,79 @@ class TypedDocument(Document):
     This class adds type hints for the `objects`, `id`, and `pk` attributes, which are otherwise not recognized by type checkers.
     """
 
-    meta = {"abstract": True}
+    meta = {"abstract": True, "queryset_class": SmartSHARKQuerySet}
+
+    # named projection presets, see register_projection_preset
+    projection_presets = {}
 
     if TYPE_CHECKING:
-        objects: QuerySet
+        objects: SmartSHARKQuerySet
         id: Any
         pk: Any
 
+    @classmethod
+    def _from_son(cls, son, *args, **kwargs):
+        if cls not in _lazy_db_fields:
+            _lazy_db_fields[cls] = {
+                field.db_field for field in cls._fields.values() if isinstance(field, (LazyDictField, LazyListField))
+            }
+        lazy_db_fields = _lazy_db_fields[cls]
+        if isinstance(son, RawBSONDocument):
+            # only the values of lazy fields stay raw
+            son = {key: value if key in lazy_db_fields else inflate_raw_bson(value) for key, value in son.items()}
+        elif lazy_db_fields:
+            son = dict(son)
+        for db_field in lazy_db_fields:
+            if son.get(db_field) is not None:
+                son[db_field] = _Undecoded(son[db_field])
+        return super()._from_son(son, *args, **kwargs)
+
+    @classmethod
+    def register_projection_preset(cls, name, *fields):
+        """Registers a named projection preset for the document, which can then be used as method of its queryset.
+
+        The fields are either all fields that should be loaded or all fields that should be excluded, which are marked
+        with a leading '-'::
+
+            Commit.register_projection_preset("authors", "id", "author_id", "committer_id")
+            Hunk.register_projection_preset("no_content", "-content")
+
+        :param name: name of the preset
+        :param fields: names of the fields
+        """
+        if name.startswith("_") or hasattr(SmartSHARKQuerySet, name):
+            raise ValueError("invalid name for a projection preset: %s" % name)
+        excluded = [field.startswith("-") for field in fields]
+        if not fields or (any(excluded) and not all(excluded)):
+            raise ValueError("a projection preset must either only include or only exclude fields")
+        for field in fields:
+            if field.lstrip("-") not in cls._fields:
+                raise ValueError("%s has no field %s" % (cls.__name__, field.lstrip("-")))
+        # copy the presets such that the presets of the base classes are not changed
+        cls.projection_presets = dict(cls.projection_presets, **{name: tuple(fields)})
+
+    @classmethod
+    def get_projection_preset(cls, name):
+        """
+        :param name: name of the preset
+        :return: tuple of the included fields and the excluded fields of the preset
+        """
+        fields = cls.projection_presets[name]
+        if fields[0].startswith("-"):
+            return (), tuple(field[1:] for field in fields)
+        return fields, ()
+
+    @classmethod
+    def get_projection(cls, name):
+        """
+        :param name: name of the preset
+        :return: the preset as projection for pymongo, i.e., a dict with the names of the fields in the database
+        """
+        only, exclude = cls.get_projection_preset(name)
+        if only:
+            return {cls._fields[field].db_field: 1 for field in only}
+        return {cls._fields[field].db_field: 0 for field in exclude}
+
 
 class BaseSystem(TypedDocument):
     meta = {"abstract": True, "indexes": ["#url"]}
@@ -69,12 +236,15 @@ class Message(TypedDocument):
     :property to_ids: ((:class:`~mongoengine.fields.ListField` of (:class:`~mongoengine.fields.ObjectIdField`)) ids of persons :class:`~pycoshark.mongomodels.People` to which this message was sent
     :property cc_ids: ((:class:`~mongoengine.fields.ListField` of (:class:`~mongoengine.fields.ObjectIdField`)) ids of persons :class:`~pycoshark.mongomodels.People` to which this message was sent (cc)
     :property subject: (:class:`~mongoengine.fields.StringField`) subject of the message
-    :property body: (:class:`~mongoengine.fields.StringField`) message text
+    :property body: (:class:`~pycoshark.fields.CompressedStringField`) message text
     :property date: (:class:`~mongoengine.fields.DateTimeField`)  date when the message was sent
     :property patches: ((:class:`~mongoengine.fields.ListField` of (:class:`~mongoengine.fields.StringField`))  if patches were applied to the message
+    :property thread_id: (:class:`~mongoengine.fields.ObjectIdField`) id of the first message of the thread of this message, see :func:`pycoshark.threads.build_message_threads`
     """
 
-    meta = {"indexes": ["mailing_system_ids", "message_id"]}
+    meta = {"indexes": ["mailing_system_ids", "message_id", "thread_id"]}
+
+    projection_presets = {"light": ("-body",)}
 
     # PK: message_id
     # Shard Key: message_id, mailing_list_id
@@ -87,9 +257,10 @@ class Message(TypedDocument):
     to_ids = ListField(ObjectIdField())
     cc_ids = ListField(ObjectIdField())
     subject = StringField()
-    body = StringField()
+    body = CompressedStringField()
     date = DateTimeField()
     patches = ListField(StringField())
+    thread_id = ObjectIdField()
 
 
 class CiSystem(BaseSystem):
@@ -138,6 +309,9 @@ class TravisJob(TypedDocument):
     meta = {
         "indexes": ["build_id", "tr_id"],
     }
+
+    projection_presets = {"light": ("-job_log",)}
+
     tr_id = IntField()
     build_id = ObjectIdField(required=True)
     allow_failure = BooleanField(required=True)
@@ -148,7 +322,7 @@ class TravisJob(TypedDocument):
     stages = ListField(StringField())
     metrics = DictField()
     config = DictField()
-    job_log = StringField()
+    job_log = CompressedStringField()
 
     def __repr__(self):
         return (
@@ -935,6 +1109,49 @@ class FileAction(TypedDocument):
     induces = ListField(DictField())
 
 
+class InducingLink(TypedDocument):
+    """
+    InducingLink class.
+    Inherits from :class:`mongoengine.Document`
+
+    Inverted index over :attr:`FileAction.induces`, which is built with :func:`pycoshark.induces.update_inducing_links`.
+    Each document is one entry of the induces list of an inducing file action.
+
+    Index: (inducing_file_action_id, label), (inducing_commit_id, label), (change_file_action_id, label), (change_commit_id, label), label
+
+    ShardKey: inducing_file_action_id
+
+    :property inducing_file_action_id: (:class:`~mongoengine.fields.ObjectIdField`) :class:`~pycoshark.mongomodels.FileAction` id of the inducing file action
+    :property inducing_commit_id: (:class:`~mongoengine.fields.ObjectIdField`) :class:`~pycoshark.mongomodels.Commit` id of the inducing file action
+    :property inducing_file_id: (:class:`~mongoengine.fields.ObjectIdField`) :class:`~pycoshark.mongomodels.File` id of the inducing file action
+    :property change_file_action_id: (:class:`~mongoengine.fields.ObjectIdField`) :class:`~pycoshark.mongomodels.FileAction` id of the changing file action, e.g., the bug fix
+    :property change_commit_id: (:class:`~mongoengine.fields.ObjectIdField`) :class:`~pycoshark.mongomodels.Commit` id of the changing file action
+    :property label: (:class:`~mongoengine.fields.StringField`) label of the entry
+    :property szz_type: (:class:`~mongoengine.fields.StringField`) szz_type of the entry, if it has one
+    :property induces_hash: (:class:`~mongoengine.fields.StringField`) hash of the induces list of the inducing file action when it was indexed
+    """
+
+    meta = {
+        "indexes": [
+            ("inducing_file_action_id", "label"),
+            ("inducing_commit_id", "label"),
+            ("change_file_action_id", "label"),
+            ("change_commit_id", "label"),
+            "label",
+        ],
+        "shard_key": ("inducing_file_action_id",),
+    }
+
+    inducing_file_action_id = ObjectIdField(required=True)
+    inducing_commit_id = ObjectIdField(required=True)
+    inducing_file_id = ObjectIdField()
+    change_file_action_id = ObjectIdField(required=True)
+    change_commit_id = ObjectIdField()
+    label = StringField()
+    szz_type = StringField()
+    induces_hash = StringField()
+
+
 class Hunk(TypedDocument):
     """
     Hunk class.
@@ -949,7 +1166,7 @@ class Hunk(TypedDocument):
     :property new_lines: (:class:`~mongoengine.fields.IntField`)  new line of the new file
     :property old_start: (:class:`~mongoengine.fields.IntField`)  start line in the old file
     :property old_lines: (:class:`~mongoengine.fields.IntField`)  old lines in the new file
-    :property content: (:class:`~mongoengine.fields.StringField`) textual change
+    :property content: (:class:`~pycoshark.fields.CompressedStringField`) textual change
     :property lines_manual: (:class:`~mongoengine.fields.DictField`) for manual line labels for this hunk, contains information about the different labels of lines and the author, the author is the key and the value is a (:class:`~mongoengine.fields.DictField`) of different label types and their belonging lines. Therefore, the key is the label type and the value is an array of line numbers
     :property lines_verified: (:class:`~mongoengine.fields.DictField`) the verified labels for the lines of the hunk. The key is the label and the value is an array of line numbers
     :property uncorrected_lines_manual: (:class:`~mongoengine.fields.DictField`) copy of uncorrected labels, temporary. Structure is the same as lines_manual
@@ -961,6 +1178,8 @@ class Hunk(TypedDocument):
         ]
     }
 
+    projection_presets = {"light": ("-content",)}
+
     # PK: id
     # Shard Key: file_action_id. Reasoning: file_action_id is most likely often queried
 
@@ -969,7 +1188,7 @@ class Hunk(TypedDocument):
     new_lines = IntField(required=True)
     old_start = IntField(required=True)
     old_lines = IntField(required=True)
-    content = StringField(required=True)
+    content = CompressedStringField(required=True)
     lines_manual = DictField()
     lines_verified = DictField()
     uncorrected_lines_manual = DictField()
@@ -1031,6 +1250,7 @@ class Tag(TypedDocument):
     # PK: commit_id
     # Shard Key: hashed commit_id
 
+    vcs_system_id = ObjectIdField()
     name = StringField(max_length=150, required=True)
     commit_id = ObjectIdField(required=True)
     message = StringField()
@@ -1076,6 +1296,20 @@ class Commit(TypedDocument):
 
     meta = {"indexes": ["vcs_system_ids", "revision_hash"]}
 
+    projection_presets = {
+        "light": ("-message", "-labels", "-code_entity_states"),
+        "graph": ("id", "revision_hash", "parents"),
+        "dates": (
+            "id",
+            "revision_hash",
+            "parents",
+            "author_date",
+            "author_date_offset",
+            "committer_date",
+            "committer_date_offset",
+        ),
+    }
+
     # PK: revision_hash, vcs_system_id
     # Shard Key: revision_hash, vcs_system_id
 
@@ -1248,7 +1482,7 @@ class TestState(TypedDocument):
     :property name: (:class:`~mongoengine.fields.StringField`) name of the TestState, e.g. de.ugoe.cs.Class.blub
     :property commit_id: (:class:`~mongoengine.fields.ObjectIdField`) :class:`~pycoshark.mongomodels.Commit` id to which this state belongs
     :property file_id: (:class:`~mongoengine.fields.ObjectIdField`) :class:`~pycoshark.mongomodels.File` id to which this state refers to
-    :property metrics: (:class:`~mongoengine.fields.DictField`) metrics for the test state
+    :property metrics: (:class:`~pycoshark.fields.LazyDictField`) metrics for the test state
     :property mutations: ((:class:`~mongoengine.fields.ListField` of Mutations) with extra information about mutations
     """
 
@@ -1266,7 +1500,7 @@ class TestState(TypedDocument):
     file_id = ObjectIdField(required=True)
     commit_id = ObjectIdField(required=True)
     execution_time = FloatField()
-    metrics = DictField()
+    metrics = LazyDictField()
     mutation_res = ListField(EmbeddedDocumentField(MutationResult), default=list)
 
 
@@ -1311,7 +1545,7 @@ class CodeEntityState(TypedDocument):
     :property long_name: (:class:`~mongoengine.fields.StringField`) long name of the code entity state (e.g., package1.package2.Class)
     :property commit_id: (:class:`~mongoengine.fields.ObjectIdField`) :class:`~pycoshark.mongomodels.Commit` id to which this state belongs
     :property file_id: (:class:`~mongoengine.fields.ObjectIdField`) :class:`~pycoshark.mongomodels.File` id to which this state refers to
-    :property linter: (:class:`~mongoengine.fields.ListField`) of (:class:`~mongoengine.fields.DictField`) refers to warning from linter. Has a line number and a type
+    :property linter: (:class:`~pycoshark.fields.LazyListField`) of (:class:`~mongoengine.fields.DictField`) refers to warning from linter. Has a line number and a type
     :property ce_parent_id: (:class:`~mongoengine.fields.ObjectIdField`) :class:`~pycoshark.mongomodels.CodeEntityState` id which is the parent of this state
     :property cg_ids: ((:class:`~mongoengine.fields.ListField` of (:class:`~mongoengine.fields.ObjectIdField`))  :class:`~pycoshark.mongomodels.CodeGroupState` ids to which this state belongs
     :property ce_type: (:class:`~mongoengine.fields.StringField`) type of this state (e.g., class)
@@ -1320,7 +1554,7 @@ class CodeEntityState(TypedDocument):
     :property end_line: (:class:`~mongoengine.fields.IntField`)  line, where the code entity ends
     :property start_column: (:class:`~mongoengine.fields.IntField`)  column, where the code entity starts
     :property end_column: (:class:`~mongoengine.fields.IntField`)  column, where the code entity ends
-    :property metrics: (:class:`~mongoengine.fields.DictField`) dictionary of different metrics for this code entity state
+    :property metrics: (:class:`~pycoshark.fields.LazyDictField`) dictionary of different metrics for this code entity state
 
     """
 
@@ -1332,13 +1566,15 @@ class CodeEntityState(TypedDocument):
         "shard_key": ("s_key",),
     }
 
+    projection_presets = {"light": ("-metrics", "-linter")}
+
     # PK: long_name, commit_id, file_id
     # Shard Key: shard_key
     s_key = StringField(required=True, unique=True)
     long_name = StringField(required=True)
     commit_id = ObjectIdField(required=True)
     file_id = ObjectIdField(required=True)
-    linter = ListField(DictField())
+    linter = LazyListField(DictField())
     test_type = DictField()
     ce_parent_id = ObjectIdField()
     cg_ids = ListField(ObjectIdField())
@@ -1348,7 +1584,7 @@ class CodeEntityState(TypedDocument):
     end_line = IntField()
     start_column = IntField()
     end_column = IntField()
-    metrics = DictField()
+    metrics = LazyDictField()
 
     def __repr__(self):
         return (
@@ -1377,6 +1613,29 @@ class CodeEntityState(TypedDocument):
         concat_string = long_name + str(commit_id) + str(file_id)
         return hashlib.sha1(concat_string.encode("utf-8")).hexdigest()
 
+    @staticmethod
+    def calculate_identifiers(identifiers):
+        """
+        Batch variant of calculate_identifier. The string of the ids is reused for consecutive entities of the same commit
+        and file, i.e., the identifiers should be ordered by commit and file.
+
+        :param identifiers: iterable of tuples (long_name, commit_id, file_id)
+        :return: list with the identifiers in the same order
+        """
+        sha1 = hashlib.sha1
+        result = []
+        append = result.append
+        last_commit_id = last_file_id = _UNSET
+        suffix = None
+        for long_name, commit_id, file_id in identifiers:
+            if (commit_id is not last_commit_id and commit_id != last_commit_id) or (
+                file_id is not last_file_id and file_id != last_file_id
+            ):
+                last_commit_id, last_file_id = commit_id, file_id
+                suffix = str(commit_id) + str(file_id)
+            append(sha1((long_name + suffix).encode("utf-8")).hexdigest())
+        return result
+
     def identifier(self):
         return self.calculate_identifier(self.long_name, self.commit_id, self.file_id)
 
@@ -1413,6 +1672,27 @@ class CodeGroupState(TypedDocument):
         concat_string = long_name + str(commit_id)
         return hashlib.sha1(concat_string.encode("utf-8")).hexdigest()
 
+    @staticmethod
+    def calculate_identifiers(identifiers):
+        """
+        Batch variant of calculate_identifier. The string of the id is reused for consecutive groups of the same commit,
+        i.e., the identifiers should be ordered by commit.
+
+        :param identifiers: iterable of tuples (long_name, commit_id)
+        :return: list with the identifiers in the same order
+        """
+        sha1 = hashlib.sha1
+        result = []
+        append = result.append
+        last_commit_id = _UNSET
+        suffix = None
+        for long_name, commit_id in identifiers:
+            if commit_id is not last_commit_id and commit_id != last_commit_id:
+                last_commit_id = commit_id
+                suffix = str(commit_id)
+            append(sha1((long_name + suffix).encode("utf-8")).hexdigest())
+        return result
+
     def identifier(self):
         return self.calculate_identifier(self.long_name, self.commit_id)
 
@@ -1509,7 +1789,7 @@ class StaticWarning(TypedDocument):
 
     :property commit_id: (:class:`~mongoengine.fields.ObjectIdField`) :class:`~pycoshark.mongomodels.Commit` id to which this state belongs
     :property file_id: (:class:`~mongoengine.fields.ObjectIdField`) :class:`~pycoshark.mongomodels.File` id to which this state refers to
-    :property linter: (:class:`~mongoengine.fields.ListField`) of (:class:`~mongoengine.fields.DictField`) refers to warning from linter.
+    :property linter: (:class:`~pycoshark.fields.LazyListField`) of (:class:`~mongoengine.fields.DictField`) refers to warning from linter.
     :property metrics: (:class:`~mongoengine.fields.DictField`) dictionary of additional metrics, e.g., LLoC
     """
 
@@ -1523,5 +1803,21 @@ class StaticWarning(TypedDocument):
 
     commit_id = ObjectIdField(required=True)
     file_id = ObjectIdField(required=True)
-    linter = ListField(DictField())
+    linter = LazyListField(DictField())
     metrics = DictField()
+
+
+def get_document_classes(base=TypedDocument):
+    """
+    Returns all concrete document classes that inherit from a base class, also indirectly, e.g., through
+    :class:`BaseSystem`.
+
+    :param base: the base class. Default: :class:`TypedDocument`
+    :return: list of document classes
+    """
+    document_classes = []
+    for subclass in base.__subclasses__():
+        if not subclass._meta.get("abstract"):
+            document_classes.append(subclass)
+        document_classes.extend(get_document_classes(subclass))
+    return document_classes
@@ -0,0 +1,130 @@
+"""
+Fork-safe process pools for CPU-bound work over the documents of a collection.
+"""
+
+import argparse
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from mongoengine import connect, connection
+
+from pycoshark.scan import get_scan_ranges, scan_range
+from pycoshark.utils import _db_tuning_options, create_mongodb_uri_string, reset_connection_cache, set_db_tuning_options
+
+
+def _get_connection_settings(args):
+    if args is not None:
+        return args
+    if connection.DEFAULT_CONNECTION_NAME not in connection._connection_settings:
+        raise ValueError("mongoengine is not connected, please connect first or pass the parsed arguments")
+    return dict(connection._connection_settings[connection.DEFAULT_CONNECTION_NAME])
+
+
+def _init_worker(connection_settings, tuning_options):
+    """
+    Drops the connections that were inherited from the parent process and connects mongoengine again.
+    """
+    reset_connection_cache(close_clients=False)
+    set_db_tuning_options(**tuning_options)
+    if isinstance(connection_settings, argparse.Namespace):
+        args = connection_settings
+        uri = create_mongodb_uri_string(
+            args.db_user,
+            args.db_password,
+            args.db_hostname,
+            args.db_port,
+            args.db_authentication,
+            args.ssl,
+            db_compressors=getattr(args, "db_compressors", None),
+            db_max_pool_size=getattr(args, "db_max_pool_size", None),
+            db_read_preference=getattr(args, "db_read_preference", None),
+            db_max_staleness=getattr(args, "db_max_staleness", None),
+            db_write_concern=getattr(args, "db_write_concern", None),
+        )
+        connect(args.db_database, host=uri)
+    else:
+        connect(**connection_settings)
+
+
+def _map_range(func, document_class, query, scan, batch_size):
+    results = []
+
+    def apply(batch):
+        for son in batch:
+            results.append(func(document_class._from_son(son)))
+
+    scan_range(document_class, scan, apply, query=query, batch_size=batch_size)
+    return results
+
+
+def parallel_map(
+    func,
+    document_class,
+    query=None,
+    workers=None,
+    args=None,
+    partitions=None,
+    batch_size=1000,
+    max_restarts=2,
+    start_method=None,
+):
+    """
+    Applies a function to all documents of a collection in a pool of worker processes, e.g.::
+
+        for result in parallel_map(count_lines, Commit, {"vcs_system_ids": vcs_system_id}, workers=8, args=args):
+            ...
+
+    The _id of the documents is split into partitions, see :func:`~pycoshark.scan.get_scan_ranges`, and each
+    partition is processed by one worker. The workers drop the connections that were inherited from the parent
+    process and connect again, either with the parsed arguments of :func:`~pycoshark.utils.get_base_argparser` or
+    with the connection settings of mongoengine in the parent process. The results of a partition are yielded as soon
+    as the partition is done, i.e., the order of the results is not the order of the documents.
+
+    If a worker process dies, the pool is restarted and the partitions that are not done are processed again.
+    Exceptions that are raised by the function are raised in the parent process.
+
+    :param func: function that is applied to each document, must be picklable, i.e., defined at module level
+    :param document_class: the document class, e.g., Commit
+    :param query: filter for the documents in the syntax of pymongo. Default: None (all documents)
+    :param workers: number of worker processes. Default: None (number of CPUs)
+    :param args: parsed arguments of :func:`~pycoshark.utils.get_base_argparser`. Default: None (connection settings
+    of mongoengine)
+    :param partitions: number of partitions. Default: None (four per worker)
+    :param batch_size: number of documents that are read at once by the workers. Default: 1000
+    :param max_restarts: number of times the pool is restarted after a worker died. Default: 2
+    :param start_method: start method of the worker processes, e.g., 'fork' or 'spawn'. Default: None (platform
+    default)
+    :return: generator of the results of the function
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if partitions is None:
+        partitions = 4 * workers
+    settings = _get_connection_settings(args)
+    pending = dict(enumerate(get_scan_ranges(document_class, query, partitions)))
+    context = multiprocessing.get_context(start_method)
+    restarts = 0
+    while pending:
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(settings, dict(_db_tuning_options)),
+        )
+        try:
+            futures = {
+                executor.submit(_map_range, func, document_class, query, scan, batch_size): i
+                for i, scan in pending.items()
+            }
+            for future in as_completed(futures):
+                results = future.result()
+                del pending[futures[future]]
+                yield from results
+        except BrokenProcessPool:
+            restarts += 1
+            if restarts > max_restarts:
+                raise
+            print("worker process died, restarting the pool for %i partitions" % len(pending))
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,262 @@
+"""
+Profiling of the database queries that are issued by pycoSHARK and by the code that uses it.
+
+Importing this module registers a global PyMongo command listener. PyMongo only applies global listeners to clients
+that are created afterwards, hence this module must be imported before mongoengine is connected. The listener does
+nothing unless a profile is active::
+
+    from pycoshark import profiling
+    connect(...)
+
+    with profiling.profile() as p:
+        get_commit_graph(vcs_system_id)
+    p.print_report()
+
+    @profiling.profile(report=True)
+    def analyze():
+        ...
+
+The active profiles are tracked per context, i.e., a profile only records the commands that are issued by the thread
+or asyncio task that entered it and by the tasks that it creates. Threads do not inherit the context, hence commands
+of worker threads are only recorded if the workers run in a copy of the context, e.g., with
+``executor.submit(contextvars.copy_context().run, func)``, like the thread pools of pycoSHARK do.
+"""
+
+import collections
+import contextlib
+import contextvars
+import os
+import sys
+import threading
+
+import bson
+from pymongo import monitoring
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# modules of pycoSHARK that only forward queries and are never reported as call site
+_INFRASTRUCTURE_FILES = frozenset(
+    os.path.join(_PACKAGE_DIR, name) for name in ("profiling.py", "mongomodels.py", "fields.py", "cache.py")
+)
+
+# libraries whose frames are skipped when the call site outside of pycoSHARK is determined
+_LIBRARY_PREFIXES = ("pymongo", "mongoengine", "bson", "gridfs", "mongomock", "concurrent", "threading")
+
+# profiles that are active in the current thread or asyncio task
+_active_profiles = contextvars.ContextVar("pycoshark_active_profiles", default=())
+
+
+class QueryStats(object):
+    """
+    Totals of the commands of one call site, collection, and command.
+    """
+
+    __slots__ = ("commands", "failures", "documents", "bytes", "micros")
+
+    def __init__(self):
+        self.commands = 0
+        self.failures = 0
+        self.documents = 0
+        self.bytes = 0
+        self.micros = 0
+
+    def as_dict(self):
+        return {
+            "commands": self.commands,
+            "failures": self.failures,
+            "documents": self.documents,
+            "bytes": self.bytes,
+            "seconds": self.micros / 1e6,
+        }
+
+
+class profile(contextlib.ContextDecorator):
+    """
+    Collects the commands that the current thread or asyncio task issues while the profile is active, grouped by the
+    call site, collection, and command. Commands of other threads and tasks are not recorded, see the module
+    documentation. The call site is the function of pycoSHARK that issued the command, e.g., utils.get_commit_graph, or
+    the first function outside of pycoSHARK and the database libraries. Profiles can be used as context manager or as
+    decorator and can be nested.
+
+    The size of the replies is only counted if measure_bytes is True, because PyMongo passes decoded replies to the
+    listeners and they must be encoded again to measure their size.
+
+    :param report: if True, the report is printed when the profile ends. Default: False
+    :param limit: number of rows of the printed report. Default: 20
+    :param measure_bytes: if True, the size of the replies in bytes is counted. Default: False
+    """
+
+    def __init__(self, report=False, limit=20, measure_bytes=False):
+        self.report = report
+        self.limit = limit
+        self.measure_bytes = measure_bytes
+        self.stats = collections.defaultdict(QueryStats)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        _active_profiles.set(_active_profiles.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # the innermost entry is removed, the same profile may be entered again, e.g., by a recursive decorated function
+        profiles = list(_active_profiles.get())
+        for i in range(len(profiles) - 1, -1, -1):
+            if profiles[i] is self:
+                del profiles[i]
+                break
+        _active_profiles.set(tuple(profiles))
+        if self.report:
+            self.print_report(self.limit)
+        return False
+
+    def _record(self, key, documents=0, size=0, micros=0, failed=False):
+        with self._lock:
+            stats = self.stats[key]
+            stats.commands += 1
+            stats.failures += int(failed)
+            stats.documents += documents
+            stats.bytes += size
+            stats.micros += micros
+
+    def totals(self):
+        """
+        :return: :class:`QueryStats` with the totals of all commands
+        """
+        totals = QueryStats()
+        with self._lock:
+            for stats in self.stats.values():
+                for name in QueryStats.__slots__:
+                    setattr(totals, name, getattr(totals, name) + getattr(stats, name))
+        return totals
+
+    def as_dict(self):
+        """
+        :return: list of dicts with the call site, collection, command, and totals, sorted by the number of commands
+        """
+        with self._lock:
+            rows = [
+                dict(call_site=call_site, collection=collection, command=command, **stats.as_dict())
+                for (call_site, collection, command), stats in self.stats.items()
+            ]
+        return sorted(rows, key=lambda row: (-row["commands"], -row["seconds"]))
+
+    def format_report(self, limit=20):
+        """
+        :param limit: number of rows. Default: 20
+        :return: the report as string
+        """
+        lines = [
+            "%-45s %-25s %-15s %10s %12s %14s %10s"
+            % ("call site", "collection", "command", "commands", "documents", "bytes", "seconds")
+        ]
+        for row in self.as_dict()[:limit]:
+            lines.append(
+                "%-45s %-25s %-15s %10i %12i %14i %10.3f"
+                % (
+                    row["call_site"][:45],
+                    row["collection"][:25],
+                    row["command"][:15],
+                    row["commands"],
+                    row["documents"],
+                    row["bytes"],
+                    row["seconds"],
+                )
+            )
+        return "\n".join(lines)
+
+    def print_report(self, limit=20):
+        """
+        Prints the report.
+
+        :param limit: number of rows. Default: 20
+        """
+        print(self.format_report(limit))
+
+
+def _call_site():
+    """
+    Determines the function that issued a command from the stack of the current thread.
+    """
+    frame = sys._getframe(2)
+    outside = None
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_PACKAGE_DIR) and filename not in _INFRASTRUCTURE_FILES:
+            module = os.path.splitext(os.path.relpath(filename, _PACKAGE_DIR))[0].replace(os.sep, ".")
+            return "%s.%s" % (module, frame.f_code.co_name)
+        if outside is None and not filename.startswith(_PACKAGE_DIR):
+            module = frame.f_globals.get("__name__", "")
+            if not module.startswith(_LIBRARY_PREFIXES):
+                outside = "%s.%s" % (module, frame.f_code.co_name)
+        frame = frame.f_back
+    return outside or "<unknown>"
+
+
+def _collection_name(command_name, command):
+    if command_name == "getMore":
+        return command.get("collection", "<unknown>")
+    value = command.get(command_name)
+    if isinstance(value, str):
+        return value
+    return "<database>"
+
+
+def _returned_documents(reply):
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if "n" in reply and isinstance(reply["n"], int):
+        return reply["n"]
+    if "values" in reply:
+        return len(reply["values"])
+    return 0
+
+
+def _reply_size(reply):
+    raw = getattr(reply, "raw", None)
+    if raw is not None:
+        return len(raw)
+    try:
+        return len(bson.encode(reply))
+    except Exception:
+        return 0
+
+
+class _ProfilingListener(monitoring.CommandListener):
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        # the profiles of the context that issues the command, the reply may be reported in another context
+        profiles = _active_profiles.get()
+        if not profiles:
+            return
+        key = (_call_site(), _collection_name(event.command_name, event.command), event.command_name)
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = (key, set(profiles))
+
+    def _finish(self, event, reply=None):
+        with self._lock:
+            pending = self._pending.pop((event.request_id, event.connection_id), None)
+        if pending is None:
+            return
+        key, profiles = pending
+        documents = _returned_documents(reply) if reply is not None else 0
+        size = 0
+        if reply is not None and any(active.measure_bytes for active in profiles):
+            size = _reply_size(reply)
+        for active in profiles:
+            active._record(
+                key, documents, size if active.measure_bytes else 0, event.duration_micros, failed=reply is None
+            )
+
+    def succeeded(self, event):
+        self._finish(event, event.reply)
+
+    def failed(self, event):
+        self._finish(event)
+
+
+_listener = _ProfilingListener()
+monitoring.register(_listener)
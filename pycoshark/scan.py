@@ -0,0 +1,192 @@
+"""
+Partitioned parallel scans of whole collections, e.g., commit, file_action, hunk, or code_entity_state.
+
+The filtered collection is split into ranges of the _id and the ranges are scanned concurrently. Each range is read
+with keyset pagination, i.e., each batch is a short query for the next documents after the last _id of the previous
+batch. Hence, no cursor is kept open between batches, no cursor with no_cursor_timeout is required, and a scan that
+was interrupted can be resumed from the last _id of each range::
+
+    ranges = get_scan_ranges(Hunk, partitions=16)
+    try:
+        parallel_scan(Hunk, process_batch, ranges=ranges, workers=8)
+    except Exception:
+        # the ranges know where to continue
+        parallel_scan(Hunk, process_batch, ranges=ranges, workers=8)
+"""
+
+import contextvars
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pymongo
+
+
+class ScanRange(object):
+    """
+    A range of the _id that is scanned. The range is updated during the scan and can be used to resume the scan.
+
+    :param lower: inclusive lower bound or None
+    :param upper: exclusive upper bound or None
+    :param last_id: _id of the last document that was passed to the callback. Default: None
+    :param done: True if the range was scanned completely. Default: False
+    """
+
+    __slots__ = ("lower", "upper", "last_id", "done")
+
+    def __init__(self, lower, upper, last_id=None, done=False):
+        self.lower = lower
+        self.upper = upper
+        self.last_id = last_id
+        self.done = done
+
+    def __repr__(self):
+        return "ScanRange(%r, %r, last_id=%r, done=%r)" % (self.lower, self.upper, self.last_id, self.done)
+
+    def condition(self):
+        """
+        :return: query condition on the _id for the documents of the range that were not yet scanned
+        """
+        condition = {}
+        if self.last_id is not None:
+            condition["$gt"] = self.last_id
+        elif self.lower is not None:
+            condition["$gte"] = self.lower
+        if self.upper is not None:
+            condition["$lt"] = self.upper
+        return condition
+
+
+def _get_collection(collection):
+    if hasattr(collection, "_get_collection"):
+        return collection._get_collection()
+    return collection
+
+
+def _with_id_condition(query, id_condition):
+    if not id_condition:
+        return dict(query)
+    if "_id" in query:
+        return {"$and": [query, {"_id": id_condition}]}
+    condition = dict(query)
+    condition["_id"] = id_condition
+    return condition
+
+
+def get_split_points(collection, query=None, partitions=8, method="sample", samples_per_partition=20):
+    """
+    Determines split points of the _id that divide the documents of a collection into ranges of about equal size.
+
+    :param collection: pymongo collection or document class
+    :param query: filter for the documents. Default: None
+    :param partitions: number of ranges. Default: 8
+    :param method: 'sample' to determine the split points from a random sample of the documents or 'bucketAuto' to
+    use the exact boundaries of $bucketAuto, which requires a pass over all documents. Default: 'sample'
+    :param samples_per_partition: number of sampled documents per range. Default: 20
+    :return: sorted list of at most partitions - 1 split points
+    """
+    collection = _get_collection(collection)
+    query = query or {}
+    if partitions < 2:
+        return []
+    if method == "bucketAuto":
+        pipeline = [
+            {"$match": query},
+            {"$project": {"_id": 1}},
+            {"$bucketAuto": {"groupBy": "$_id", "buckets": partitions}},
+        ]
+        return [bucket["_id"]["min"] for bucket in collection.aggregate(pipeline, allowDiskUse=True)][1:]
+    if method == "sample":
+        pipeline = [
+            {"$match": query},
+            {"$sample": {"size": partitions * samples_per_partition}},
+            {"$project": {"_id": 1}},
+        ]
+        ids = sorted({document["_id"] for document in collection.aggregate(pipeline, allowDiskUse=True)})
+        if len(ids) < partitions:
+            return ids[1:]
+        points = [ids[len(ids) * i // partitions] for i in range(1, partitions)]
+        return sorted(set(points))
+    raise ValueError("unknown method: %s" % method)
+
+
+def get_scan_ranges(collection, query=None, partitions=8, method="sample"):
+    """
+    Splits the documents of a collection into ranges of the _id, see :func:`get_split_points`.
+
+    :param collection: pymongo collection or document class
+    :param query: filter for the documents. Default: None
+    :param partitions: number of ranges. Default: 8
+    :param method: 'sample' or 'bucketAuto'. Default: 'sample'
+    :return: list of :class:`ScanRange` that cover all values of the _id
+    """
+    bounds = [None] + get_split_points(collection, query, partitions, method) + [None]
+    return [ScanRange(lower, upper) for lower, upper in zip(bounds, bounds[1:])]
+
+
+def scan_range(collection, scan, callback, query=None, projection=None, batch_size=1000):
+    """
+    Scans a single range with keyset pagination and passes the documents in batches to the callback. The range is
+    updated after each batch.
+
+    :param collection: pymongo collection or document class
+    :param scan: the :class:`ScanRange`
+    :param callback: function that is called with each list of documents
+    :param query: filter for the documents. Default: None
+    :param projection: projection of the documents. Default: None (all fields)
+    :param batch_size: number of documents per batch. Default: 1000
+    :return: number of scanned documents
+    """
+    collection = _get_collection(collection)
+    query = query or {}
+    count = 0
+    while not scan.done:
+        condition = _with_id_condition(query, scan.condition())
+        batch = list(collection.find(condition, projection).sort("_id", pymongo.ASCENDING).limit(batch_size))
+        if batch:
+            callback(batch)
+            count += len(batch)
+            scan.last_id = batch[-1]["_id"]
+        if len(batch) < batch_size:
+            scan.done = True
+    return count
+
+
+def parallel_scan(
+    collection,
+    callback,
+    query=None,
+    projection=None,
+    ranges=None,
+    partitions=8,
+    workers=4,
+    batch_size=1000,
+    method="sample",
+):
+    """
+    Scans a collection concurrently in ranges of the _id and passes the documents in batches to the callback. The
+    callback is called from several threads and must be thread-safe. Ranges that are already done are skipped, i.e.,
+    a scan is resumed by passing the ranges of the interrupted scan.
+
+    :param collection: pymongo collection or document class
+    :param callback: function that is called with each list of documents
+    :param query: filter for the documents. Default: None
+    :param projection: projection of the documents. Default: None (all fields)
+    :param ranges: list of :class:`ScanRange`. Default: None (determined with :func:`get_scan_ranges`)
+    :param partitions: number of ranges if the ranges are determined. Default: 8
+    :param workers: number of ranges that are scanned concurrently. Default: 4
+    :param batch_size: number of documents per batch. Default: 1000
+    :param method: 'sample' or 'bucketAuto' if the ranges are determined. Default: 'sample'
+    :return: number of scanned documents
+    """
+    collection = _get_collection(collection)
+    if ranges is None:
+        ranges = get_scan_ranges(collection, query, partitions, method)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run, scan_range, collection, scan, callback, query, projection, batch_size
+            )
+            for scan in ranges
+            if not scan.done
+        ]
+        return sum(future.result() for future in futures)
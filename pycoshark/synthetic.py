@@ -0,0 +1,623 @@
+"""
+Generator of synthetic smartSHARK projects for load tests and benchmarks.
+
+The generator is seeded, i.e., the same seed and parameters produce the same data, apart from the ObjectIds. The
+documents are created as dicts in the database format of the models and written with unordered bulk inserts. Usage::
+
+    $ python -m pycoshark.synthetic -DB smartshark_load --projects 10 --commits 100000 --seed 1
+
+or::
+
+    generator = DatasetGenerator(seed=1)
+    project = generator.generate_project("example", commits=10000)
+    generator.flush()
+"""
+
+import collections
+import datetime
+import hashlib
+import random
+import time
+
+from bson import ObjectId
+from gridfs import GridFS
+
+import pycoshark
+from pycoshark.mongomodels import (
+    Commit,
+    File,
+    FileAction,
+    Hunk,
+    Issue,
+    IssueComment,
+    IssueEvent,
+    IssueSystem,
+    MailingSystem,
+    Message,
+    People,
+    Project,
+    PullRequest,
+    PullRequestComment,
+    PullRequestReview,
+    PullRequestSystem,
+    Tag,
+    VCSSystem,
+)
+from pycoshark.utils import create_mongodb_uri_string, get_base_argparser, get_mongo_client
+
+_FIRST_NAMES = ["Anna", "Ben", "Chen", "Dana", "Emil", "Fatima", "Georg", "Hana", "Ivan", "Julia", "Kofi", "Lena"]
+_LAST_NAMES = ["Schmidt", "Nguyen", "Garcia", "Okafor", "Kowalski", "Rossi", "Tanaka", "Weber", "Silva", "Novak"]
+_WORDS = ["fix", "add", "remove", "refactor", "update", "cache", "parser", "query", "index", "test", "docs", "build"]
+_PACKAGES = ["core", "io", "util", "model", "api", "cli", "net", "db"]
+
+
+class DatasetGenerator(object):
+    """
+    Generates synthetic projects with a commit graph with branches and merges, tags of which some share the same
+    date (broken tags), file actions including renames with several candidates, hunks, issues with event histories,
+    mailing list threads, and pull requests with reviews and comments. All documents satisfy the constraints of the
+    models.
+
+    :param seed: seed of the random numbers. Default: 0
+    :param db: pymongo database to which the documents are written. Default: None (database of mongoengine)
+    :param batch_size: number of documents per bulk insert. Default: 10000
+    :param start_date: date of the first commit. Default: 2010-01-01
+    """
+
+    def __init__(self, seed=0, db=None, batch_size=10000, start_date=datetime.datetime(2010, 1, 1)):
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.db = db
+        self.batch_size = batch_size
+        self.start_date = start_date
+        self.counts = collections.Counter()
+        self._buffers = collections.defaultdict(list)
+        self._sentences = {}
+        self._code_line_pool = None
+
+    def _collection(self, document_class):
+        if self.db is not None:
+            return self.db[document_class._get_collection_name()]
+        return document_class._get_collection()
+
+    def _insert(self, document_class, document):
+        """
+        Buffers a document and returns its id.
+        """
+        document.setdefault("_id", ObjectId())
+        buffer = self._buffers[document_class]
+        buffer.append(document)
+        if len(buffer) >= self.batch_size:
+            self._flush(document_class)
+        return document["_id"]
+
+    def _flush(self, document_class):
+        buffer = self._buffers.pop(document_class, [])
+        if buffer:
+            self._collection(document_class).insert_many(buffer, ordered=False)
+            self.counts[document_class._get_collection_name()] += len(buffer)
+
+    def flush(self):
+        """
+        Writes all buffered documents.
+        """
+        for document_class in list(self._buffers):
+            self._flush(document_class)
+
+    def generate_project(
+        self,
+        name,
+        commits=1000,
+        people=50,
+        issues=None,
+        threads=None,
+        pull_requests=None,
+        merge_probability=0.1,
+        tag_interval=50,
+        repository_file=True,
+    ):
+        """
+        Generates a project. The documents are buffered and must be written with :meth:`flush` in the end.
+
+        :param name: name of the project
+        :param commits: number of commits. Default: 1000
+        :param people: number of people. Default: 50
+        :param issues: number of issues. Default: None (a fifth of the commits)
+        :param threads: number of mailing list threads. Default: None (a tenth of the commits)
+        :param pull_requests: number of pull requests. Default: None (a twentieth of the commits)
+        :param merge_probability: probability that a commit on the main branch merges a side branch. Default: 0.1
+        :param tag_interval: number of commits on the main branch between releases. Default: 50
+        :param repository_file: if True, a small repository archive is stored in GridFS. Default: True
+        :return: dict with the ids of the project and its systems, the revision hashes of commits with renames, and
+        the ids of the issues
+        """
+        project_id = self._insert(Project, {"name": name})
+        people_ids = self._generate_people(name, people)
+        vcs_system_id = self._generate_vcs_system(project_id, name, repository_file)
+        issue_keys, issue_ids = self._generate_issues(
+            project_id, name, commits // 5 if issues is None else issues, people_ids
+        )
+        commit_ids, revision_hashes, renames = self._generate_commits(
+            vcs_system_id, name, commits, people_ids, issue_keys, merge_probability, tag_interval
+        )
+        self._generate_messages(project_id, name, commits // 10 if threads is None else threads, people_ids, issue_keys)
+        self._generate_pull_requests(
+            project_id, name, commits // 20 if pull_requests is None else pull_requests, people_ids, commit_ids
+        )
+        return {
+            "project_id": project_id,
+            "vcs_system_id": vcs_system_id,
+            "revision_hashes": revision_hashes,
+            "rename_revision_hashes": renames,
+            "issue_ids": issue_ids,
+        }
+
+    def _date(self, index, hours=2):
+        return self.start_date + datetime.timedelta(hours=index * hours, minutes=self.rng.randrange(60))
+
+    def _sentence(self, words=6):
+        # texts are drawn from a pool of sentences, because drawing each word is the bottleneck of the generator
+        pool = self._sentences.get(words)
+        if pool is None:
+            pool = [" ".join(self.rng.choices(_WORDS, k=words)) for _ in range(256)]
+            self._sentences[words] = pool
+        return self.rng.choice(pool)
+
+    def _code_lines(self, prefix, count):
+        if self._code_line_pool is None:
+            self._code_line_pool = ["    %s();" % "_".join(self.rng.choices(_WORDS, k=3)) for _ in range(1024)]
+        return [prefix + line for line in self.rng.choices(self._code_line_pool, k=count)]
+
+    def _generate_people(self, name, count):
+        people_ids = []
+        for i in range(count):
+            first = _FIRST_NAMES[i % len(_FIRST_NAMES)]
+            last = _LAST_NAMES[(i // len(_FIRST_NAMES)) % len(_LAST_NAMES)]
+            person = {
+                "name": "%s %s" % (first, last),
+                "email": "%s.%s%i@%s.example.org" % (first.lower(), last.lower(), i, name),
+                "username": "%s%s%i" % (first[0].lower(), last.lower(), i),
+            }
+            # every fifth person also commits with a second address
+            if i % 5 == 0:
+                alias = dict(person, email="%s+%s@users.noreply.example.com" % (person["username"], name))
+                people_ids.append(self._insert(People, alias))
+            people_ids.append(self._insert(People, person))
+        return people_ids
+
+    def _generate_vcs_system(self, project_id, name, repository_file):
+        vcs_system = {
+            "project_id": project_id,
+            "url": "https://github.com/example/%s" % name,
+            "repository_type": "git",
+            "collection_date": self.start_date,
+        }
+        if repository_file:
+            fs = GridFS(self._collection(VCSSystem).database, collection="repository_data")
+            vcs_system["repository_file"] = fs.put(b"synthetic repository " * 64, filename="%s.tar.gz" % name)
+        return self._insert(VCSSystem, vcs_system)
+
+    def _generate_commits(self, vcs_system_id, name, count, people_ids, issue_keys, merge_probability, tag_interval):
+        commit_ids = []
+        revision_hashes = []
+        commit_documents = []
+        rename_hashes = []
+        heads = {"main": None}
+        main_commits = 0
+        release = [1, 0, 0]
+        # paths of the files that exist on each branch
+        files = {"main": []}
+        file_ids = {}
+
+        for i in range(count):
+            revision_hash = hashlib.sha1(("%s-%i-%i" % (name, self.seed, i)).encode("utf-8")).hexdigest()
+            branch = "main" if len(heads) == 1 or self.rng.random() < 0.7 else self.rng.choice(list(heads))
+            parents = [heads[branch]] if heads[branch] is not None else []
+            merged_files = []
+            if branch == "main" and len(heads) > 1 and self.rng.random() < merge_probability:
+                side = self.rng.choice([b for b in heads if b != "main"])
+                parents.append(heads.pop(side))
+                merged_files = files.pop(side)
+            elif branch == "main" and i > 0 and self.rng.random() < merge_probability:
+                heads["feature-%i" % i] = heads["main"]
+                files["feature-%i" % i] = list(files["main"])
+            date = self._date(i)
+            message = "%s %s" % (self.rng.choice(_WORDS), self._sentence())
+            if issue_keys and self.rng.random() < 0.3:
+                message = "%s: %s" % (self.rng.choice(issue_keys), message)
+            commit = {
+                "vcs_system_ids": [vcs_system_id],
+                "revision_hash": revision_hash,
+                "branches": [branch],
+                "parents": [revision_hashes[p] for p in parents],
+                "author_id": self.rng.choice(people_ids),
+                "author_date": date,
+                "author_date_offset": 60,
+                "committer_id": self.rng.choice(people_ids),
+                "committer_date": date,
+                "committer_date_offset": 60,
+                "message": message,
+            }
+            commit_ids.append(ObjectId())
+            commit["_id"] = commit_ids[-1]
+            revision_hashes.append(revision_hash)
+            commit_documents.append(commit)
+            heads[branch] = i
+
+            parent_revision_hash = commit["parents"][0] if commit["parents"] else None
+            if self._generate_file_actions(
+                vcs_system_id, name, commit["_id"], parent_revision_hash, files[branch], file_ids
+            ):
+                rename_hashes.append(revision_hash)
+            # the files of the merged branch that the first parent does not contain are added by the merge
+            for path in merged_files:
+                if path not in files[branch]:
+                    files[branch].append(path)
+                    self._generate_merged_file(commit["_id"], parent_revision_hash, file_ids[path])
+
+            if branch == "main":
+                main_commits += 1
+                if main_commits % tag_interval == 0:
+                    release = self._next_release(release)
+                    self._insert(
+                        Tag,
+                        {
+                            "vcs_system_id": vcs_system_id,
+                            "name": "%s-%i.%i.%i" % (name, *release),
+                            "commit_id": commit["_id"],
+                            "tagger_id": commit["committer_id"],
+                            "date": date,
+                            "date_offset": 60,
+                        },
+                    )
+                    # some releases are tagged twice at the same time, which breaks the dates of the tags
+                    if i > 0 and self.rng.random() < 0.3:
+                        previous = commit_documents[i - 1]
+                        commit["committer_date"] = previous["committer_date"]
+                        self._insert(
+                            Tag,
+                            {
+                                "vcs_system_id": vcs_system_id,
+                                "name": "%s-%i.%i.%i-rc1" % (name, *release),
+                                "commit_id": previous["_id"],
+                                "date": previous["committer_date"],
+                            },
+                        )
+
+        for commit in commit_documents:
+            self._insert(Commit, commit)
+        return commit_ids, revision_hashes, rename_hashes
+
+    def _next_release(self, release):
+        if self.rng.random() < 0.2:
+            return [release[0], release[1] + 1, 0]
+        if self.rng.random() < 0.05:
+            return [release[0] + 1, 0, 0]
+        return [release[0], release[1], release[2] + 1]
+
+    def _new_file(self, vcs_system_id, name, files, file_ids):
+        path = "src/%s/%s/%s%i.java" % (
+            name,
+            self.rng.choice(_PACKAGES),
+            self.rng.choice(_WORDS).capitalize(),
+            len(file_ids),
+        )
+        file_ids[path] = self._insert(File, {"vcs_system_ids": [vcs_system_id], "path": path})
+        files.append(path)
+        return path
+
+    def _generate_file_actions(self, vcs_system_id, name, commit_id, parent_revision_hash, files, file_ids):
+        """
+        Generates the file actions and hunks of a commit.
+
+        :return: True if the commit contains a rename with several candidates
+        """
+        renamed = False
+        for _ in range(self.rng.randint(1, 5)):
+            mode = "A" if len(files) < 5 else self.rng.choices(["A", "M", "D", "R"], [2, 12, 1, 1])[0]
+            file_action = {"commit_id": commit_id, "mode": mode, "parent_revision_hash": parent_revision_hash}
+            if mode == "A":
+                file_action["file_id"] = file_ids[self._new_file(vcs_system_id, name, files, file_ids)]
+            elif mode == "R":
+                old_path = files.pop(self.rng.randrange(len(files)))
+                # pygit2 may report several candidates for the same old file
+                for _ in range(self.rng.randint(1, 2)):
+                    candidate = dict(file_action, old_file_id=file_ids[old_path])
+                    candidate["file_id"] = file_ids[self._new_file(vcs_system_id, name, files, file_ids)]
+                    self._generate_hunks(self._insert(FileAction, candidate), 0)
+                renamed = True
+                continue
+            else:
+                path = self.rng.choice(files)
+                file_action["file_id"] = file_ids[path]
+                if mode == "D":
+                    files.remove(path)
+            added, deleted = self.rng.randint(0, 40), self.rng.randint(0, 20)
+            if mode == "A":
+                deleted = 0
+            elif mode == "D":
+                added = 0
+            file_action.update(
+                {"lines_added": added, "lines_deleted": deleted, "size_at_commit": 100 * added, "is_binary": False}
+            )
+            self._generate_hunks(self._insert(FileAction, file_action), added, deleted, new_file=mode == "A")
+        return renamed
+
+    def _generate_merged_file(self, commit_id, parent_revision_hash, file_id):
+        added = self.rng.randint(1, 40)
+        file_action = {
+            "commit_id": commit_id,
+            "mode": "A",
+            "parent_revision_hash": parent_revision_hash,
+            "file_id": file_id,
+            "lines_added": added,
+            "lines_deleted": 0,
+            "size_at_commit": 100 * added,
+            "is_binary": False,
+        }
+        self._generate_hunks(self._insert(FileAction, file_action), added, new_file=True)
+
+    def _generate_hunks(self, file_action_id, added, deleted=0, new_file=False):
+        if added == 0 and deleted == 0:
+            return
+        if new_file:
+            # the hunk of an added file has no old lines, like in the diffs of git
+            lines = self._code_lines("+", added)
+            self._insert(
+                Hunk,
+                {
+                    "file_action_id": file_action_id,
+                    "old_start": 0,
+                    "old_lines": 0,
+                    "new_start": 1,
+                    "new_lines": added,
+                    "content": Hunk.content.to_mongo("\n".join(lines) + "\n"),
+                },
+            )
+            return
+        start = self.rng.randint(1, 500)
+        context = ["    // %s" % self._sentence(4) for _ in range(3)]
+        lines = [" " + line for line in context] + self._code_lines("-", deleted) + self._code_lines("+", added)
+        self._insert(
+            Hunk,
+            {
+                "file_action_id": file_action_id,
+                "old_start": start,
+                "old_lines": len(context) + deleted,
+                "new_start": start,
+                "new_lines": len(context) + added,
+                "content": Hunk.content.to_mongo("\n".join(lines) + "\n"),
+            },
+        )
+
+    def _generate_issues(self, project_id, name, count, people_ids):
+        issue_system_id = self._insert(
+            IssueSystem,
+            {
+                "project_id": project_id,
+                "url": "https://issues.example.org/%s" % name,
+                "collection_date": self.start_date,
+            },
+        )
+        keys = []
+        issue_ids = []
+        for i in range(count):
+            key = "%s-%i" % (name.upper(), i + 1)
+            created = self._date(i, hours=10)
+            fixed = self.rng.random() < 0.6
+            resolution = "Fixed" if fixed else self.rng.choice(["Won't Fix", "Duplicate", None])
+            status = "Closed" if resolution else "Open"
+            issue_id = self._insert(
+                Issue,
+                {
+                    "issue_system_ids": [issue_system_id],
+                    "external_id": key,
+                    "title": self._sentence(5),
+                    "desc": self._sentence(30),
+                    "created_at": created,
+                    "updated_at": created + datetime.timedelta(days=3),
+                    "creator_id": self.rng.choice(people_ids),
+                    "reporter_id": self.rng.choice(people_ids),
+                    "assignee_id": self.rng.choice(people_ids),
+                    "issue_type": self.rng.choice(["Bug", "Improvement", "New Feature", "Task"]),
+                    "priority": self.rng.choice(["Minor", "Major", "Critical"]),
+                    "status": status,
+                    "resolution": resolution,
+                },
+            )
+            history = [("status", "Open", "In Progress")]
+            if resolution:
+                history += [("resolution", None, resolution), ("status", "In Progress", "Resolved")]
+                history += [("status", "Resolved", "Closed")]
+            for j, (field, old_value, new_value) in enumerate(history):
+                self._insert(
+                    IssueEvent,
+                    {
+                        "external_id": "%s-%i" % (key, j),
+                        "issue_id": issue_id,
+                        "created_at": created + datetime.timedelta(hours=j + 1),
+                        "status": field,
+                        "author_id": self.rng.choice(people_ids),
+                        "old_value": old_value,
+                        "new_value": new_value,
+                    },
+                )
+            for j in range(self.rng.randint(0, 3)):
+                self._insert(
+                    IssueComment,
+                    {
+                        "external_id": "%s-c%i" % (key, j),
+                        "issue_id": issue_id,
+                        "created_at": created + datetime.timedelta(hours=j + 2),
+                        "author_id": self.rng.choice(people_ids),
+                        "comment": self._sentence(20),
+                    },
+                )
+            keys.append(key)
+            issue_ids.append(issue_id)
+        return keys, issue_ids
+
+    def _generate_messages(self, project_id, name, threads, people_ids, issue_keys):
+        mailing_system_id = self._insert(
+            MailingSystem,
+            {
+                "project_id": project_id,
+                "url": "https://lists.example.org/%s-dev" % name,
+                "collection_date": self.start_date,
+            },
+        )
+        count = 0
+        for i in range(threads):
+            date = self._date(i, hours=20)
+            subject = self._sentence(5)
+            if issue_keys and self.rng.random() < 0.2:
+                subject = "[%s] %s" % (self.rng.choice(issue_keys), subject)
+            thread = []
+            for j in range(self.rng.randint(1, 8)):
+                message_id = ObjectId()
+                parent = self.rng.choice(thread) if thread else None
+                body = "\n".join(self._sentence(12) for _ in range(self.rng.randint(1, 20)))
+                self._insert(
+                    Message,
+                    {
+                        "_id": message_id,
+                        "message_id": "<%i.%i.%s@lists.example.org>" % (i, j, name),
+                        "mailing_system_ids": [mailing_system_id],
+                        "reference_ids": (parent[1] + [parent[0]]) if parent else [],
+                        "in_reply_to_id": parent[0] if parent else None,
+                        "from_id": self.rng.choice(people_ids),
+                        "to_ids": [self.rng.choice(people_ids)],
+                        "cc_ids": [],
+                        "subject": ("Re: " + subject) if parent else subject,
+                        "body": Message.body.to_mongo(body),
+                        "date": date + datetime.timedelta(hours=j),
+                    },
+                )
+                thread.append((message_id, (parent[1] + [parent[0]]) if parent else []))
+                count += 1
+        return count
+
+    def _generate_pull_requests(self, project_id, name, count, people_ids, commit_ids):
+        pull_request_system_id = self._insert(
+            PullRequestSystem,
+            {
+                "project_id": project_id,
+                "url": "https://api.github.com/repos/example/%s/pulls" % name,
+                "type": "github",
+                "collection_date": self.start_date,
+            },
+        )
+        for i in range(count):
+            created = self._date(i, hours=40)
+            state = self.rng.choice(["open", "closed", "merged"])
+            pull_request = {
+                "pull_request_system_ids": [pull_request_system_id],
+                "external_id": str(i + 1),
+                "title": self._sentence(5),
+                "description": self._sentence(30),
+                "is_draft": False,
+                "is_locked": False,
+                "created_at": created,
+                "updated_at": created + datetime.timedelta(days=1),
+                "creator_id": self.rng.choice(people_ids),
+                "requested_reviewer_ids": self.rng.sample(people_ids, min(2, len(people_ids))),
+                "state": "closed" if state == "merged" else state,
+                "source_branch": "feature-%i" % i,
+                "target_branch": "main",
+            }
+            if state == "merged" and commit_ids:
+                pull_request["merged_at"] = created + datetime.timedelta(days=2)
+                pull_request["merge_commit_id"] = self.rng.choice(commit_ids)
+            pull_request_id = self._insert(PullRequest, pull_request)
+            for j in range(self.rng.randint(0, 3)):
+                self._insert(
+                    PullRequestReview,
+                    {
+                        "pull_request_id": pull_request_id,
+                        "external_id": "%i-r%i" % (i, j),
+                        "state": self.rng.choice(["APPROVED", "CHANGES_REQUESTED", "COMMENTED"]),
+                        "description": self._sentence(10),
+                        "creator_id": self.rng.choice(people_ids),
+                        "submitted_at": created + datetime.timedelta(hours=j + 1),
+                    },
+                )
+            for j in range(self.rng.randint(0, 3)):
+                self._insert(
+                    PullRequestComment,
+                    {
+                        "pull_request_id": pull_request_id,
+                        "external_id": "%i-c%i" % (i, j),
+                        "created_at": created + datetime.timedelta(hours=j + 1),
+                        "author_id": self.rng.choice(people_ids),
+                        "comment": self._sentence(15),
+                    },
+                )
+
+
+def validate_sample(db=None, sample_size=100):
+    """
+    Validates a sample of the documents of each collection that the generator writes against the models.
+
+    :param db: pymongo database. Default: None (database of mongoengine)
+    :param sample_size: number of documents per collection. Default: 100
+    :return: number of validated documents
+    :raises ValidationError: if a document violates the constraints of its model
+    """
+    validated = 0
+    for document_class in (
+        Project,
+        People,
+        VCSSystem,
+        Commit,
+        Tag,
+        File,
+        FileAction,
+        Hunk,
+        IssueSystem,
+        Issue,
+        IssueEvent,
+        IssueComment,
+        MailingSystem,
+        Message,
+        PullRequestSystem,
+        PullRequest,
+        PullRequestReview,
+        PullRequestComment,
+    ):
+        if db is not None:
+            collection = db[document_class._get_collection_name()]
+        else:
+            collection = document_class._get_collection()
+        for son in collection.find().limit(sample_size):
+            document_class._from_son(son).validate()
+            validated += 1
+    return validated
+
+
+def main(argv=None):
+    parser = get_base_argparser("Generates synthetic smartSHARK projects.", pycoshark.__version__)
+    parser.add_argument("--projects", help="Number of projects", default=1, type=int)
+    parser.add_argument("--commits", help="Number of commits per project", default=10000, type=int)
+    parser.add_argument("--people", help="Number of people per project", default=50, type=int)
+    parser.add_argument("--seed", help="Seed of the random numbers", default=0, type=int)
+    parser.add_argument("--batch-size", help="Number of documents per bulk insert", default=10000, type=int)
+    args = parser.parse_args(argv)
+
+    uri = create_mongodb_uri_string(
+        args.db_user, args.db_password, args.db_hostname, args.db_port, args.db_authentication, args.ssl
+    )
+    db = get_mongo_client(uri)[args.db_database]
+    generator = DatasetGenerator(seed=args.seed, db=db, batch_size=args.batch_size)
+    start = time.perf_counter()
+    for i in range(args.projects):
+        generator.generate_project("synthetic%i" % i, commits=args.commits, people=args.people)
+        generator.flush()
+        print("generated project synthetic%i" % i)
+    seconds = time.perf_counter() - start
+    total = sum(generator.counts.values())
+    print("wrote %i documents in %.1fs (%i documents per minute)" % (total, seconds, total / seconds * 60))
+    print("validated %i sampled documents" % validate_sample(db))
+
+
+if __name__ == "__main__":
+    main()
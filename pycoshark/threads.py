@@ -0,0 +1,182 @@
+"""
+Reconstruction of the threads of mailing lists from the in_reply_to_id and reference_ids of the messages.
+
+The messages of a mailing system are read once with a minimal projection and the reply forest is built in memory as
+parent array, i.e., without recursive lookups in the database::
+
+    threads = build_message_threads(mailing_system_id, write=True)
+    print(threads.root_of(message_id), threads.depth_of(message_id), threads.thread_size(message_id))
+"""
+
+import collections
+
+from array import array
+
+from pymongo import UpdateMany
+
+from pycoshark.mongomodels import Message
+
+_NO_PARENT = -1
+
+
+class MessageThreads(object):
+    """
+    Reply forest of a set of messages. The messages are identified by their position in message_ids.
+
+    :param message_ids: ids of the messages
+    :param parents: position of the parent of each message, -1 for messages without parent. Parents that would close
+    a cycle are removed.
+    :property parents: array with the position of the parent of each message, -1 for thread roots
+    :property roots: array with the position of the root of the thread of each message
+    :property depths: array with the depth of each message, 0 for thread roots
+    :property sizes: array with the number of messages in the subtree of each message, including the message
+    """
+
+    def __init__(self, message_ids, parents):
+        self.message_ids = list(message_ids)
+        self._positions = {message_id: i for i, message_id in enumerate(self.message_ids)}
+        count = len(self.message_ids)
+        self.parents = array("i", parents)
+        self.roots = array("i", [_NO_PARENT]) * count
+        self.depths = array("i", [0]) * count
+
+        # the root of each message is found by walking up until a message with known root, each message is visited
+        # once because the path is resolved on the way back
+        on_path = bytearray(count)
+        for start in range(count):
+            path = []
+            position = start
+            while position != _NO_PARENT and self.roots[position] == _NO_PARENT:
+                if on_path[position]:
+                    # the reply chain is a cycle, which is broken at this message
+                    self.parents[position] = _NO_PARENT
+                    break
+                on_path[position] = 1
+                path.append(position)
+                position = self.parents[position]
+            for position in reversed(path):
+                on_path[position] = 0
+                parent = self.parents[position]
+                if parent == _NO_PARENT:
+                    self.roots[position] = position
+                    self.depths[position] = 0
+                else:
+                    self.roots[position] = self.roots[parent]
+                    self.depths[position] = self.depths[parent] + 1
+
+        # subtree sizes are accumulated from the deepest messages upwards
+        self.sizes = array("i", [1]) * count
+        for position in sorted(range(count), key=self.depths.__getitem__, reverse=True):
+            parent = self.parents[position]
+            if parent != _NO_PARENT:
+                self.sizes[parent] += self.sizes[position]
+
+    def __len__(self):
+        return len(self.message_ids)
+
+    def _position(self, message_id):
+        position = self._positions.get(message_id)
+        if position is None:
+            raise KeyError("message %s is not part of the threads" % message_id)
+        return position
+
+    def parent_of(self, message_id):
+        """
+        :param message_id: id of the message
+        :return: id of the message to which the message replies, None for thread roots
+        """
+        parent = self.parents[self._position(message_id)]
+        return self.message_ids[parent] if parent != _NO_PARENT else None
+
+    def root_of(self, message_id):
+        """
+        :param message_id: id of the message
+        :return: id of the first message of the thread of the message
+        """
+        return self.message_ids[self.roots[self._position(message_id)]]
+
+    def depth_of(self, message_id):
+        """
+        :param message_id: id of the message
+        :return: number of replies between the first message of the thread and the message
+        """
+        return self.depths[self._position(message_id)]
+
+    def thread_size(self, message_id):
+        """
+        :param message_id: id of the message
+        :return: number of messages in the thread of the message
+        """
+        return self.sizes[self.roots[self._position(message_id)]]
+
+    def threads(self):
+        """
+        :return: dict with the ids of the thread roots as keys and the lists of the ids of the messages of the threads
+        as values
+        """
+        threads = collections.defaultdict(list)
+        for position, root in enumerate(self.roots):
+            threads[self.message_ids[root]].append(self.message_ids[position])
+        return dict(threads)
+
+
+def build_message_threads(mailing_system_id, write=False, batch_size=1000, silent=True):
+    """
+    Reconstructs the threads of the messages of a mailing system. The parent of a message is the message of
+    in_reply_to_id or, if that message is not part of the mailing system, the last message of reference_ids that is.
+
+    :param mailing_system_id: id of the mailing system
+    :param write: if True, the thread_id of the messages is set to the id of the first message of the thread, only
+    messages whose thread changed are updated. Default: False
+    :param batch_size: number of messages that are read at once and of update operations per bulk write. Default: 1000
+    :param silent: if False, the progress is printed. Default: True
+    :return: :class:`MessageThreads`
+    """
+    fields = ["id", "in_reply_to_id", "reference_ids"] + (["thread_id"] if write else [])
+    message_ids = []
+    replies = []
+    thread_ids = []
+    for message in (
+        Message.objects(mailing_system_ids=mailing_system_id).only(*fields).batch_size(batch_size).as_pymongo()
+    ):
+        message_ids.append(message["_id"])
+        references = message.get("reference_ids") or []
+        in_reply_to_id = message.get("in_reply_to_id")
+        replies.append((in_reply_to_id, references) if in_reply_to_id is not None or references else None)
+        if write:
+            thread_ids.append(message.get("thread_id"))
+
+    positions = {message_id: i for i, message_id in enumerate(message_ids)}
+    parents = array("i", [_NO_PARENT]) * len(message_ids)
+    for i, reply in enumerate(replies):
+        if reply is None:
+            continue
+        in_reply_to_id, references = reply
+        for candidate in [in_reply_to_id] + references[::-1]:
+            parent = positions.get(candidate)
+            if parent is not None and parent != i:
+                parents[i] = parent
+                break
+    threads = MessageThreads(message_ids, parents)
+    if not silent:
+        print(
+            "reconstructed %i threads of %i messages"
+            % (sum(1 for p in threads.parents if p == _NO_PARENT), len(threads))
+        )
+
+    if write:
+        changed = collections.defaultdict(list)
+        for position, root in enumerate(threads.roots):
+            if thread_ids[position] != message_ids[root]:
+                changed[message_ids[root]].append(message_ids[position])
+        requests = [
+            UpdateMany({"_id": {"$in": members[start : start + batch_size]}}, {"$set": {"thread_id": root_id}})
+            for root_id, members in changed.items()
+            for start in range(0, len(members), batch_size)
+        ]
+        collection = Message._get_collection()
+        for start in range(0, len(requests), batch_size):
+            collection.bulk_write(requests[start : start + batch_size], ordered=False)
+        if not silent:
+            print("updated the thread of %i messages" % sum(len(members) for members in changed.values()))
+    return threads
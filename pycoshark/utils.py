@@ -1,18 +1,42 @@
 import argparse
+import collections
+import contextvars
+import importlib
 import math
+import os
 import re
+import threading
+import urllib.parse
 
-import networkx as nx
-import gridfs
-
-from pymongo import MongoClient
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import MongoClient, UpdateOne
 from pymongo.errors import BulkWriteError
 from mongoengine import connection, Document
-from dateutil.relativedelta import relativedelta
-from textdistance import levenshtein
 
+from pycoshark.cache import clear_reference_caches, get_reference_cache
+from pycoshark.fields import CompressedStringField
 from pycoshark.mongomodels import *
 
+# heavy dependencies are imported on first use, such that plugins that only need the argument parser start fast;
+# the module attributes are kept for backwards compatibility
+_LAZY_ATTRIBUTES = {
+    "nx": ("networkx", None),
+    "gridfs": ("gridfs", None),
+    "relativedelta": ("dateutil.relativedelta", "relativedelta"),
+    "levenshtein": ("textdistance", "levenshtein"),
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    module_name, attribute = _LAZY_ATTRIBUTES[name]
+    value = importlib.import_module(module_name)
+    if attribute is not None:
+        value = getattr(value, attribute)
+    globals()[name] = value
+    return value
+
 
 def is_authentication_enabled(db_user, db_password):
     if db_user is not None and db_user and db_password is not None and db_password:
@@ -21,7 +45,102 @@ def is_authentication_enabled(db_user, db_password):
     return False
 
 
-def create_mongodb_uri_string(db_user, db_password, db_hostname, db_port, db_authentication_database, db_ssl_enabled):
+COMPRESSORS = ("zstd", "snappy", "zlib")
+READ_PREFERENCES = ("primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest")
+
+# tuning options that were passed on the command line of a parser created with get_base_argparser; they are used as
+# defaults by create_mongodb_uri_string such that plugins pick them up without code changes
+_db_tuning_options = {}
+
+
+class _DBTuningOptionAction(argparse.Action):
+    """
+    Stores the value of a tuning option in the namespace and registers it as process-wide default.
+    """
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        setattr(namespace, self.dest, values)
+        _db_tuning_options[self.dest] = values
+
+
+def _compressor_list(value):
+    compressors = [compressor.strip() for compressor in value.split(",") if compressor.strip()]
+    for compressor in compressors:
+        if compressor not in COMPRESSORS:
+            raise argparse.ArgumentTypeError(
+                "invalid compressor '%s' (choose from %s)" % (compressor, ", ".join(COMPRESSORS))
+            )
+    return ",".join(compressors)
+
+
+def _write_concern(value):
+    if value.isdigit():
+        return int(value)
+    return value
+
+
+def set_db_tuning_options(**options):
+    """
+    Sets process-wide defaults for the tuning options of :func:`create_mongodb_uri_string` and
+    :func:`get_default_batch_size`. Options that are set to None are removed.
+
+    :param options: any of db_compressors, db_max_pool_size, db_read_preference, db_max_staleness, db_batch_size, and
+    db_write_concern
+    """
+    for name, value in options.items():
+        if value is None:
+            _db_tuning_options.pop(name, None)
+        else:
+            _db_tuning_options[name] = value
+
+
+def get_default_batch_size():
+    """
+    :return: the default cursor batch size that was configured with --db-batch-size or None if it was not set
+    """
+    return _db_tuning_options.get("db_batch_size")
+
+
+def _apply_batch_size(cursor):
+    """
+    Applies the default cursor batch size to a pymongo cursor or mongoengine queryset, if it is configured.
+    """
+    batch_size = get_default_batch_size()
+    if batch_size:
+        return cursor.batch_size(batch_size)
+    return cursor
+
+
+def create_mongodb_uri_string(
+    db_user,
+    db_password,
+    db_hostname,
+    db_port,
+    db_authentication_database,
+    db_ssl_enabled,
+    db_compressors=None,
+    db_max_pool_size=None,
+    db_read_preference=None,
+    db_max_staleness=None,
+    db_write_concern=None,
+):
+    """
+    Creates the URI for a MongoDB connection. The tuning options that are not passed explicitly default to the values
+    that were passed on the command line of a parser created with :func:`get_base_argparser`.
+
+    :param db_user: user name
+    :param db_password: password
+    :param db_hostname: host of the database
+    :param db_port: port of the database
+    :param db_authentication_database: authentication database
+    :param db_ssl_enabled: whether SSL is used
+    :param db_compressors: comma separated list of wire compressors, e.g., 'zstd,snappy,zlib'
+    :param db_max_pool_size: maximum number of connections in the connection pool
+    :param db_read_preference: read preference, e.g., 'secondaryPreferred'
+    :param db_max_staleness: maximum staleness of secondaries in seconds (not allowed for read preference 'primary')
+    :param db_write_concern: write concern, e.g., 1 or 'majority'
+    :return: the URI
+    """
     uri = "mongodb://"
 
     if is_authentication_enabled(db_user, db_password):
@@ -29,25 +148,137 @@ def create_mongodb_uri_string(db_user, db_password, db_hostname, db_port, db_aut
     else:
         uri = "%s%s:%s" % (uri, db_hostname, db_port)
 
-    if (db_authentication_database is not None and db_authentication_database) or db_ssl_enabled:
-        uri = "%s/?" % uri
+    if db_compressors is None:
+        db_compressors = _db_tuning_options.get("db_compressors")
+    if db_max_pool_size is None:
+        db_max_pool_size = _db_tuning_options.get("db_max_pool_size")
+    if db_read_preference is None:
+        db_read_preference = _db_tuning_options.get("db_read_preference")
+    if db_max_staleness is None:
+        db_max_staleness = _db_tuning_options.get("db_max_staleness")
+    if db_write_concern is None:
+        db_write_concern = _db_tuning_options.get("db_write_concern")
+
+    options = []
+    if db_authentication_database is not None and db_authentication_database:
+        options.append("authSource=%s" % db_authentication_database)
+    if db_ssl_enabled:
+        options.append("ssl=true&ssl_cert_reqs=CERT_NONE")
+    if db_compressors:
+        options.append("compressors=%s" % db_compressors)
+    if db_max_pool_size is not None:
+        options.append("maxPoolSize=%i" % db_max_pool_size)
+    if db_read_preference:
+        options.append("readPreference=%s" % db_read_preference)
+    if db_max_staleness is not None:
+        if not db_read_preference or db_read_preference == "primary":
+            raise ValueError("max staleness requires a read preference other than primary")
+        options.append("maxStalenessSeconds=%i" % db_max_staleness)
+    if db_write_concern is not None:
+        options.append("w=%s" % db_write_concern)
+
+    if options:
+        uri = "%s/?%s" % (uri, "&".join(options))
 
-        if db_authentication_database is not None and db_authentication_database:
-            uri = "%sauthSource=%s&" % (uri, db_authentication_database)
+    return uri
 
-        if db_ssl_enabled:
-            uri = "%sssl=true&ssl_cert_reqs=CERT_NONE&" % uri
 
-        uri = uri.rstrip("&")
+_mongo_clients = {}
+_mongo_clients_lock = threading.Lock()
+# process that created the cached clients, clients inherited through a fork belong to the parent process
+_mongo_clients_pid = os.getpid()
 
-    return uri
 
+def _normalize_mongodb_uri(uri):
+    """
+    Normalizes a MongoDB URI such that URIs that only differ in the order of their options or in a trailing slash are
+    considered to be equal.
+    """
+    uri = uri.strip()
+    base, _, query = uri.partition("?")
+    base = base.rstrip("/")
+    options = sorted(urllib.parse.parse_qsl(query, keep_blank_values=True))
+    if options:
+        return "%s/?%s" % (base, urllib.parse.urlencode(options))
+    return base
+
+
+def get_mongo_client(
+    uri,
+    max_pool_size=None,
+    min_pool_size=None,
+    max_idle_time_ms=None,
+    **client_options,
+):
+    """
+    Returns a :class:`~pymongo.mongo_client.MongoClient` from the process-wide client registry. Clients are keyed by
+    the normalized URI and the pool options, i.e., calling this function multiple times with the same arguments reuses
+    the same client and its connection pool instead of creating a new one. Pool options that are None are not passed
+    to the client, i.e., the values from the URI or the defaults of pymongo are used.
+
+    :param uri: MongoDB URI, e.g., created with :func:`create_mongodb_uri_string`
+    :param max_pool_size: maximum number of connections in the pool. Default: None
+    :param min_pool_size: minimum number of connections that are kept open. Default: None
+    :param max_idle_time_ms: time in milliseconds a connection may be idle before it is closed. Default: None
+    :param client_options: further keyword arguments that are passed to the MongoClient
+    :return: the MongoClient for the URI and options
+    """
+    pool_options = {"maxPoolSize": max_pool_size, "minPoolSize": min_pool_size, "maxIdleTimeMS": max_idle_time_ms}
+    pool_options.update(client_options)
+    pool_options = {name: value for name, value in pool_options.items() if value is not None}
+    key = (_normalize_mongodb_uri(uri), tuple(sorted((k, repr(v)) for k, v in pool_options.items())))
+    with _mongo_clients_lock:
+        if key not in _mongo_clients:
+            _mongo_clients[key] = (MongoClient(uri, **pool_options), pool_options)
+        return _mongo_clients[key][0]
+
+
+def get_mongo_client_pool_info():
+    """
+    Lists the clients that are currently held by the client registry.
+
+    :return: list of dicts with the entries 'uri' with the normalized URI and 'options' with the pool options
+    """
+    with _mongo_clients_lock:
+        return [{"uri": key[0], "options": dict(options)} for key, (_, options) in _mongo_clients.items()]
+
+
+def close_mongo_clients():
+    """
+    Closes all clients of the client registry and empties the registry.
+    """
+    with _mongo_clients_lock:
+        clients = [client for client, _ in _mongo_clients.values()]
+        _mongo_clients.clear()
+    for client in clients:
+        client.close()
 
-def reset_connection_cache():
+
+def reset_connection_cache(close_clients=False):
+    """
+    Resets the connection cache of mongoengine, the client registry, and the reference caches, e.g., after a fork.
+
+    Clients that were inherited from the parent process are only dropped and never closed, even if close_clients is
+    True, because closing them in the child ends the server sessions and kills the cursors of the parent.
+
+    :param close_clients: if True, the clients of mongoengine and of the client registry are closed before they are
+    dropped, if they were created by this process. Default: False
+    """
+    global _mongo_clients_pid
+    if close_clients and _mongo_clients_pid == os.getpid():
+        for client in connection._connections.values():
+            client.close()
+        close_mongo_clients()
+    else:
+        with _mongo_clients_lock:
+            _mongo_clients.clear()
+    _mongo_clients_pid = os.getpid()
     connection._connections = {}
     connection._connection_settings = {}
     connection._dbs = {}
-    for document_class in Document.__subclasses__():
+    clear_reference_caches()
+    # the models inherit from Document indirectly, e.g., through TypedDocument and BaseSystem
+    for document_class in get_document_classes(Document):
         document_class._collection = None
 
 
@@ -77,6 +308,48 @@ def get_base_argparser(description, version):
     parser.add_argument("-p", "--db-port", help="Port, where the database server is listening", default=27017, type=int)
     parser.add_argument("-a", "--db-authentication", help="Name of the authentication database", default=None)
     parser.add_argument("--ssl", help="Enables SSL", default=False, action="store_true")
+    parser.add_argument(
+        "--db-compressors",
+        help="Comma separated list of wire compressors in order of preference (%s)" % ", ".join(COMPRESSORS),
+        default=None,
+        type=_compressor_list,
+        action=_DBTuningOptionAction,
+    )
+    parser.add_argument(
+        "--db-max-pool-size",
+        help="Maximum number of connections in the connection pool",
+        default=None,
+        type=int,
+        action=_DBTuningOptionAction,
+    )
+    parser.add_argument(
+        "--db-read-preference",
+        help="Read preference of the connection",
+        default=None,
+        choices=READ_PREFERENCES,
+        action=_DBTuningOptionAction,
+    )
+    parser.add_argument(
+        "--db-max-staleness",
+        help="Maximum staleness of secondaries in seconds, requires a read preference other than primary",
+        default=None,
+        type=int,
+        action=_DBTuningOptionAction,
+    )
+    parser.add_argument(
+        "--db-batch-size",
+        help="Default batch size of cursors",
+        default=None,
+        type=int,
+        action=_DBTuningOptionAction,
+    )
+    parser.add_argument(
+        "--db-write-concern",
+        help="Write concern, e.g., 1 or majority",
+        default=None,
+        type=_write_concern,
+        action=_DBTuningOptionAction,
+    )
 
     return parser
 
@@ -103,24 +376,41 @@ def jira_is_resolved_and_fixed(issue):
     false otherwise
     """
     # first we check if the issue itself contains information about its state
-    if issue.resolution and issue.resolution.lower() in _WONT_FIX_TYPES:
+    state = _jira_issue_state(issue.resolution, issue.status)
+    if state is not None:
+        return state
+
+    # then we check all events related to the issue
+    return _jira_events_resolved_and_fixed(
+        (e.status, e.new_value) for e in IssueEvent.objects(issue_id=issue.id).order_by("created_at")
+    )
+
+
+def _jira_issue_state(resolution, status):
+    """
+    Checks the resolution and status of a JIRA issue.
+    :return: False if the issue was not fixed, True if it was resolved as fixed, None if the events must be checked
+    """
+    if resolution and resolution.lower() in _WONT_FIX_TYPES:
         return False
-    if (
-        issue.resolution
-        and issue.resolution.lower() in _RESOLVED_TYPES
-        and issue.status
-        and issue.status.lower() in _CLOSED_STATUS
-    ):
+    if resolution and resolution.lower() in _RESOLVED_TYPES and status and status.lower() in _CLOSED_STATUS:
         return True
+    return None
 
-    # then we check all events related to the issue
+
+def _jira_events_resolved_and_fixed(events):
+    """
+    Replays the events of a JIRA issue.
+    :param events: tuples of status and new_value of the events, ordered by their creation date
+    :return: True if the issue was closed and resolved as fixed at some point, False otherwise
+    """
     current_status = None
     current_resolution = None
-    for e in IssueEvent.objects(issue_id=issue.id).order_by("created_at"):
-        if e.status is not None and e.status.lower() == "status" and e.new_value is not None:
-            current_status = e.new_value.lower()
-        if e.status is not None and e.status.lower() == "resolution" and e.new_value is not None:
-            current_resolution = e.new_value.lower()
+    for status, new_value in events:
+        if status is not None and status.lower() == "status" and new_value is not None:
+            current_status = new_value.lower()
+        if status is not None and status.lower() == "resolution" and new_value is not None:
+            current_resolution = new_value.lower()
         if current_status in _CLOSED_STATUS and current_resolution in _RESOLVED_TYPES:
             return True
     return False
@@ -183,14 +473,21 @@ def git_tag_filter(project_name, discard_patch=False, correct_broken_tags=True,
     we determined for the tag, 'original' with the name of the tag, 'revision' with the revision hash of the commit that
     is tagged, 'corrected_revision' if a broken tag was found, and 'qualifiers' if there are any.
     """
+    from dateutil.relativedelta import relativedelta
+
     initial_versions = []
-    project_id = Project.objects(name=project_name).get().id
-    vcs_system_id = VCSSystem.objects(project_id=project_id).get().id
+    project_id = get_reference_cache(Project, "name").get(project_name).id
+    vcs_system_id = get_reference_cache(VCSSystem, "project_id").get(project_id).id
+    commits = get_reference_cache(Commit, only=Commit.get_projection_preset("dates")[0])
+    # revision hashes are only unique within a vcs system, e.g., forks share the commits of their history
+    commits_by_hash = get_reference_cache(
+        Commit, "revision_hash", only=Commit.get_projection_preset("dates")[0], vcs_system_ids=vcs_system_id
+    )
     if correct_broken_tags:
         tag_dates = {}
         tag_commits = set()
         for tag in Tag.objects(vcs_system_id=vcs_system_id):
-            tag_commits.add(Commit.objects(id=tag.commit_id).only("committer_date").get())
+            tag_commits.add(commits.get(tag.commit_id))
         for tag_commit in tag_commits:
             if tag_commit.committer_date in tag_dates:
                 tag_dates[tag_commit.committer_date] += 1
@@ -203,11 +500,9 @@ def git_tag_filter(project_name, discard_patch=False, correct_broken_tags=True,
         corrected_commit = None
         if correct_broken_tags:
             if tag.name in _MANUAL_CORRECTIONS:
-                corrected_commit = (
-                    Commit.objects(revision_hash=_MANUAL_CORRECTIONS[tag.name]).only("revision_hash").get()
-                )
+                corrected_commit = commits_by_hash.get(_MANUAL_CORRECTIONS[tag.name])
             else:
-                tag_commit = Commit.objects(id=tag.commit_id).only("committer_date", "parents").get()
+                tag_commit = commits.get(tag.commit_id)
                 if tag_dates[tag_commit.committer_date] > 1:
                     tolerated_date = tag_commit.committer_date - relativedelta(minutes=date_tolerance)
                     # simple breadth first search for correct commit
@@ -216,12 +511,11 @@ def git_tag_filter(project_name, discard_patch=False, correct_broken_tags=True,
                     parents[0] = set(tag_commit.parents)
                     while corrected_commit is None and steps < max_steps:
                         if steps in parents:
+                            parent_commits = commits_by_hash.get_many(parents[steps])
                             for parent in parents[steps]:
-                                parent_commit = (
-                                    Commit.objects(revision_hash=parent)
-                                    .only("committer_date", "parents", "revision_hash")
-                                    .get()
-                                )
+                                parent_commit = parent_commits.get(parent)
+                                if parent_commit is None:
+                                    raise Commit.DoesNotExist("parent commit %s does not exist" % parent)
                                 if parent_commit.committer_date < tolerated_date:
                                     corrected_commit = parent_commit
                                 else:
@@ -234,45 +528,67 @@ def git_tag_filter(project_name, discard_patch=False, correct_broken_tags=True,
                     if corrected_commit is None:
                         continue
 
-        filtered_name = re.sub(project_name.lower(), "", tag.name.lower())
-
-        if re.search(_GIT_TAG_QUALIFIERS, filtered_name, re.MULTILINE | re.IGNORECASE):
-            continue
-
-        # we only want numbers and separators
-        version = re.sub("[a-z]", "", filtered_name)
-        # the best separator is the one separating the most numbers
-        best = -1
-        best_sep = None
-        for sep in _TAG_VERSION_SEPARATORS:
-            current = 0
-            for v in version.split(sep):
-                v = "".join(c for c in v if c.isdigit())
-                if v.isnumeric():
-                    current += 1
-            if current > best:
-                best = current
-                best_sep = sep
-        version = version.split(best_sep)
-        final_version = []
-        for v in version:
-            v = "".join(c for c in v if c.isdigit())
-            if v.isnumeric():
-                final_version.append(int(v))
+        final_version = _tag_version(project_name, tag.name)
 
         # if we have a version we append it to our list
         if final_version:
-            # force SemVer by potentially adding minor and patch version if only major is present
-            if len(final_version) == 1:
-                final_version.append(0)
-            if len(final_version) == 2:
-                final_version.append(0)
-            commit = Commit.objects(id=tag.commit_id).only("revision_hash").get()
+            commit = commits.get(tag.commit_id)
             fversion = {"version": final_version, "original": tag.name, "revision": commit.revision_hash}
             if corrected_commit is not None:
                 fversion["corrected_revision"] = corrected_commit.revision_hash
             initial_versions.append(fversion)
 
+    return _sort_and_unique_versions(initial_versions, discard_patch)
+
+
+def _tag_version(project_name, tag_name):
+    """
+    Determines the SemVer version of a tag.
+    :param project_name: name of the project
+    :param tag_name: name of the tag
+    :return: list with major, minor, and patch version or None if the tag is not a release
+    """
+    filtered_name = re.sub(project_name.lower(), "", tag_name.lower())
+
+    if re.search(_GIT_TAG_QUALIFIERS, filtered_name, re.MULTILINE | re.IGNORECASE):
+        return None
+
+    # we only want numbers and separators
+    version = re.sub("[a-z]", "", filtered_name)
+    # the best separator is the one separating the most numbers
+    best = -1
+    best_sep = None
+    for sep in _TAG_VERSION_SEPARATORS:
+        current = 0
+        for v in version.split(sep):
+            v = "".join(c for c in v if c.isdigit())
+            if v.isnumeric():
+                current += 1
+        if current > best:
+            best = current
+            best_sep = sep
+    version = version.split(best_sep)
+    final_version = []
+    for v in version:
+        v = "".join(c for c in v if c.isdigit())
+        if v.isnumeric():
+            final_version.append(int(v))
+
+    if not final_version:
+        return None
+
+    # force SemVer by potentially adding minor and patch version if only major is present
+    if len(final_version) == 1:
+        final_version.append(0)
+    if len(final_version) == 2:
+        final_version.append(0)
+    return final_version
+
+
+def _sort_and_unique_versions(initial_versions, discard_patch):
+    """
+    Sorts the versions determined by git_tag_filter and removes duplicates.
+    """
     # sort versions using version numbers based on the SemVer scheme
     sorted_versions = sorted(initial_versions, key=lambda x: (x["version"][0], x["version"][1], x["version"][2]))
 
@@ -319,18 +635,19 @@ def get_commit_graph(vcs_system_id, silent=True):
     :param vcs_system_id id of the vcs system for which the graph is created
     :param silent determines whether there is an output to stdout in case of a missing parent commit
     """
+    import networkx as nx
+
     g = nx.DiGraph()
     # first we add all nodes to the graph
-    for c in Commit.objects(vcs_system_id=vcs_system_id).only("id", "revision_hash").timeout(False):
+    for c in _apply_batch_size(Commit.objects(vcs_system_ids=vcs_system_id).only("id", "revision_hash").timeout(False)):
         g.add_node(c.revision_hash)
 
-    # after that we draw all edges
-    for c in Commit.objects(vcs_system_id=vcs_system_id).only("id", "parents", "revision_hash").timeout(False):
+    # after that we draw all edges, all commits of the vcs system are already nodes of the graph
+    for c in _apply_batch_size(Commit.objects(vcs_system_ids=vcs_system_id).graph().timeout(False)):
         for p in c.parents:
-            try:
-                p1 = Commit.objects(vcs_system_id=vcs_system_id, revision_hash=p).only("id", "revision_hash").get()
-                g.add_edge(p1.revision_hash, c.revision_hash)
-            except Commit.DoesNotExist:
+            if p in g:
+                g.add_edge(p, c.revision_hash)
+            else:
                 if not silent:
                     print("parent of a commit is missing (commit id: {} - revision_hash: {})".format(c.id, p))
     return g
@@ -348,15 +665,32 @@ def heuristic_renames(vcs_system_id, revision_hash):
     the old name and the second element is the new name. The added files are a list.
     """
     renames = {}
-    commit = Commit.objects(vcs_system_id=vcs_system_id, revision_hash=revision_hash).only("id").get()
-    for fa in FileAction.objects(commit_id=commit.id, mode="R"):
-        new_file = File.objects.get(id=fa.file_id)
-        old_file = File.objects.get(id=fa.old_file_id)
+    commit = Commit.objects(vcs_system_ids=vcs_system_id, revision_hash=revision_hash).only("id").get()
+    file_actions = list(FileAction.objects(commit_id=commit.id, mode="R").only("file_id", "old_file_id"))
+    files = get_reference_cache(File).get_many(
+        [fa.file_id for fa in file_actions] + [fa.old_file_id for fa in file_actions]
+    )
+    for fa in file_actions:
+        if fa.file_id not in files or fa.old_file_id not in files:
+            raise File.DoesNotExist("file of file action %s does not exist" % fa.id)
+        new_file = files[fa.file_id]
+        old_file = files[fa.old_file_id]
 
         if old_file.path not in renames.keys():
             renames[old_file.path] = []
         renames[old_file.path].append(new_file.path)
 
+    return _select_renames(renames)
+
+
+def _select_renames(renames):
+    """
+    Selects the most probable rename for each old file.
+    :param renames: dict with the old paths as keys and lists of candidate new paths as values
+    :return: Tuple of renames and added files, see heuristic_renames
+    """
+    from textdistance import levenshtein
+
     true_renames = []
     added_files = []
     for old_file, new_files in renames.items():
@@ -425,8 +759,9 @@ def copy_projects(
     :param target_authentication_db: authentication db of the target database. Default: None
     :param target_ssl: whether SSL is used for the connection to the target database. Default: None
     """
+    import gridfs
 
-    project_ref_collections = ["vcs_system", "issue_system", "mailing_list", "pull_request_system"]
+    project_ref_collections = ["vcs_system", "issue_system", "mailing_list", "mailing_system", "pull_request_system"]
     vcs_ref_collections = ["branch", "tag", "file", "commit", "travis_build"]
     commit_ref_collections = [
         "clone_instance",
@@ -438,7 +773,7 @@ def copy_projects(
     ]
     file_action_ref_collections = ["hunk"]
     its_ref_collections = ["issue"]
-    issue_ref_collections = ["issue_comment", "event"]
+    issue_ref_collections = ["issue_comment", "event", "issue_event"]
     ml_ref_collections = ["message"]
     travis_ref_collections = ["travis_job"]
     prsystem_ref_collections = ["pull_request"]
@@ -474,7 +809,7 @@ def copy_projects(
         source_user, source_password, source_hostname, source_port, source_authentication_db, source_ssl
     )
     print(source_uri)
-    client_source = MongoClient(source_uri)
+    client_source = get_mongo_client(source_uri)
     source_db = client_source[source_dbname]
     print("found the following collections in source db: %s" % source_db.list_collection_names())
 
@@ -483,7 +818,7 @@ def copy_projects(
         target_user, target_password, target_hostname, target_port, target_authentication_db, target_ssl
     )
 
-    client_target = MongoClient(target_uri)
+    client_target = get_mongo_client(target_uri)
     target_db = client_target[target_dbname]
     print("found the following collections in target db: %s" % target_db.list_collection_names())
 
@@ -491,8 +826,9 @@ def copy_projects(
     for collection in collections:
         for name, index_info in source_db[collection].index_information().items():
             keys = index_info["key"]
-            del index_info["ns"]
-            del index_info["v"]
+            # ns is only reported by MongoDB before 4.4
+            index_info.pop("ns", None)
+            index_info.pop("v", None)
             del index_info["key"]
             target_db[collection].create_index(keys, name=name, **index_info)
 
@@ -545,7 +881,7 @@ def copy_projects(
                         if cur_col != "commit":
                             _copy_data(
                                 collection=cur_col,
-                                condition={"vcs_system_id": vcs_system["_id"]},
+                                condition=_system_condition(vcs_system["_id"], "vcs_system_id"),
                                 source_db=source_db,
                                 target_db=target_db,
                             )
@@ -553,7 +889,9 @@ def copy_projects(
                             commits = [
                                 commit["_id"]
                                 for commit in source_db.commit.find(
-                                    {"vcs_system_id": vcs_system["_id"]}, {"_id": 1}, no_cursor_timeout=True
+                                    _system_condition(vcs_system["_id"], "vcs_system_id"),
+                                    {"_id": 1},
+                                    no_cursor_timeout=True,
                                 )
                             ]
                             print("copying data for collection commit")
@@ -575,7 +913,7 @@ def copy_projects(
                     travis_builds = [
                         travis_build["_id"]
                         for travis_build in source_db.travis_build.find(
-                            {"vcs_system_id": vcs_system["_id"]}, {"_id": 1}
+                            _system_condition(vcs_system["_id"], "vcs_system_id"), {"_id": 1}
                         )
                     ]
                     for i in range(0, math.ceil(len(travis_builds) / 50)):
@@ -596,7 +934,7 @@ def copy_projects(
                     commits = [
                         commit["_id"]
                         for commit in source_db.commit.find(
-                            {"vcs_system_id": vcs_system["_id"]}, {"_id": 1}, no_cursor_timeout=True
+                            _system_condition(vcs_system["_id"], "vcs_system_id"), {"_id": 1}, no_cursor_timeout=True
                         )
                     ]
                     print("start copying data that references commit (%i commits total)" % len(commits))
@@ -650,7 +988,7 @@ def copy_projects(
                     if cur_col in collections:
                         _copy_data(
                             collection=cur_col,
-                            condition={"issue_system_id": issue_system["_id"]},
+                            condition=_system_condition(issue_system["_id"], "issue_system_id"),
                             source_db=source_db,
                             target_db=target_db,
                         )
@@ -658,7 +996,9 @@ def copy_projects(
                 if not collections.isdisjoint(set(issue_ref_collections)):
                     issues = [
                         issue["_id"]
-                        for issue in source_db.issue.find({"issue_system_id": issue_system["_id"]}, {"_id": 1})
+                        for issue in source_db.issue.find(
+                            _system_condition(issue_system["_id"], "issue_system_id"), {"_id": 1}
+                        )
                     ]
                     for cur_col in issue_ref_collections:
                         if cur_col in collections:
@@ -672,12 +1012,12 @@ def copy_projects(
 
         if not collections.isdisjoint(set(ml_ref_collections)):
             print("copying data that references mailing_list")
-            for mailing_list in source_db.mailing_list.find({"project_id": project["_id"]}):
+            for mailing_list in _find_mailing_systems(source_db, project["_id"]):
                 for cur_col in ml_ref_collections:
                     if cur_col in collections:
                         _copy_data(
                             collection=cur_col,
-                            condition={"mailing_list_id": mailing_list["_id"]},
+                            condition=_system_condition(mailing_list["_id"], "mailing_list_id", "mailing_system_ids"),
                             source_db=source_db,
                             target_db=target_db,
                         )
@@ -693,7 +1033,7 @@ def copy_projects(
                     if cur_col in collections:
                         _copy_data(
                             collection=cur_col,
-                            condition={"pull_request_system_id": pull_request_system["_id"]},
+                            condition=_system_condition(pull_request_system["_id"], "pull_request_system_id"),
                             source_db=source_db,
                             target_db=target_db,
                         )
@@ -702,7 +1042,7 @@ def copy_projects(
                     pull_requests = [
                         pull_request["_id"]
                         for pull_request in source_db.pull_request.find(
-                            {"pull_request_system_id": pull_request_system["_id"]}, {"_id": 1}
+                            _system_condition(pull_request_system["_id"], "pull_request_system_id"), {"_id": 1}
                         )
                     ]
                     for cur_col in pr_ref_collections:
@@ -733,6 +1073,39 @@ def copy_projects(
                                 )
 
 
+def _system_condition(system_id, legacy_field, list_field=None, exclusive=False):
+    """
+    Helper function for the condition of the data of a system. Older databases reference the system with a single id,
+    e.g., vcs_system_id, the current models with a list of ids, e.g., vcs_system_ids. Both are matched.
+
+    :param system_id: id of the system
+    :param legacy_field: name of the field with the single id
+    :param list_field: name of the field with the list of ids. Default: None (legacy_field with the suffix s)
+    :param exclusive: if True, only documents that do not belong to other systems are matched. Default: False
+    """
+    list_field = list_field or legacy_field + "s"
+    return {"$or": [{legacy_field: system_id}, {list_field: [system_id] if exclusive else system_id}]}
+
+
+def _delete_system_data(db, collection, system_id, legacy_field, list_field=None):
+    """
+    Helper function for deleting the data of a system. Documents that also belong to other systems, e.g., commits that
+    are shared between forks, are kept and only the id of the system is removed from their list of ids.
+    """
+    list_field = list_field or legacy_field + "s"
+    db[collection].delete_many(_system_condition(system_id, legacy_field, list_field, exclusive=True))
+    db[collection].update_many({list_field: system_id}, {"$pull": {list_field: system_id}})
+
+
+def _find_mailing_systems(db, project_id):
+    """
+    Helper function for finding the mailing systems of a project, which are stored in the collection mailing_list in
+    older databases and in the collection mailing_system by the current models.
+    """
+    for collection in ("mailing_list", "mailing_system"):
+        yield from db[collection].find({"project_id": project_id})
+
+
 def _copy_data(collection, condition, source_db, target_db, verbose=True):
     """
     Helper function for copying data between databases.  Copies all data of the that matches the condition between the
@@ -741,7 +1114,7 @@ def _copy_data(collection, condition, source_db, target_db, verbose=True):
     if verbose:
         print("copying data for collection %s" % collection)
     if source_db[collection].count_documents(condition) > 0:
-        data = source_db[collection].find(condition, no_cursor_timeout=True)
+        data = _apply_batch_size(source_db[collection].find(condition, no_cursor_timeout=True))
         try:
             target_db[collection].insert_many(data, ordered=False)
         except BulkWriteError:
@@ -771,8 +1144,9 @@ def delete_projects(
     :param db_authentication_db: authentication db of the source database. Default: None
     :param db_ssl:  whether SSL is used for the connection to the source database. Default: None
     """
+    import gridfs
 
-    project_ref_collections = ["vcs_system", "issue_system", "mailing_list", "pull_request_system"]
+    project_ref_collections = ["vcs_system", "issue_system", "mailing_list", "mailing_system", "pull_request_system"]
     vcs_ref_collections = ["branch", "tag", "file", "commit", "travis_build"]
     commit_ref_collections = [
         "clone_instance",
@@ -784,7 +1158,7 @@ def delete_projects(
     ]
     file_action_ref_collections = ["hunk"]
     its_ref_collections = ["issue"]
-    issue_ref_collections = ["issue_comment", "event"]
+    issue_ref_collections = ["issue_comment", "event", "issue_event"]
     ml_ref_collections = ["message"]
     travis_ref_collections = ["travis_job"]
     prsystem_ref_collections = ["pull_request"]
@@ -801,7 +1175,7 @@ def delete_projects(
     print("connecting to database")
     db_uri = create_mongodb_uri_string(db_user, db_password, db_hostname, db_port, db_authentication_db, db_ssl)
     print(db_uri)
-    db_client = MongoClient(db_uri)
+    db_client = get_mongo_client(db_uri)
     db = db_client[db_name]
 
     for project_name in projects:
@@ -818,7 +1192,9 @@ def delete_projects(
                         if cur_vcsref_col == "commit":
                             commits = [
                                 commit["_id"]
-                                for commit in db.commit.find({"vcs_system_id": vcs_system["_id"]}, {"_id": 1})
+                                for commit in db.commit.find(
+                                    _system_condition(vcs_system["_id"], "vcs_system_id", exclusive=True), {"_id": 1}
+                                )
                             ]
                             print("start copying data that references commit (%i commits total)" % len(commits))
 
@@ -849,7 +1225,7 @@ def delete_projects(
                                 db[cur_travisref_col].delete_many({"vcs_system_id": vcs_system["_id"]})
 
                         print("deleting %s" % cur_vcsref_col)
-                        db[cur_vcsref_col].delete_many({"vcs_system_id": vcs_system["_id"]})
+                        _delete_system_data(db, cur_vcsref_col, vcs_system["_id"], "vcs_system_id")
 
             if cur_proref_col == "issue_system":
                 for issue_system in db.issue_system.find({"project_id": project["_id"]}):
@@ -857,19 +1233,24 @@ def delete_projects(
                         if cur_itsref_col == "issue":
                             issues = [
                                 issue["_id"]
-                                for issue in db.issue.find({"issue_system_id": issue_system["_id"]}, {"_id": 1})
+                                for issue in db.issue.find(
+                                    _system_condition(issue_system["_id"], "issue_system_id", exclusive=True),
+                                    {"_id": 1},
+                                )
                             ]
                             for cur_issueref_col in issue_ref_collections:
                                 print("deleting %s" % cur_issueref_col)
                                 db[cur_issueref_col].delete_many({"issue_id": {"$in": issues}})
                         print("deleting %s" % cur_itsref_col)
-                        db[cur_itsref_col].delete_many({"issue_system_id": issue_system["_id"]})
+                        _delete_system_data(db, cur_itsref_col, issue_system["_id"], "issue_system_id")
 
-            if cur_proref_col == "mailing_list":
-                for mailing_list in db.mailing_list.find({"project_id": project["_id"]}):
+            if cur_proref_col in ("mailing_list", "mailing_system"):
+                for mailing_list in db[cur_proref_col].find({"project_id": project["_id"]}):
                     for cur_mlref_col in ml_ref_collections:
                         print("deleting %s" % cur_mlref_col)
-                        db[cur_mlref_col].delete_many({"mailing_list_id": mailing_list["_id"]})
+                        _delete_system_data(
+                            db, cur_mlref_col, mailing_list["_id"], "mailing_list_id", "mailing_system_ids"
+                        )
 
             if cur_proref_col == "pull_request_system":
                 for pull_request_system in db.pull_request_system.find(
@@ -881,7 +1262,10 @@ def delete_projects(
                             pull_requests = [
                                 pull_request["_id"]
                                 for pull_request in db.pull_request.find(
-                                    {"pull_request_system_id": pull_request_system["_id"]}, {"_id": 1}
+                                    _system_condition(
+                                        pull_request_system["_id"], "pull_request_system_id", exclusive=True
+                                    ),
+                                    {"_id": 1},
                                 )
                             ]
                             for cur_prref_col in pr_ref_collections:
@@ -900,7 +1284,7 @@ def delete_projects(
                                 print("deleting %s" % cur_prref_col)
                                 db[cur_prref_col].delete_many({"pull_request_id": {"$in": pull_requests}})
                         print("deleting %s" % cur_prsysref_col)
-                        db[cur_prsysref_col].delete_many({"pull_request_system_id": pull_request_system["_id"]})
+                        _delete_system_data(db, cur_prsysref_col, pull_request_system["_id"], "pull_request_system_id")
 
             print("deleting %s" % cur_proref_col)
             db[cur_proref_col].delete_many({"project_id": project["_id"]})
@@ -934,7 +1318,7 @@ def delete_last_system_data_on_failure(
 
     uri = create_mongodb_uri_string(db_user, db_password, db_hostname, db_port, db_authentication_db, db_ssl)
 
-    db_client = MongoClient(uri)
+    db_client = get_mongo_client(uri)
     db = db_client[db_name]
 
     last_system_id = get_last_system_id(system, url, db)
@@ -1010,3 +1394,62 @@ def get_last_system_id(system, url, db=None):
     else:
         last_system_id = None
     return last_system_id
+
+
+def compress_legacy_strings(document_class, field_names=None, batch_size=1000, workers=4):
+    """
+    Rewrites the values of :class:`~pycoshark.fields.CompressedStringField` fields that are still stored as plain
+    strings, e.g., because they were written before the field was compressed. The documents are read in batches and the
+    batches are compressed and written in parallel. The migration can be interrupted and restarted at any time.
+
+    :param document_class: document class, e.g., :class:`~pycoshark.mongomodels.Hunk`
+    :param field_names: names of the fields that are migrated. Default: None (all compressed fields)
+    :param batch_size: number of documents per batch. Default: 1000
+    :param workers: number of threads that compress and write batches. Default: 4
+    :return: number of updated documents
+    """
+    fields = [
+        field
+        for name, field in document_class._fields.items()
+        if isinstance(field, CompressedStringField) and (field_names is None or name in field_names)
+    ]
+    if not fields:
+        raise ValueError("%s has no compressed fields to migrate" % document_class.__name__)
+    collection = document_class._get_collection()
+
+    def migrate_batch(documents):
+        requests = []
+        for document in documents:
+            update = {}
+            for field in fields:
+                value = document.get(field.db_field)
+                if isinstance(value, str):
+                    compressed = field.to_mongo(value)
+                    if not isinstance(compressed, str):
+                        update[field.db_field] = compressed
+            if update:
+                requests.append(UpdateOne({"_id": document["_id"]}, {"$set": update}))
+        if requests:
+            collection.bulk_write(requests, ordered=False)
+        return len(requests)
+
+    updated = 0
+    condition = {"$or": [{field.db_field: {"$type": "string"}} for field in fields]}
+    projection = {field.db_field: 1 for field in fields}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        batch = []
+        for document in _apply_batch_size(collection.find(condition, projection)):
+            batch.append(document)
+            if len(batch) == batch_size:
+                pending.append(executor.submit(contextvars.copy_context().run, migrate_batch, batch))
+                batch = []
+            # limit the number of batches in memory
+            while len(pending) > 2 * workers:
+                updated += pending.popleft().result()
+        if batch:
+            pending.append(executor.submit(contextvars.copy_context().run, migrate_batch, batch))
+        while pending:
+            updated += pending.popleft().result()
+    print("compressed %i documents of collection %s" % (updated, collection.name))
+    return updated
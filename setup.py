@@ -11,6 +11,8 @@ setup(
     version=pycoshark.__version__,
     description="Basic MongoDB Models for smartSHARK.",
     install_requires=["mongoengine>=0.23.1", "pymongo==3.12.2", "python-dateutil", "textdistance", "networkx"],
+    extras_require={"async": ["motor"], "zstd": ["zstandard"], "numpy": ["numpy"]},
+    entry_points={"console_scripts": ["pycoshark-indexes=pycoshark.indexes:main"]},
     author="ftrautsch",
     author_email="fabian.trautsch@uni-goettingen.de",
     url="https://github.com/smartshark/pycoSHARK",